@@ -3,6 +3,7 @@ import jwt
 import datetime
 import sys
 import json
+import time
 from flask import Flask, request, jsonify, Response
 
 try:
@@ -10,6 +11,8 @@ try:
 except Exception:
     tabulate = None
 
+SNAPSHOT_TIMEOUT = 600  # segundos por servicio: el backup de una base grande tarda
+
 class AdminClient:
     def __init__(self):
         self.base_url = 'http://localhost:5000'
@@ -36,8 +39,8 @@ class AdminClient:
             )
     
     
-    def get_logs(self):
-        return requests.get(f'{self.base_url}/admin/logs')
+    def get_logs(self, params=None):
+        return requests.get(f'{self.base_url}/admin/logs', params=params)
     
     def manage_inventory(self, action, data=None):
         headers = {
@@ -62,27 +65,74 @@ class AdminClient:
         
         return None
 
-    def manage_orders(self, action, data=None):
+    def manage_orders(self, action, data=None, params=None):
         headers = {'Authorization': f'Bearer {self.tokens["order"]}'}
         url = f'http://localhost:5002/orders'
         
         if action == 'GET':
-            return requests.get(url, headers=headers)
+            return requests.get(url, headers=headers, params=params)
         elif action == 'PUT':
             return requests.put(url, json=data, headers=headers)
         elif action == 'DELETE':
             return requests.delete(f"{url}?id={data['id']}", headers=headers)
         return None
     
-    def manage_payments(self, action, data=None):
+    def get_order_stats(self, params=None):
+        headers = {'Authorization': f'Bearer {self.tokens["order"]}'}
+        return requests.get('http://localhost:5002/orders/stats', headers=headers, params=params, timeout=10)
+    
+    def manage_payments(self, action, data=None, params=None):
         headers = {'Authorization': f'Bearer {self.tokens["payment"]}'}
         url = f'http://localhost:5003/payments'
         
         if action == 'GET':
-            return requests.get(url, headers=headers)
+            return requests.get(url, headers=headers, params=params)
         elif action == 'DELETE':
             return requests.delete(f"{url}?id={data['id']}", headers=headers)
         return None
+
+    def snapshots(self, action):
+        """POST: snapshot every database, one service after the other; GET: list what is on disk"""
+        started = time.perf_counter()
+        results = {}
+        try:
+            resp = requests.request(action, f'{self.base_url}/admin/snapshot', timeout=SNAPSHOT_TIMEOUT)
+            results['gateway'] = resp.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            results['gateway'] = {'status': 'error', 'message': f'Connection failed: {str(e)}'}
+        # En modo monolito el gateway ya copió las bases de los servicios montados
+        if results['gateway'].get('mode') != 'monolith':
+            for service_name, port in [('inventory', 5001), ('order', 5002), ('payment', 5003)]:
+                headers = {'Authorization': f'Bearer {self.tokens[service_name]}'}
+                try:
+                    resp = requests.request(action, f'http://localhost:{port}/snapshot', headers=headers,
+                                            timeout=SNAPSHOT_TIMEOUT)
+                    results[service_name] = resp.json()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    results[service_name] = {'status': 'error', 'message': f'Connection failed: {str(e)}'}
+        if action == 'GET':
+            return results
+
+        snapshots = [s for result in results.values() for s in result.get('snapshots', [])]
+        failed = [name for name, result in results.items() if result.get('status') != 'ok']
+        return {
+            'status': 'ok' if not failed else 'partial' if snapshots else 'error',
+            'failed': failed,
+            'duration_seconds': round(time.perf_counter() - started, 3),
+            'bytes': sum(s['bytes'] for s in snapshots),
+            'compressed_bytes': sum(s['compressed_bytes'] for s in snapshots),
+            'services': results
+        }
+
+    def get_db_pool_stats(self):
+        stats = {}
+        for service_name, port in [('inventory', 5001), ('order', 5002), ('payment', 5003)]:
+            headers = {'Authorization': f'Bearer {self.tokens[service_name]}'}
+            try:
+                stats[service_name] = requests.get(f'http://localhost:{port}/db_pool', headers=headers, timeout=10).json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                stats[service_name] = {'error': f'Connection failed: {str(e)}'}
+        return stats
     
 
 if __name__ == '__main__':
@@ -95,23 +145,30 @@ if __name__ == '__main__':
         return jsonify({
             'message': 'Admin proxy running',
             'endpoints': {
-                'GET /logs': 'Proxy to gateway /admin/logs',
+                'GET /logs': 'Proxy to gateway /admin/logs (status, endpoint, client_ip, since, until, limit, cursor)',
                 'GET /inventory': 'GET products',
                 'POST /inventory': 'Create product',
                 'PUT /inventory': 'Update product (JSON body)',
                 'DELETE /inventory/<id>': 'Delete product',
-                'GET /orders': 'List orders',
+                'GET /orders': 'List orders (customer_email, status, product_id, since, until, limit, cursor)',
                 'PUT /orders': 'Update order status',
                 'DELETE /orders/<id>': 'Delete order',
-                'GET /payments': 'List payments',
-                'DELETE /payments/<id>': 'Delete payment'
+                'GET /orders/stats': 'Sales rollups (granularity=hour|day|all, product_id, status, since, until, limit)',
+                'GET /payments': 'List payments (order_id, since, until, limit, cursor)',
+                'DELETE /payments/<id>': 'Delete payment',
+                'GET /db_pools': 'SQLite connection pool stats of each service',
+                'POST /snapshots': 'Online snapshot (gzip + sha256) of every service database',
+                'GET /snapshots': 'Snapshots on disk per service'
             }
         })
 
     @app.route('/logs', methods=['GET'])
     def logs():
-        resp = admin.get_logs()
-        return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+        resp = admin.get_logs(params=request.args)
+        proxied = Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+        if 'X-Next-Cursor' in resp.headers:
+            proxied.headers['X-Next-Cursor'] = resp.headers['X-Next-Cursor']
+        return proxied
 
     # Inventory
     @app.route('/inventory', methods=['GET', 'POST', 'PUT'])
@@ -137,8 +194,11 @@ if __name__ == '__main__':
     @app.route('/orders', methods=['GET', 'PUT'])
     def orders():
         if request.method == 'GET':
-            resp = admin.manage_orders('GET')
-            return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+            resp = admin.manage_orders('GET', params=request.args)
+            proxied = Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+            if 'X-Next-Cursor' in resp.headers:
+                proxied.headers['X-Next-Cursor'] = resp.headers['X-Next-Cursor']
+            return proxied
         elif request.method == 'PUT':
             data = request.json
             resp = admin.manage_orders('PUT', data=data)
@@ -149,17 +209,36 @@ if __name__ == '__main__':
         resp = admin.manage_orders('DELETE', data={'id': order_id})
         return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
 
+    @app.route('/orders/stats', methods=['GET'])
+    def order_stats():
+        resp = admin.get_order_stats(params=request.args)
+        return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+
     # Payments
     @app.route('/payments', methods=['GET'])
     def payments():
-        resp = admin.manage_payments('GET')
-        return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+        resp = admin.manage_payments('GET', params=request.args)
+        proxied = Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
+        if 'X-Next-Cursor' in resp.headers:
+            proxied.headers['X-Next-Cursor'] = resp.headers['X-Next-Cursor']
+        return proxied
 
     @app.route('/payments/<int:payment_id>', methods=['DELETE'])
     def payments_delete(payment_id):
         resp = admin.manage_payments('DELETE', data={'id': payment_id})
         return Response(resp.content, status=resp.status_code, content_type=resp.headers.get('Content-Type', 'application/json'))
 
+    @app.route('/db_pools', methods=['GET'])
+    def db_pools():
+        return jsonify(admin.get_db_pool_stats())
+
+    @app.route('/snapshots', methods=['GET', 'POST'])
+    def snapshots():
+        result = admin.snapshots(request.method)
+        if request.method == 'GET':
+            return jsonify(result)
+        return jsonify(result), 200 if result['status'] == 'ok' else 502
+
     print('Starting Admin proxy on http://127.0.0.1:5010')
     app.run(host='127.0.0.1', port=5010, debug=False)
 
@@ -1,6 +1,9 @@
+import uuid
+
 import requests
 
 GATEWAY_URL = 'http://localhost:5000'
+MAX_REINTENTOS = 2
 
 PRODUCTS = {
     1: ('Laptop', 999.99),
@@ -38,6 +41,18 @@ def mostrar_productos():
         print(f"  {pid}) {name} - ${price}")
 
 
+def enviar_orden(order_data):
+    # La misma Idempotency-Key en cada reintento: el gateway no duplica la orden
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    for intento in range(MAX_REINTENTOS + 1):
+        try:
+            return requests.post(f'{GATEWAY_URL}/process_order', json=order_data, headers=headers, timeout=30)
+        except requests.exceptions.Timeout:
+            if intento == MAX_REINTENTOS:
+                raise
+            print('Tiempo de espera agotado, reintentando...')
+
+
 def realizar_orden():
     print('\n🛒 Realizar nueva orden')
     mostrar_productos()
@@ -61,7 +76,7 @@ def realizar_orden():
 
     print('\nEnviando orden al gateway...')
     try:
-        response = requests.post(f'{GATEWAY_URL}/process_order', json=order_data, timeout=30)
+        response = enviar_orden(order_data)
         try:
             result = response.json()
         except Exception:
@@ -0,0 +1,128 @@
+"""
+Group commit: un hilo escritor confirma juntos los inserts concurrentes de order y payment
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitter:
+    """Runs concurrent writes from request threads in shared transactions.
+
+    ``submit(write)`` queues ``write(cursor)`` and blocks until the
+    transaction that ran it has committed. It then returns what ``write``
+    returned (typically ``lastrowid``) or raises what it raised. Callers
+    hear back only after COMMIT, exactly as with their own commit, so
+    durability is unchanged: the connection keeps the pool's ``synchronous``
+    setting.
+
+    One writer thread takes everything queued, up to ``max_batch``
+    writes. If the previous batch had more than one write, it waits up to
+    ``max_delay`` seconds for more; a lone client never waits. The batch
+    runs under one BEGIN IMMEDIATE, so N requests take the write lock and
+    commit once instead of N times, and they never spin in SQLite's busy
+    handler against each other. Each write runs in its own SAVEPOINT, so a
+    write that raises rolls back only its own changes.
+    """
+
+    def __init__(self, pool, max_batch=128, max_delay=0.002, name='group-commit'):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_batch = 0
+
+        self.batches = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.failed_batches = 0
+        self.largest_batch = 0
+
+    def submit(self, write):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((write, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay if self._last_batch > 1 else None
+        while len(batch) < self.max_batch:
+            try:
+                if deadline is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._last_batch = len(batch)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        results = []
+        conn = None
+        try:
+            conn = self.pool.connect(isolation_level=None)
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            for write, future in batch:
+                c.execute('SAVEPOINT write')
+                try:
+                    results.append((future, write(c), None))
+                except Exception as e:
+                    c.execute('ROLLBACK TO write')
+                    results.append((future, None, e))
+                c.execute('RELEASE write')
+            c.execute('COMMIT')
+        except Exception as e:
+            # Sin COMMIT no se confirmó nada del lote: todos reciben el error
+            with self._lock:
+                self.failed_batches += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            # Si el COMMIT no llegó a correr, el pool hace el ROLLBACK al recibir la conexión
+            if conn is not None:
+                conn.close()
+
+        failed = 0
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                failed += 1
+                future.set_exception(error)
+        with self._lock:
+            self.batches += 1
+            self.writes += len(batch)
+            self.failed_writes += failed
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_batch': self.max_batch,
+                'max_delay': self.max_delay,
+                'queued': self._queue.qsize(),
+                'batches': self.batches,
+                'writes': self.writes,
+                'failed_writes': self.failed_writes,
+                'failed_batches': self.failed_batches,
+                'largest_batch': self.largest_batch,
+                'average_batch': round(self.writes / self.batches, 2) if self.batches else None,
+            }
@@ -0,0 +1,240 @@
+"""
+Snapshots en caliente de las bases SQLite: backup online por pasos, comprimido y con checksum
+"""
+import datetime
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from flask import jsonify, request
+
+COPY_CHUNK_SIZE = 1024 * 1024  # bytes por lectura al comprimir
+
+
+class SnapshotInProgress(Exception):
+    """Another snapshot of this service is still running."""
+
+
+class _HashingWriter:
+    """File wrapper that hashes what gzip writes, so the checksum costs no second read"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+class SnapshotWriter:
+    """Copies live SQLite databases into ``directory`` as ``<name>-<UTC time>.db.gz``.
+
+    The copy uses SQLite's online backup API, ``pages_per_step`` pages at a
+    time, with a ``step_pause`` between steps. In WAL mode the source
+    connection first opens a read transaction. Every step then copies from
+    that one snapshot, so concurrent commits neither block on the backup nor
+    make it start over; the WAL just cannot be checkpointed past the
+    snapshot until it ends. In rollback-journal mode each step holds the
+    read lock only for itself, and a concurrent commit restarts the copy.
+
+    The copy is gzipped and a ``.sha256`` file is written next to it in
+    ``sha256sum`` format; both appear under their final names only once
+    complete. Only the newest ``keep`` snapshots of each database are kept
+    (``keep=None`` keeps all). One snapshot runs at a time: ``take``
+    raises SnapshotInProgress instead of queueing.
+    """
+
+    def __init__(self, directory='snapshots', pages_per_step=256, step_pause=0.001, compresslevel=6, keep=7):
+        self.directory = directory
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.compresslevel = compresslevel
+        self.keep = keep
+
+        self._running = threading.Lock()
+        self._lock = threading.Lock()
+
+        self.taken = 0
+        self.failed = 0
+        self.last = None
+
+    def take(self, db_paths):
+        """Snapshot each database in turn; returns one report per database"""
+        if not self._running.acquire(blocking=False):
+            raise SnapshotInProgress('A snapshot is already running')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            reports = []
+            for db_path in db_paths:
+                try:
+                    reports.append(self._snapshot(db_path))
+                except (sqlite3.Error, OSError):
+                    with self._lock:
+                        self.failed += 1
+                    raise
+            with self._lock:
+                self.taken += len(reports)
+                self.last = reports
+            return reports
+        finally:
+            self._running.release()
+
+    def _snapshot(self, db_path):
+        started = time.perf_counter()
+        name = os.path.splitext(os.path.basename(db_path))[0]
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        file_name = f"{name}-{created_at.strftime('%Y%m%dT%H%M%S%fZ')}.db.gz"
+        path = os.path.join(self.directory, file_name)
+        copy_path = path[:-len('.gz')] + '.tmp'
+        steps = 0
+
+        def progress(status, remaining, total):
+            nonlocal steps
+            steps += 1
+            # Pausa entre pasos: deja pasar a los escritores (y al disco) durante una copia grande
+            if remaining and self.step_pause:
+                time.sleep(self.step_pause)
+
+        try:
+            source = sqlite3.connect(db_path, isolation_level=None)
+            target = None
+            try:
+                target = sqlite3.connect(copy_path)
+                wal = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+                if wal:
+                    # Transacción de lectura: todos los pasos copian la misma foto de la base
+                    source.execute('BEGIN')
+                    source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone()
+                source.backup(target, pages=self.pages_per_step, progress=progress)
+                if wal:
+                    source.execute('COMMIT')
+                page_size = target.execute('PRAGMA page_size').fetchone()[0]
+                pages = target.execute('PRAGMA page_count').fetchone()[0]
+            finally:
+                source.close()
+                if target is not None:
+                    target.close()
+            backup_seconds = time.perf_counter() - started
+
+            with open(copy_path, 'rb') as copy, open(path + '.tmp', 'wb') as raw:
+                hashing = _HashingWriter(raw)
+                with gzip.GzipFile(filename=f'{name}.db', mode='wb', fileobj=hashing,
+                                   compresslevel=self.compresslevel) as compressed:
+                    while True:
+                        chunk = copy.read(COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        compressed.write(chunk)
+                raw.flush()
+                os.fsync(raw.fileno())
+            checksum = hashing.sha256.hexdigest()
+            # El .db.gz aparece con su nombre final recién cuando el checksum ya está escrito
+            with open(path + '.sha256', 'w') as sidecar:
+                sidecar.write(f'{checksum}  {file_name}\n')
+            os.replace(path + '.tmp', path)
+        finally:
+            for leftover in (copy_path, path + '.tmp'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self._prune(name)
+
+        return {
+            'database': db_path,
+            'file': path,
+            'sha256': checksum,
+            'pages': pages,
+            'bytes': pages * page_size,
+            'compressed_bytes': hashing.bytes,
+            'steps': steps,
+            'backup_seconds': round(backup_seconds, 3),
+            'duration_seconds': round(time.perf_counter() - started, 3),
+            'created_at': created_at.isoformat(),
+        }
+
+    def _files(self, name=None):
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # El nombre lleva la hora UTC: el orden alfabético es el cronológico
+        return sorted(f for f in files if f.endswith('.db.gz')
+                      and (name is None or f.rsplit('-', 1)[0] == name))
+
+    def _prune(self, name):
+        if self.keep is None:
+            return
+        files = self._files(name)
+        for file_name in files[:max(len(files) - self.keep, 0)]:
+            for path in (file_name, file_name + '.sha256'):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, db_paths):
+        """Snapshots of these databases on disk, oldest first, with their size and recorded checksum"""
+        snapshots = []
+        names = {os.path.splitext(os.path.basename(db_path))[0] for db_path in db_paths}
+        for file_name in self._files():
+            if file_name.rsplit('-', 1)[0] not in names:
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                with open(path + '.sha256') as sidecar:
+                    checksum = sidecar.read().split()[0]
+            except (OSError, IndexError):
+                checksum = None
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            snapshots.append({'file': path, 'compressed_bytes': size, 'sha256': checksum})
+        return snapshots
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory': os.path.abspath(self.directory),
+                'pages_per_step': self.pages_per_step,
+                'step_pause': self.step_pause,
+                'keep': self.keep,
+                'running': self._running.locked(),
+                'taken': self.taken,
+                'failed': self.failed,
+                'last': self.last,
+            }
+
+
+def register_snapshot_routes(app, databases, authenticate, writer=None):
+    """Add GET/POST /snapshot to a service and return its SnapshotWriter.
+
+    POST snapshots ``databases()`` without stopping writers; GET lists the
+    snapshots already on disk. Both sit behind the service's ``authenticate``.
+    """
+    writer = writer or SnapshotWriter()
+
+    @app.route('/snapshot', methods=['GET', 'POST'])
+    def manage_snapshots():
+        auth = authenticate()
+        if not auth:
+            return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+        if request.method == 'GET':
+            return jsonify({**writer.stats(), 'snapshots': writer.list(databases())})
+        try:
+            snapshots = writer.take(databases())
+        except SnapshotInProgress as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 409
+        except (sqlite3.Error, OSError) as e:
+            return jsonify({'status': 'error', 'message': f'Snapshot failed: {e}'}), 500
+        return jsonify({'status': 'ok', 'snapshots': snapshots})
+
+    return writer
@@ -0,0 +1,182 @@
+"""
+Pool de conexiones SQLite persistentes compartido por inventory, order y payment
+"""
+import sqlite3
+import threading
+
+from flask import jsonify
+
+
+class PooledConnection:
+    """``sqlite3.Connection`` stand-in whose ``close()`` gives it back to the pool.
+
+    Use it as ``with pool.connect() as conn:``. Leaving the block gives the
+    connection back, and if the block raised, anything not committed is
+    rolled back. This differs from ``sqlite3.Connection``, whose ``with``
+    only commits and keeps the connection open. Do not rely on garbage
+    collection to return a connection: a traceback kept alive (the Werkzeug
+    debugger keeps them) holds the transaction and its write lock open.
+    """
+
+    def __init__(self, pool, conn, isolation_level):
+        self._pool = pool
+        self._conn = conn
+        self._default_isolation = conn.isolation_level
+        self._cursors = []
+        if isolation_level != self._default_isolation:
+            conn.isolation_level = isolation_level
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        cursor = self._conn.cursor()
+        self._cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def _release(self, reclaimed):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        # Un SELECT sin consumir deja el statement abierto y fija un snapshot viejo
+        # que vería el siguiente request que use esta conexión
+        for cursor in self._cursors:
+            cursor.close()
+        self._cursors = []
+        self._pool._checkin(conn, self._default_isolation, reclaimed=reclaimed)
+
+    def close(self):
+        self._release(reclaimed=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # _checkin hace ROLLBACK de lo que quedó sin confirmar
+        self.close()
+
+    def __del__(self):
+        self._release(reclaimed=True)
+
+
+class SQLiteConnectionPool:
+    """Keeps SQLite connections open across requests instead of reconnecting.
+
+    Werkzeug's threaded server runs each request on a brand-new thread, so
+    connections are checked out per request rather than pinned per thread.
+    Up to ``max_idle`` connections wait for reuse. A burst above that opens
+    extra connections that are closed on return, so callers never block on
+    the pool; SQLite's own ``busy_timeout`` arbitrates writers.
+
+    The defaults (16 idle connections, 5 s busy timeout) are what every
+    service uses.
+
+    Every connection runs in WAL mode with ``synchronous=NORMAL``, maps
+    ``mmap_size`` bytes of the file and keeps ``cached_statements`` compiled
+    statements, which survive between requests because the connection does.
+    """
+
+    def __init__(self, path, max_idle=16, busy_timeout=5.0, mmap_size=256 * 1024 * 1024,
+                 cached_statements=256):
+        self.path = path
+        self.max_idle = max_idle
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+
+        self._lock = threading.Lock()
+        self._idle = []
+        self._in_use = 0
+
+        self.opened = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.reuses = 0
+        self.rollbacks = 0
+        self.reclaimed = 0
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        return conn
+
+    def connect(self, isolation_level=''):
+        """Check out a connection; ``isolation_level=None`` gives autocommit as in sqlite3"""
+        with self._lock:
+            self.checkouts += 1
+            self._in_use += 1
+            if self._idle:
+                self.reuses += 1
+                return PooledConnection(self, self._idle.pop(), isolation_level)
+            self.opened += 1
+        try:
+            return PooledConnection(self, self._open(), isolation_level)
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self.opened -= 1
+            raise
+
+    def _checkin(self, conn, isolation_level, reclaimed=False):
+        # Nada de una transacción a medias pasa al siguiente request
+        rolled_back = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+                rolled_back = True
+            conn.isolation_level = isolation_level
+            reusable = True
+        except sqlite3.Error:
+            reusable = False
+        with self._lock:
+            self._in_use -= 1
+            self.rollbacks += rolled_back
+            self.reclaimed += reclaimed
+            if reusable and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self.closed += 1
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.closed += len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'max_idle': self.max_idle,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'opened': self.opened,
+                'closed': self.closed,
+                'checkouts': self.checkouts,
+                'reuses': self.reuses,
+                'reuse_ratio': round(self.reuses / self.checkouts, 4) if self.checkouts else None,
+                'rollbacks': self.rollbacks,
+                'reclaimed': self.reclaimed,
+                'cached_statements': self.cached_statements,
+                'mmap_size': self.mmap_size,
+                'busy_timeout': self.busy_timeout,
+            }
+
+
+def register_pool_routes(app, pool, authenticate):
+    """Serve ``pool.stats()`` at GET /db_pool behind the service's ``authenticate``"""
+    @app.route('/db_pool', methods=['GET'])
+    def get_db_pool_stats():
+        """Connection reuse counters: 'opened' stays flat while 'checkouts' grows"""
+        auth = authenticate()
+        if not auth:
+            return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+        return jsonify(pool.stats())
@@ -0,0 +1,90 @@
+"""
+Caché de tokens JWT ya verificados, compartida por inventory, order y payment
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from flask import request
+
+
+class TokenVerificationCache:
+    """Bounded LRU of verified token payloads, each entry expiring at its ``exp``.
+
+    Only tokens that passed signature and authorization checks are stored, so a
+    hit is exactly as trustworthy as a fresh ``jwt.decode``. Tokens without an
+    ``exp`` claim are never cached.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # token -> (payload, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, exp = entry
+            if time.time() >= exp:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        if exp is None:
+            return
+        with self._lock:
+            self._entries[token] = (payload, float(exp))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class ServiceTokenVerifier:
+    """Checks the Bearer token other services send, through a TokenVerificationCache.
+
+    A token is accepted when it is signed with ``secret_key``, has not
+    expired and names one of ``authorized_services`` in its ``service``
+    claim.
+    """
+
+    def __init__(self, secret_key, authorized_services, cache_size=1024):
+        self.secret_key = secret_key
+        self.authorized_services = authorized_services
+        self.cache = TokenVerificationCache(maxsize=cache_size)
+
+    def verify(self, token):
+        """The token's payload, or None if it is not valid for this service"""
+        payload = self.cache.get(token)
+        if payload is not None:
+            return payload
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+        except jwt.InvalidTokenError:  # incluye ExpiredSignatureError
+            return None
+        if payload.get('service') not in self.authorized_services:
+            return None
+        self.cache.put(token, payload)
+        return payload
+
+    def authenticate(self):
+        """Verify the Authorization header of the current Flask request"""
+        token = request.headers.get('Authorization')
+        if not token:
+            return None
+        return self.verify(token.replace('Bearer ', ''))
@@ -0,0 +1,159 @@
+"""
+Benchmark: gateway.py (Flask con hilos) contra gateway_async.py (asyncio) usando los mismos núcleos.
+
+Levanta inventory, order y payment en un directorio temporal (no toca las .db del proyecto),
+crea un producto con stock suficiente y lanza la misma carga contra cada gateway fijado
+a los núcleos indicados.
+
+Uso: python debugs/bench_async_gateway.py --cores 0 --concurrency 10 100 500 --requests 2000
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import jwt
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = [
+    ('Inventory', 5001, 'inventory_service/inventory.py'),
+    ('Order', 5002, 'order_service/order.py'),
+    ('Payment', 5003, 'payment_service/payment.py'),
+]
+GATEWAYS = [
+    ('gateway.py (Flask)', 'gateway_service/gateway.py'),
+    ('gateway_async.py (asyncio)', 'gateway_service/gateway_async.py'),
+]
+GATEWAY_URL = 'http://localhost:5000'
+
+
+def start_process(path, workdir, cores=None):
+    def pin():
+        if cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, path)],
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        preexec_fn=pin if os.name == 'posix' else None,
+        start_new_session=os.name == 'posix'  # el reloader de Flask lanza un hijo: se mata el grupo entero
+    )
+
+
+def stop_process(process):
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(timeout=5)
+    except Exception:
+        process.kill()
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('localhost', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def create_bench_product(stock):
+    token = jwt.encode({'service': 'gateway', 'exp': dt.datetime.utcnow() + dt.timedelta(hours=1)},
+                       'inventory-secret-key', algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    requests.post('http://localhost:5001/products', headers=headers, timeout=10,
+                  json={'name': 'Bench', 'quantity': stock, 'price': 1.0})
+    products = requests.get('http://localhost:5001/products', headers=headers, timeout=10).json()
+    return max(p['id'] for p in products if p['name'] == 'Bench')
+
+
+async def run_load(product_id, total, concurrency):
+    order = {'product_id': product_id, 'quantity': 1, 'price': 1.0, 'customer_email': 'bench@example.com'}
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.post(f'{GATEWAY_URL}/process_order', json=order) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    return sorted(latencies), errors, elapsed
+
+
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', type=int, nargs='+', default=[0], help='núcleos para el gateway')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--requests', type=int, default=2000, help='órdenes por nivel de concurrencia')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_gateway_')
+    services = []
+    try:
+        print(f"🚀 Iniciando servicios en {workdir}...")
+        for name, port, path in SERVICES:
+            services.append(start_process(path, workdir))
+            if not wait_for_port(port):
+                print(f"❌ {name} no respondió en el puerto {port}")
+                return
+        product_id = create_bench_product(args.requests * len(args.concurrency) * len(GATEWAYS) * 2)
+
+        print(f"\n📊 Gateway fijado a los núcleos {args.cores}, {args.requests} órdenes por nivel\n")
+        print(f"{'gateway':<28}{'conc':>6}{'órdenes/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'errores':>9}")
+        for label, path in GATEWAYS:
+            gateway = start_process(path, workdir, cores=set(args.cores))
+            try:
+                if not wait_for_port(5000):
+                    print(f"❌ {label} no respondió en el puerto 5000")
+                    continue
+                asyncio.run(run_load(product_id, 50, 10))  # calentamiento
+                for concurrency in args.concurrency:
+                    latencies, errors, elapsed = asyncio.run(run_load(product_id, args.requests, concurrency))
+                    print(f"{label:<28}{concurrency:>6}{args.requests / elapsed:>12.1f}"
+                          f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}"
+                          f"{errors:>9}")
+            finally:
+                stop_process(gateway)
+                time.sleep(0.5)
+    finally:
+        for process in services:
+            stop_process(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: carga de catálogo fila por fila (POST /products) contra /products/import, y descarga con /products/export.
+
+Levanta inventory en un directorio temporal (no toca las .db del proyecto). El cuerpo del import
+se envía en streaming (chunked) desde un generador, como lo haría un script de carga real, y
+lleva algunas filas inválidas para verificar que se reportan por línea sin frenar el resto.
+
+Uso: python debugs/bench_bulk_import.py --single 2000 --bulk 200000
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import jwt
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INVENTORY_URL = 'http://localhost:5001'
+BAD_ROW_EVERY = 10000  # una fila inválida cada tantas
+
+
+def headers():
+    token = jwt.encode({'service': 'gateway', 'exp': dt.datetime.utcnow() + dt.timedelta(hours=1)},
+                       'inventory-secret-key', algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('localhost', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def ndjson_body(count):
+    for i in range(count):
+        if i % BAD_ROW_EVERY == BAD_ROW_EVERY - 1:
+            yield b'{"name": "broken", "quantity": -1, "price": 1.0}\n'
+        else:
+            yield json.dumps({'name': f'SKU-{i}', 'quantity': i % 100, 'price': 9.99}).encode() + b'\n'
+
+
+def csv_body(count):
+    yield b'name,quantity,price\n'
+    for i in range(count):
+        if i % BAD_ROW_EVERY == BAD_ROW_EVERY - 1:
+            yield b'broken,many,1.0\n'
+        else:
+            yield f'CSV-{i},{i % 100},9.99\n'.encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--single', type=int, default=2000, help='productos cargados con POST /products')
+    parser.add_argument('--bulk', type=int, default=200000, help='productos por import (NDJSON y CSV)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_import_')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'inventory_service/inventory.py')], cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=os.name == 'posix')
+    try:
+        if not wait_for_port(5001):
+            print('❌ inventory did not start')
+            return
+        session = requests.Session()
+        print(f"\n{'modo':<24}{'filas':>10}{'segundos':>10}{'filas/s':>12}")
+
+        started = time.perf_counter()
+        for i in range(args.single):
+            session.post(f'{INVENTORY_URL}/products', headers=headers(), timeout=10,
+                         json={'name': f'ONE-{i}', 'quantity': 1, 'price': 9.99})
+        elapsed = time.perf_counter() - started
+        print(f"{'POST /products':<24}{args.single:>10}{elapsed:>10.2f}{args.single / elapsed:>12.0f}")
+
+        ok = True
+        expected_failed = args.bulk // BAD_ROW_EVERY
+        for label, body, content_type in [('import NDJSON', ndjson_body, 'application/x-ndjson'),
+                                          ('import CSV', csv_body, 'text/csv')]:
+            started = time.perf_counter()
+            result = session.post(f'{INVENTORY_URL}/products/import', data=body(args.bulk), timeout=600,
+                                  headers={**headers(), 'Content-Type': content_type}).json()
+            elapsed = time.perf_counter() - started
+            print(f"{label:<24}{result['imported']:>10}{elapsed:>10.2f}{result['imported'] / elapsed:>12.0f}"
+                  f"   ({result['failed']} filas rechazadas)")
+            ok = ok and result['imported'] == args.bulk - expected_failed and result['failed'] == expected_failed
+
+        for export_format in ('ndjson', 'csv'):
+            started = time.perf_counter()
+            rows = 0
+            size = 0
+            with session.get(f'{INVENTORY_URL}/products/export', params={'format': export_format},
+                             headers=headers(), stream=True, timeout=600) as response:
+                for line in response.iter_lines():
+                    rows += 1
+                    size += len(line) + 1
+            elapsed = time.perf_counter() - started
+            rows -= export_format == 'csv'  # cabecera
+            print(f"{'export ' + export_format.upper():<24}{rows:>10}{elapsed:>10.2f}{rows / elapsed:>12.0f}"
+                  f"   ({size / 1e6:.1f} MB)")
+            ok = ok and rows == args.single + 4 + 2 * (args.bulk - expected_failed)
+
+        print(f"\n{'✅' if ok else '❌'} filas importadas, rechazadas y exportadas cuadran")
+    finally:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(timeout=5)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
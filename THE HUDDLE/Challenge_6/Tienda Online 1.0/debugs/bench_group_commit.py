@@ -0,0 +1,111 @@
+"""
+Benchmark: create_order y process_payment con un commit por request contra GROUP_COMMIT.
+
+Corre los handlers reales dentro del proceso (app.test_client desde N hilos, como el servidor
+con hilos de Werkzeug) sobre bases temporales, así se mide la escritura en SQLite y no el HTTP.
+Al final verifica que cada request recibió un id distinto y que todas las filas están en la base.
+
+Uso: python debugs/bench_group_commit.py --clients 1 16 128 --inserts 3000
+"""
+import argparse
+import datetime as dt
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'order_service'))
+sys.path.append(os.path.join(ROOT, 'payment_service'))
+
+
+def run(module, endpoint, body, id_field, clients, inserts):
+    token = jwt.encode({'service': 'gateway', 'exp': dt.datetime.utcnow() + dt.timedelta(hours=1)},
+                       module.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    per_client = inserts // clients
+    latencies = []
+    ids = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Event()
+
+    def client():
+        test_client = module.app.test_client()
+        mine = []
+        my_ids = []
+        start.wait()
+        for _ in range(per_client):
+            started = time.perf_counter()
+            response = test_client.post(endpoint, json=body, headers=headers)
+            mine.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                my_ids.append(response.get_json()[id_field])
+        with lock:
+            latencies.extend(mine)
+            ids.extend(my_ids)
+            errors.append(per_client - len(my_ids))
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(ids) / elapsed, latencies[len(latencies) // 2], latencies[int(0.99 * len(latencies))], ids, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 16, 128])
+    parser.add_argument('--inserts', type=int, default=3000, help='inserts por corrida')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_group_commit_')
+    cwd = os.getcwd()
+    os.chdir(workdir)  # order.db y payment.db se crean acá
+    try:
+        import order
+        import payment
+        order.init_order_db()
+        payment.init_payment_db()
+        targets = [
+            ('create_order', order, '/create_order', 'order_id', 'order.db', 'orders',
+             {'product_id': 1, 'quantity': 1, 'price': 9.99, 'customer_email': 'bench@example.com'}),
+            ('process_payment', payment, '/process_payment', 'payment_id', 'payment.db', 'payments',
+             {'order_id': 1, 'total_price': 9.99, 'payment_method': 'credit_card'}),
+        ]
+        print(f"\n📊 {args.inserts} inserts por corrida ({os.cpu_count()} núcleos)\n")
+        print(f"{'endpoint':<17}{'modo':<14}{'clientes':>9}{'inserts/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'lote medio':>12}")
+        ok = True
+        for label, module, endpoint, id_field, db, table, body in targets:
+            writer = order.ORDER_WRITES if module is order else payment.PAYMENT_WRITES
+            for group_commit in (False, True):
+                module.GROUP_COMMIT = group_commit
+                for clients in args.clients:
+                    batches, writes = writer.batches, writer.writes
+                    conn = sqlite3.connect(db)
+                    before = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    rate, p50, p99, ids, errors = run(module, endpoint, body, id_field, clients, args.inserts)
+                    after = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    conn.close()
+                    ok = ok and not errors and len(set(ids)) == len(ids) and after - before == len(ids)
+                    average = (writer.writes - writes) / (writer.batches - batches) if writer.batches > batches else 1
+                    print(f"{label:<17}{'group commit' if group_commit else 'commit/req':<14}{clients:>9}"
+                          f"{rate:>11.0f}{p50 * 1000:>9.2f}{p99 * 1000:>9.2f}{average:>12.1f}")
+        print(f"\n{'✅' if ok else '❌'} ids únicos y todas las filas confirmadas")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: /process_order con los servicios por HTTP (layout distribuido) contra MONOLITH_MODE.
+
+El gateway corre dentro de este proceso (app.test_client desde N hilos). En la primera corrida
+inventory, order y payment se levantan como procesos aparte en un directorio temporal y
+call_service los llama por HTTP; en la segunda se montan en el proceso y se llaman sin socket.
+Las dos corridas usan las mismas .db, así se verifica que cada orden quedó cobrada una vez.
+
+Uso: python debugs/bench_monolith.py --clients 1 8 --orders 1000
+"""
+import argparse
+import logging
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'gateway_service'))
+SERVICE_PATHS = ['inventory_service/inventory.py', 'order_service/order.py', 'payment_service/payment.py']
+SERVICE_PORTS = [5001, 5002, 5003]
+ORDER = {'product_id': 1, 'quantity': 1, 'customer_email': 'bench@example.com', 'payment_method': 'credit_card'}
+
+
+def wait_until_serving(timeout=30):
+    deadline = time.time() + timeout
+    pending = list(SERVICE_PORTS)
+    while pending and time.time() < deadline:
+        try:
+            requests.get(f'http://localhost:{pending[0]}/', timeout=1)
+            pending.pop(0)
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    return not pending
+
+
+def run(gateway, clients, orders):
+    per_client = orders // clients
+    latencies = []
+    failed = []
+    lock = threading.Lock()
+    start = threading.Event()
+
+    def client():
+        test_client = gateway.app.test_client()
+        mine = []
+        errors = 0
+        start.wait()
+        for _ in range(per_client):
+            started = time.perf_counter()
+            response = test_client.post('/process_order', json=ORDER)
+            mine.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+        with lock:
+            latencies.extend(mine)
+            failed.append(errors)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(0.99 * len(latencies))], sum(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--orders', type=int, default=1000, help='órdenes por corrida')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='bench_monolith_')
+    cwd = os.getcwd()
+    os.chdir(workdir)  # las .db de los servicios y logs.db se crean acá
+    processes = [subprocess.Popen([sys.executable, os.path.join(ROOT, path)], cwd=workdir,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  start_new_session=os.name == 'posix')
+                 for path in SERVICE_PATHS]
+    try:
+        import gateway
+        gateway.init_logs_db()
+        gateway.IDEMPOTENCY.init_db()
+        gateway.start_background_tasks()
+        if not wait_until_serving():
+            print('❌ services did not start')
+            return
+        # Stock de sobra para todas las corridas
+        gateway.call_service('inventory', 'products', 'PUT',
+                             {'id': 1, 'name': 'Laptop', 'quantity': 10 ** 9, 'price': 999.99})
+
+        print(f"\n📊 {args.orders} órdenes por corrida ({os.cpu_count()} núcleos)\n")
+        print(f"{'modo':<13}{'clientes':>9}{'órdenes/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'fallidas':>10}")
+        total = 0
+        failed_total = 0
+        for monolith in (False, True):
+            if monolith:
+                for process in processes:
+                    if os.name == 'posix':
+                        os.killpg(process.pid, signal.SIGTERM)
+                    else:
+                        process.terminate()
+                    process.wait(timeout=5)
+                gateway.MONOLITH_MODE = True
+                gateway.mount_services()
+            for clients in args.clients:
+                rate, p50, p99, failed = run(gateway, clients, args.orders)
+                total += args.orders // clients * clients
+                failed_total += failed
+                print(f"{'monolito' if monolith else 'HTTP':<13}{clients:>9}{rate:>11.0f}"
+                      f"{p50 * 1000:>9.2f}{p99 * 1000:>9.2f}{failed:>10}")
+
+        conn = sqlite3.connect('payment.db')
+        payments = conn.execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+        conn.close()
+        ok = failed_total == 0 and payments == total
+        print(f"\n{'✅' if ok else '❌'} {payments} pagos para {total} órdenes")
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                if os.name == 'posix':
+                    os.killpg(process.pid, signal.SIGTERM)
+                else:
+                    process.terminate()
+                process.wait(timeout=5)
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
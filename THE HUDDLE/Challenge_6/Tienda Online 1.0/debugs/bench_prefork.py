@@ -0,0 +1,122 @@
+"""
+Benchmark del lanzador prefork: tiempo de arranque y órdenes/s con 1 worker por servicio contra N.
+
+Cada corrida levanta launcher.py en un directorio temporal (no toca las .db del proyecto),
+mide cuánto tarda en responder el gateway y lanza la misma carga de órdenes.
+
+Uso: python debugs/bench_prefork.py --workers 1 4 --concurrency 50 --requests 2000 [--reuseport]
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import jwt
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY_URL = 'http://127.0.0.1:5000'
+PORTS = [5000, 5001, 5002, 5003]
+
+
+def wait_until_serving(timeout=60):
+    """Seconds until every service answers an HTTP request"""
+    started = time.perf_counter()
+    pending = list(PORTS)
+    while pending and time.perf_counter() - started < timeout:
+        try:
+            requests.get(f'http://127.0.0.1:{pending[0]}/health', timeout=1)
+            pending.pop(0)
+        except requests.exceptions.RequestException:
+            time.sleep(0.05)
+    return time.perf_counter() - started if not pending else None
+
+
+def create_bench_product(stock):
+    token = jwt.encode({'service': 'gateway', 'exp': dt.datetime.utcnow() + dt.timedelta(hours=1)},
+                       'inventory-secret-key', algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    requests.post('http://127.0.0.1:5001/products', headers=headers, timeout=10,
+                  json={'name': 'Bench', 'quantity': stock, 'price': 1.0})
+    products = requests.get('http://127.0.0.1:5001/products', headers=headers, timeout=10).json()
+    return max(p['id'] for p in products if p['name'] == 'Bench')
+
+
+async def run_load(product_id, total, concurrency):
+    order = {'product_id': product_id, 'quantity': 1, 'price': 1.0, 'customer_email': 'bench@example.com'}
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.post(f'{GATEWAY_URL}/process_order', json=order) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    return sorted(latencies), errors, elapsed
+
+
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--reuseport', action='store_true')
+    args = parser.parse_args()
+
+    print(f"\n📊 {os.cpu_count()} núcleos, {args.requests} órdenes con concurrencia {args.concurrency}\n")
+    print(f"{'workers':>8}{'arranque s':>12}{'órdenes/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    for workers in args.workers:
+        workdir = tempfile.mkdtemp(prefix='bench_prefork_')
+        command = [sys.executable, os.path.join(ROOT, 'launcher.py'), '--workers', str(workers)]
+        if args.reuseport:
+            command.append('--reuseport')
+        launcher = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                    start_new_session=True)
+        try:
+            startup = wait_until_serving()
+            if startup is None:
+                print(f"{workers:>8}  ❌ los servicios no respondieron")
+                continue
+            product_id = create_bench_product(args.requests * 2)
+            asyncio.run(run_load(product_id, 50, 10))  # calentamiento
+            latencies, errors, elapsed = asyncio.run(run_load(product_id, args.requests, args.concurrency))
+            print(f"{workers:>8}{startup:>12.2f}{args.requests / elapsed:>12.1f}"
+                  f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}"
+                  f"{errors:>9}")
+        finally:
+            os.killpg(launcher.pid, signal.SIGTERM)
+            try:
+                launcher.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(launcher.pid, signal.SIGKILL)
+            shutil.rmtree(workdir, ignore_errors=True)
+            time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark: contención de escritura sobre un solo producto, fila única contra stock repartido en slots.
+
+Varios procesos (como los workers del lanzador prefork) descuentan 1 unidad a la vez del mismo
+producto. 'row' es el UPDATE guardado de update_inventory sobre products; 'slots N' usa
+ShardedStock con N archivos. Corre en un directorio temporal y al final verifica que no se
+perdieron ni inventaron unidades.
+
+Uso: python debugs/bench_stock_shards.py --processes 8 --takes 500 --slots 1 4 8 16
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'inventory_service'))
+
+from common.sqlite_pool import SQLiteConnectionPool  # noqa: E402
+from stock_shards import ShardedStock  # noqa: E402
+
+PRODUCT_ID = 1
+
+
+def row_worker(workdir, takes, start, results):
+    pool = SQLiteConnectionPool(os.path.join(workdir, 'inventory.db'))
+    start.wait()
+    latencies = []
+    for _ in range(takes):
+        started = time.perf_counter()
+        conn = pool.connect()
+        c = conn.cursor()
+        c.execute("UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?", (1, PRODUCT_ID, 1))
+        conn.commit()
+        conn.close()
+        latencies.append(time.perf_counter() - started)
+    results.put(latencies)
+
+
+def slots_worker(workdir, takes, start, results, slots):
+    stock = ShardedStock(os.path.join(workdir, 'inventory_stock_{slot}.db'), slots=slots)
+    start.wait()
+    latencies = []
+    for _ in range(takes):
+        started = time.perf_counter()
+        stock.take(PRODUCT_ID, 1)
+        latencies.append(time.perf_counter() - started)
+    results.put(latencies)
+
+
+def run(label, target, extra_args, processes, takes, workdir):
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=target, args=(workdir, takes, start, results) + extra_args)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.5)
+    started = time.perf_counter()
+    start.set()
+    latencies = sorted(latency for _ in workers for latency in results.get())
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    p99 = latencies[min(int(0.99 * len(latencies)), len(latencies) - 1)]
+    print(f"{label:<10}{len(latencies) / elapsed:>14.0f}{latencies[len(latencies) // 2] * 1000:>10.2f}"
+          f"{p99 * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--takes', type=int, default=500, help='descuentos por proceso')
+    parser.add_argument('--slots', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    stock = args.processes * args.takes * 2
+    print(f"\n📊 {args.processes} procesos x {args.takes} descuentos sobre el mismo producto "
+          f"({os.cpu_count()} núcleos)\n")
+    print(f"{'modo':<10}{'descuentos/s':>14}{'p50 ms':>10}{'p99 ms':>10}")
+
+    workdir = tempfile.mkdtemp(prefix='bench_shards_')
+    try:
+        conn = sqlite3.connect(os.path.join(workdir, 'inventory.db'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, quantity INTEGER, price REAL)')
+        conn.execute('INSERT INTO products VALUES (?, ?, ?, ?)', (PRODUCT_ID, 'Laptop', stock, 999.99))
+        conn.commit()
+        run('row', row_worker, (), args.processes, args.takes, workdir)
+        remaining = conn.execute('SELECT quantity FROM products').fetchone()[0]
+        conn.close()
+        ok = remaining == stock - args.processes * args.takes
+
+        for slots in args.slots:
+            slot_dir = os.path.join(workdir, f'slots_{slots}')
+            os.mkdir(slot_dir)
+            sharded = ShardedStock(os.path.join(slot_dir, 'inventory_stock_{slot}.db'), slots=slots)
+            sharded.init_db()
+            sharded.set(PRODUCT_ID, stock)
+            run(f'slots {slots}', slots_worker, (slots,), args.processes, args.takes, slot_dir)
+            ok = ok and sharded.total(PRODUCT_ID) == stock - args.processes * args.takes
+
+        print(f"\n{'✅' if ok else '❌'} stock final consistente en todos los modos")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Verifica los límites de lectura obsoleta de la caché de productos de inventory.
+
+1. Escrituras por la API (/products POST/PUT/DELETE, /update_inventory) se ven en el acto en /check_inventory.
+2. Una escritura directa sobre inventory.db (como la de otro proceso) se ve en a lo sumo max_staleness segundos.
+
+Requiere inventory corriendo en localhost:5001 con la base indicada.
+Uso: python debugs/check_product_cache.py [ruta/a/inventory.db]
+"""
+import datetime as dt
+import sqlite3
+import sys
+import time
+
+import jwt
+import requests
+
+INVENTORY_URL = 'http://localhost:5001'
+TOLERANCE = 0.2  # segundos de margen por la latencia HTTP
+
+
+def headers():
+    token = jwt.encode({'service': 'gateway', 'exp': dt.datetime.utcnow() + dt.timedelta(hours=1)},
+                       'inventory-secret-key', algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def cached_quantity(product_id):
+    response = requests.post(f'{INVENTORY_URL}/check_inventory', headers=headers(), timeout=10,
+                             json={'product_id': product_id, 'quantity': 1})
+    if response.status_code == 404:
+        return None
+    return response.json().get('available_quantity')
+
+
+def check(label, ok):
+    print(f"{'✅' if ok else '❌'} {label}")
+    return ok
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'inventory.db'
+    stats = requests.get(f'{INVENTORY_URL}/product_cache', headers=headers(), timeout=10).json()
+    max_staleness = stats['max_staleness']
+    print(f"🔎 max_staleness = {max_staleness}s\n")
+    results = []
+
+    requests.post(f'{INVENTORY_URL}/products', headers=headers(), timeout=10,
+                  json={'name': 'CacheProbe', 'quantity': 10, 'price': 1.0})
+    products = requests.get(f'{INVENTORY_URL}/products', headers=headers(), timeout=10).json()
+    product_id = max(p['id'] for p in products if p['name'] == 'CacheProbe')
+    results.append(check('POST /products visible immediately', cached_quantity(product_id) == 10))
+
+    requests.put(f'{INVENTORY_URL}/products', headers=headers(), timeout=10,
+                 json={'id': product_id, 'name': 'CacheProbe', 'quantity': 7, 'price': 1.0})
+    results.append(check('PUT /products visible immediately', cached_quantity(product_id) == 7))
+
+    requests.post(f'{INVENTORY_URL}/update_inventory', headers=headers(), timeout=10,
+                  json={'product_id': product_id, 'quantity': 2})
+    results.append(check('/update_inventory visible immediately', cached_quantity(product_id) == 5))
+
+    if max_staleness is None:
+        print("⚠️ max_staleness=None: writes from other processes are never picked up, skipping")
+    else:
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE products SET quantity = 42 WHERE id = ?", (product_id,))
+        conn.commit()
+        conn.close()
+        written = time.monotonic()
+        while cached_quantity(product_id) != 42 and time.monotonic() - written < max_staleness + 5:
+            time.sleep(0.02)
+        elapsed = time.monotonic() - written
+        results.append(check(f'direct DB write visible after {elapsed:.3f}s (bound {max_staleness}s)',
+                             elapsed <= max_staleness + TOLERANCE))
+
+    requests.delete(f'{INVENTORY_URL}/products', headers=headers(), params={'id': product_id}, timeout=10)
+    results.append(check('DELETE /products visible immediately', cached_quantity(product_id) is None))
+
+    print(f"\n{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
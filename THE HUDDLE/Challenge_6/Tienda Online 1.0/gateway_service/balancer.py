@@ -0,0 +1,167 @@
+"""
+Balanceo de carga entre réplicas de un servicio downstream
+"""
+import random
+import threading
+import time
+
+LEAST_OUTSTANDING = 'least_outstanding'
+POWER_OF_TWO = 'p2c'
+
+
+class Replica:
+    """One endpoint of a service plus the counters the balancer decides on."""
+
+    def __init__(self, url, weight=1):
+        self.url = url.rstrip('/')
+        self.weight = weight
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejection_streak = 0  # expulsiones seguidas sin haber vuelto a responder bien
+        self.warming_since = None
+
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+
+class ReplicaBalancer:
+    """Weighted replica picker with passive health checks.
+
+    * ``strategy='least_outstanding'`` scans every eligible replica and picks
+      the lowest ``outstanding / effective_weight``; ties go by weight.
+    * ``strategy='p2c'`` (power of two choices) samples two replicas in
+      proportion to their effective weight and keeps the less loaded one, so
+      an idle service spreads calls exactly by weight.
+    * A replica that fails ``consecutive_failures`` calls in a row is ejected
+      for ``ejection_seconds``, doubled on every further ejection up to
+      ``max_ejection_seconds``. At most ``max_ejected_fraction`` of the
+      replicas are ejected at once, and if every replica is ejected the
+      balancer ignores ejections rather than fail the call outright.
+    * A replica coming back from ejection starts at 10% of its weight and
+      ramps up linearly over ``slow_start_seconds``.
+    """
+
+    def __init__(self, name, replicas, strategy=POWER_OF_TWO, consecutive_failures=5, ejection_seconds=30,
+                 max_ejection_seconds=300, max_ejected_fraction=0.5, slow_start_seconds=30):
+        if strategy not in (LEAST_OUTSTANDING, POWER_OF_TWO):
+            raise ValueError(f"Unknown balancing strategy: {strategy}")
+        if not replicas:
+            raise ValueError(f"Service {name} has no replicas")
+        self.name = name
+        self.strategy = strategy
+        self.consecutive_failures = consecutive_failures
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.max_ejected_fraction = max_ejected_fraction
+        self.slow_start_seconds = slow_start_seconds
+
+        self.replicas = [
+            Replica(r) if isinstance(r, str) else Replica(r['url'], r.get('weight', 1))
+            for r in replicas
+        ]
+        self._lock = threading.Lock()
+
+    def _effective_weight(self, replica, now):
+        if replica.warming_since is None:
+            return replica.weight
+        elapsed = now - replica.warming_since
+        if elapsed >= self.slow_start_seconds:
+            replica.warming_since = None
+            return replica.weight
+        return replica.weight * max(elapsed / self.slow_start_seconds, 0.1)
+
+    def _eligible(self, now, exclude):
+        healthy = []
+        for replica in self.replicas:
+            if replica.ejected_until:
+                if now < replica.ejected_until:
+                    continue
+                # Termina la expulsión: vuelve con slow-start
+                replica.ejected_until = 0.0
+                replica.consecutive_failures = 0
+                replica.warming_since = now
+            healthy.append(replica)
+        if not healthy:
+            healthy = list(self.replicas)
+        # Un reintento prefiere otra réplica que la que acaba de fallar
+        if exclude is not None and len(healthy) > 1:
+            healthy = [replica for replica in healthy if replica is not exclude]
+        return healthy
+
+    def _weighted_sample(self, candidates, weights):
+        point = random.uniform(0, sum(weights))
+        for replica, weight in zip(candidates, weights):
+            point -= weight
+            if point <= 0:
+                return replica
+        return candidates[-1]
+
+    def _pick(self, candidates, now):
+        if len(candidates) == 1:
+            return candidates[0]
+        weights = [self._effective_weight(replica, now) for replica in candidates]
+        score = {id(r): r.outstanding / w for r, w in zip(candidates, weights)}
+        if self.strategy == LEAST_OUTSTANDING:
+            # Los empates (p. ej. sin carga) se reparten según el peso
+            best = min(score.values())
+            tied = [(r, w) for r, w in zip(candidates, weights) if score[id(r)] == best]
+            return self._weighted_sample([r for r, _ in tied], [w for _, w in tied])
+        first = self._weighted_sample(candidates, weights)
+        rest = [(r, w) for r, w in zip(candidates, weights) if r is not first]
+        second = self._weighted_sample([r for r, _ in rest], [w for _, w in rest])
+        return second if score[id(second)] < score[id(first)] else first
+
+    def acquire(self, exclude=None):
+        """Pick a replica and count the call as outstanding until ``release``."""
+        now = time.monotonic()
+        with self._lock:
+            replica = self._pick(self._eligible(now, exclude), now)
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def release(self, replica, success):
+        """Record the outcome; ``success`` is False for transport errors and 5xx."""
+        now = time.monotonic()
+        with self._lock:
+            replica.outstanding -= 1
+            if success:
+                replica.consecutive_failures = 0
+                replica.ejection_streak = 0
+                return
+            replica.failures += 1
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.consecutive_failures and replica.ejected_until <= now:
+                self._maybe_eject(replica, now)
+
+    def _maybe_eject(self, replica, now):
+        ejected = sum(1 for r in self.replicas if r.ejected_until > now)
+        if ejected + 1 > self.max_ejected_fraction * len(self.replicas):
+            return
+        duration = min(self.ejection_seconds * (2 ** replica.ejection_streak), self.max_ejection_seconds)
+        replica.ejected_until = now + duration
+        replica.ejection_streak += 1
+        replica.warming_since = None
+        replica.ejections += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'strategy': self.strategy,
+                'replicas': [{
+                    'url': replica.url,
+                    'weight': replica.weight,
+                    'effective_weight': round(self._effective_weight(replica, now), 3)
+                    if replica.ejected_until <= now else 0,
+                    'outstanding': replica.outstanding,
+                    'ejected': replica.ejected_until > now,
+                    'ejected_for': round(max(replica.ejected_until - now, 0.0), 3),
+                    'consecutive_failures': replica.consecutive_failures,
+                    'requests': replica.requests,
+                    'failures': replica.failures,
+                    'ejections': replica.ejections,
+                } for replica in self.replicas]
+            }
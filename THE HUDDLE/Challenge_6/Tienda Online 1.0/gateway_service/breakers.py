@@ -0,0 +1,142 @@
+"""
+Circuit breaker independiente por servicio downstream
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while a breaker rejects calls."""
+
+    def __init__(self, service_name, retry_after):
+        super().__init__(f"Circuit for {service_name} is open (retry in {retry_after:.1f}s)")
+        self.service_name = service_name
+        self.retry_after = retry_after
+
+
+class ServiceCircuitBreaker:
+    """Failure-rate circuit breaker over a rolling time window.
+
+    * closed: calls pass; outcomes are counted in one-second buckets covering
+      the last ``window_seconds``. Once at least ``minimum_calls`` were seen and
+      the failure rate reaches ``failure_rate_threshold`` the breaker opens.
+    * open: ``before_call`` raises ``CircuitOpenError`` immediately for
+      ``open_seconds``, then the breaker moves to half-open.
+    * half_open: at most ``half_open_max_calls`` probes run concurrently. Any
+      failed probe opens the breaker again; ``half_open_max_calls`` successful
+      probes close it with an empty window.
+    """
+
+    def __init__(self, name, failure_rate_threshold=0.5, minimum_calls=5, window_seconds=30,
+                 open_seconds=30, half_open_max_calls=3):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._buckets = deque()  # [second, successes, failures]
+        self._opened_until = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance(time.monotonic())
+            return self._state
+
+    def _advance(self, now):
+        if self._state == OPEN and now >= self._opened_until:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_until = now + self.open_seconds
+        self._buckets.clear()
+        self.opened += 1
+
+    def _window_counts(self, now):
+        horizon = int(now) - self.window_seconds
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+        successes = sum(bucket[1] for bucket in self._buckets)
+        failures = sum(bucket[2] for bucket in self._buckets)
+        return successes, failures
+
+    def _record(self, now, success):
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        self._buckets[-1][1 if success else 2] += 1
+
+    def before_call(self):
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return
+            self.rejected += 1
+            retry_after = max(self._opened_until - now, 0.0)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def on_success(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._state = CLOSED
+                    self._buckets.clear()
+            elif self._state == CLOSED:
+                self._record(now, True)
+
+    def on_abandoned(self):
+        # La llamada nunca llegó al servicio (p. ej. no hubo conexión libre): libera la
+        # sonda de half-open sin contar éxito ni fallo
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def on_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open(now)
+            elif self._state == CLOSED:
+                self._record(now, False)
+                successes, failures = self._window_counts(now)
+                total = successes + failures
+                if total >= self.minimum_calls and failures / total >= self.failure_rate_threshold:
+                    self._open(now)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            successes, failures = self._window_counts(now)
+            return {
+                'state': self._state,
+                'window_successes': successes,
+                'window_failures': failures,
+                'retry_after': round(max(self._opened_until - now, 0.0), 3) if self._state == OPEN else 0,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,86 @@
+"""
+Tokens de servicio pre-firmados y rotados en segundo plano
+"""
+import logging
+import threading
+import time
+
+import jwt
+
+
+class ServiceCredentialManager:
+    """Keeps one signed JWT per downstream service and rotates it before ``exp``.
+
+    ``get_token`` is a dictionary lookup on the hot path. A background thread
+    re-signs every token once less than ``refresh_fraction`` of its lifetime is
+    left, so callers never wait on the signature; if the thread is not running
+    (or fell behind) the token is re-signed inline.
+    """
+
+    def __init__(self, secrets, issuer='gateway', lifetime=24 * 3600, refresh_fraction=0.25,
+                 check_interval=60):
+        self.secrets = dict(secrets)
+        self.issuer = issuer
+        self.lifetime = lifetime
+        self.refresh_before = lifetime * refresh_fraction
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._tokens = {}  # service -> (token, exp)
+        self._thread = None
+        self._stop = threading.Event()
+        self.signed = 0
+
+    def _sign(self, service_name):
+        exp = int(time.time()) + self.lifetime
+        payload = {'service': self.issuer, 'exp': exp}
+        token = jwt.encode(payload, self.secrets[service_name], algorithm='HS256')
+        self._tokens[service_name] = (token, exp)
+        self.signed += 1
+        return token
+
+    def _needs_refresh(self, entry, now):
+        return entry is None or now >= entry[1] - self.refresh_before
+
+    def get_token(self, service_name):
+        entry = self._tokens.get(service_name)
+        if not self._needs_refresh(entry, time.time()):
+            return entry[0]
+        with self._lock:
+            entry = self._tokens.get(service_name)
+            if not self._needs_refresh(entry, time.time()):
+                return entry[0]
+            return self._sign(service_name)
+
+    def rotate_due(self):
+        """Re-sign every token that entered its refresh window."""
+        now = time.time()
+        with self._lock:
+            for service_name in self.secrets:
+                if self._needs_refresh(self._tokens.get(service_name), now):
+                    self._sign(service_name)
+                    logging.info(f"Rotated service token for {service_name}")
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.rotate_due()
+            except Exception as e:
+                logging.error(f"Token rotation failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.rotate_due()
+        self._thread = threading.Thread(target=self._run, name='token-rotator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        now = time.time()
+        return {
+            'signed': self.signed,
+            'tokens': {name: {'expires_in': round(exp - now)} for name, (_, exp) in self._tokens.items()}
+        }
@@ -1,16 +1,30 @@
-from flask import Flask, request, jsonify
-import requests #hacer llamadas HTTP a otros servicios
+from flask import Flask, request, jsonify, Response, g
 import sqlite3
 import logging #registra eventos y errores
-from datetime import datetime, timedelta
-from circuitbreaker import circuit
+from datetime import datetime
 import time
-import jwt
+import json
+import base64
+import os
+import sys
+from http_pool import ServiceSessionPool, PoolTimeout
+from credentials import ServiceCredentialManager
+from request_log import RequestLogWriter
+import idempotency
+from metrics import MetricsRegistry
+from breakers import ServiceCircuitBreaker, CircuitOpenError
+from balancer import ReplicaBalancer
+from retry import RetryPolicy, RetryBudget, Deadline, DeadlineExceeded, ServiceResponseError, is_retryable
+from monolith import MountedService
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.snapshot import SnapshotWriter, SnapshotInProgress
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # Configuración de servicios y tokens
+# Para varias réplicas de un servicio: 'replicas': ['http://localhost:5001', {'url': 'http://localhost:5011', 'weight': 2}]
 SERVICES = {
     'inventory': {
         'url': 'http://localhost:5001',
@@ -26,13 +40,87 @@ SERVICES = {
     }
 }
 
+# Modo monolito (un solo equipo): inventory, order y payment se montan dentro del proceso del gateway
+# y call_service llama a sus handlers sin HTTP, con el mismo token y los mismos códigos de respuesta.
+# En False cada servicio corre aparte en su URL (layout distribuido)
+MONOLITH_MODE = False
+MONOLITH_SERVICES = {
+    'inventory': {'path': 'inventory_service/inventory.py',
+                  'init': ['init_inventory_db', 'PRODUCT_CACHE.start', 'start_hold_reaper', 'start_change_feed']},
+    'order': {'path': 'order_service/order.py', 'init': ['init_order_db']},
+    'payment': {'path': 'payment_service/payment.py', 'init': ['init_payment_db']}
+}
+MOUNTED_SERVICES = {}
+
+# Pool de conexiones keep-alive por servicio (se puede sobreescribir por servicio en SERVICES)
+HTTP_POOL_SIZE = 10
+HTTP_POOL_IDLE_TIMEOUT = 30  # segundos
+HTTP_POOL_CHECKOUT_TIMEOUT = 5  # segundos
+
+SESSION_POOLS = {
+    name: ServiceSessionPool(
+        name,
+        pool_size=config.get('pool_size', HTTP_POOL_SIZE),
+        idle_timeout=config.get('idle_timeout', HTTP_POOL_IDLE_TIMEOUT),
+        checkout_timeout=HTTP_POOL_CHECKOUT_TIMEOUT,
+        hosts=len(config.get('replicas') or [config['url']])
+    )
+    for name, config in SERVICES.items()
+}
+
+# Balanceo entre réplicas (se puede sobreescribir con 'load_balancer' en SERVICES)
+LOAD_BALANCER_DEFAULTS = {
+    'strategy': 'p2c',  # 'p2c' (power of two choices) o 'least_outstanding'
+    'consecutive_failures': 5,  # fallos seguidos que expulsan una réplica
+    'ejection_seconds': 30,  # se duplica en cada expulsión seguida
+    'max_ejection_seconds': 300,
+    'max_ejected_fraction': 0.5,  # nunca se expulsa más de esta fracción de réplicas
+    'slow_start_seconds': 30  # rampa de peso para una réplica que vuelve
+}
+
+BALANCERS = {
+    name: ReplicaBalancer(name, config.get('replicas') or [config['url']],
+                          **{**LOAD_BALANCER_DEFAULTS, **config.get('load_balancer', {})})
+    for name, config in SERVICES.items()
+}
+
+# Circuit breaker independiente por servicio (se puede sobreescribir con 'circuit_breaker' en SERVICES)
+CIRCUIT_BREAKER_DEFAULTS = {
+    'failure_rate_threshold': 0.5,  # fracción de fallos en la ventana que abre el circuito
+    'minimum_calls': 5,  # llamadas mínimas en la ventana antes de evaluar la tasa
+    'window_seconds': 30,
+    'open_seconds': 30,  # tiempo abierto antes de pasar a half-open
+    'half_open_max_calls': 3  # pruebas concurrentes permitidas en half-open
+}
+
+BREAKERS = {
+    name: ServiceCircuitBreaker(name, **{**CIRCUIT_BREAKER_DEFAULTS, **config.get('circuit_breaker', {})})
+    for name, config in SERVICES.items()
+}
+
+# Reintentos: backoff exponencial con jitter, acotados por el deadline del request y por un presupuesto global
+RETRY_POLICY = RetryPolicy(
+    max_attempts=3,
+    base_delay=0.1,  # segundos; el jitter elige entre 0 y base_delay * 2^intento
+    max_delay=2.0,
+    attempt_timeout=5.0  # timeout máximo de cada intento, recortado por el deadline
+)
+RETRY_BUDGET = RetryBudget(ratio=0.2, min_retries_per_second=1, window_seconds=10)
+CALL_DEADLINE_SECONDS = 10  # llamadas sueltas (p. ej. compensaciones)
+ORDER_DEADLINE_SECONDS = 10  # todo /process_order
+BATCH_DEADLINE_SECONDS = 30  # todo /process_orders
+# Vida del hold de stock de /process_order: más que ORDER_DEADLINE_SECONDS para que no venza antes del confirm.
+# Si el gateway cae a mitad de la cadena, inventory devuelve el stock al vencer
+ORDER_HOLD_TTL_SECONDS = 60
+
+# Un token firmado por servicio, rotado en segundo plano antes de que expire
+CREDENTIALS = ServiceCredentialManager(
+    {name: config['secret_key'] for name, config in SERVICES.items()},
+    lifetime=24 * 3600
+)
+
 def generate_service_token(service_name):
-    secret_key = SERVICES[service_name]['secret_key']
-    payload = {
-        'service': 'gateway',
-        'exp': datetime.utcnow() + timedelta(hours=24)
-    }
-    return jwt.encode(payload, secret_key, algorithm='HS256')
+    return CREDENTIALS.get_token(service_name)
 
 def get_service_headers(service_name):
     token = generate_service_token(service_name)
@@ -45,6 +133,7 @@ def get_service_headers(service_name):
 def init_logs_db():
     conn = sqlite3.connect('logs.db')
     c = conn.cursor()
+    c.execute('PRAGMA journal_mode=WAL')
     c.execute('''CREATE TABLE IF NOT EXISTS logs
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   timestamp TEXT,
@@ -54,67 +143,286 @@ def init_logs_db():
                   request_data TEXT,
                   response_data TEXT,
                   status TEXT)''')
+    # Índices para la paginación por cursor de /admin/logs (orden timestamp DESC, id DESC)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_status ON logs (status, timestamp, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_endpoint ON logs (endpoint, timestamp, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_client_ip ON logs (client_ip, timestamp, id)')
     conn.commit()
     conn.close()
 
+# Los logs se escriben en segundo plano y se confirman en lote
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_INTERVAL = 0.5  # segundos
+LOG_FULL_POLICY = 'block'  # 'block', 'drop' o 'count'
+
+LOG_WRITER = RequestLogWriter(
+    'logs.db',
+    max_queue=LOG_QUEUE_SIZE,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    full_policy=LOG_FULL_POLICY
+)
+
+# Respuestas guardadas por Idempotency-Key para que los reintentos del cliente no dupliquen órdenes
+IDEMPOTENCY_TTL = 24 * 3600  # segundos
+IDEMPOTENCY_LRU_SIZE = 10000
+IDEMPOTENCY_WAIT_TIMEOUT = 60  # segundos que espera un duplicado al request en curso
+IDEMPOTENCY_CLAIM_TTL = 60  # segundos que bloquea la clave un worker que se cae sin completarla
+IDEMPOTENCY_POLL_INTERVAL = 0.05  # segundos entre consultas de un duplicado que llegó a otro worker
+
+IDEMPOTENCY = idempotency.IdempotencyStore(
+    'logs.db',
+    ttl=IDEMPOTENCY_TTL,
+    lru_size=IDEMPOTENCY_LRU_SIZE,
+    wait_timeout=IDEMPOTENCY_WAIT_TIMEOUT,
+    claim_ttl=IDEMPOTENCY_CLAIM_TTL,
+    poll_interval=IDEMPOTENCY_POLL_INTERVAL
+)
+
+# Snapshots en caliente de logs.db (POST /admin/snapshot); en modo monolito también de las bases montadas
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_PAGES_PER_STEP = 256  # páginas copiadas por paso del backup
+SNAPSHOT_STEP_PAUSE = 0.001  # segundos entre pasos
+SNAPSHOT_KEEP = 7  # snapshots que se conservan por base
+
+SNAPSHOTS = SnapshotWriter(SNAPSHOT_DIR, pages_per_step=SNAPSHOT_PAGES_PER_STEP, step_pause=SNAPSHOT_STEP_PAUSE,
+                           keep=SNAPSHOT_KEEP)
+
+def snapshot_databases():
+    return ['logs.db'] + [path for mounted in MOUNTED_SERVICES.values()
+                          for path in mounted.module.snapshot_databases()]
+
+# Métricas expuestas en /metrics (formato de texto de Prometheus)
+METRICS = MetricsRegistry()
+REQUEST_LATENCY = METRICS.histogram(
+    'gateway_request_duration_seconds', 'Latency of requests served by the gateway', ('endpoint',))
+REQUEST_COUNT = METRICS.counter(
+    'gateway_requests_total', 'Requests served by the gateway', ('endpoint', 'status_code'))
+DOWNSTREAM_LATENCY = METRICS.histogram(
+    'gateway_downstream_request_duration_seconds', 'Latency of each call_service attempt', ('service', 'endpoint'))
+DOWNSTREAM_REQUESTS = METRICS.counter(
+    'gateway_downstream_requests_total', 'call_service attempts by outcome', ('service', 'endpoint', 'outcome'))
+DOWNSTREAM_RETRIES = METRICS.counter(
+    'gateway_downstream_retries_total', 'call_service retries after a failed attempt', ('service', 'endpoint'))
+DOWNSTREAM_CALLS = METRICS.counter(
+    'gateway_downstream_calls_total', 'call_service invocations (attempts / calls = retry amplification)',
+    ('service', 'endpoint'))
+DEADLINE_EXCEEDED = METRICS.counter(
+    'gateway_deadline_exceeded_total', 'Calls abandoned because the request deadline ran out', ('service', 'endpoint'))
+RETRY_BUDGET_EXHAUSTED = METRICS.counter(
+    'gateway_retry_budget_exhausted_total', 'Retries skipped because the retry budget was spent', ('service', 'endpoint'))
+
+def _breaker_states():
+    samples = []
+    for name, breaker in BREAKERS.items():
+        current = breaker.state
+        for state in ('closed', 'open', 'half_open'):
+            samples.append(((name, state), 1 if current == state else 0))
+    return samples
+
+METRICS.callback('gateway_circuit_breaker_state', 'Current circuit breaker state (1 = active)',
+                 _breaker_states, ('service', 'state'))
+METRICS.callback('gateway_circuit_breaker_rejections_total', 'Calls rejected while the circuit was open',
+                 lambda: [((name,), breaker.rejected) for name, breaker in BREAKERS.items()],
+                 ('service',), metric_type='counter')
+METRICS.callback('gateway_replica_outstanding_requests', 'Calls in flight per replica',
+                 lambda: [((name, replica.url), replica.outstanding)
+                          for name, balancer in BALANCERS.items() for replica in balancer.replicas],
+                 ('service', 'replica'))
+METRICS.callback('gateway_replica_ejected', 'Replica passively ejected after consecutive failures (1 = ejected)',
+                 lambda: [((name, r['url']), int(r['ejected']))
+                          for name, balancer in BALANCERS.items() for r in balancer.stats()['replicas']],
+                 ('service', 'replica'))
+METRICS.callback('gateway_request_log_queue_depth', 'Request-log rows waiting to be written',
+                 lambda: [((), LOG_WRITER.queue_depth())])
+METRICS.callback('gateway_request_log_dropped_total', 'Request-log rows dropped because the queue was full',
+                 lambda: [((), LOG_WRITER.dropped)], metric_type='counter')
+METRICS.callback('gateway_http_pool_checkouts_total', 'Connection pool checkouts (hit = reused connection)',
+                 lambda: [sample for name, pool in SESSION_POOLS.items()
+                          for sample in (((name, 'hit'), pool.hits), ((name, 'miss'), pool.misses))],
+                 ('service', 'result'), metric_type='counter')
+METRICS.callback('gateway_http_pool_wait_seconds_total', 'Time spent waiting for a free pooled connection',
+                 lambda: [((name,), pool.wait_seconds_total) for name, pool in SESSION_POOLS.items()],
+                 ('service',), metric_type='counter')
+METRICS.callback('gateway_retry_amplification', 'Downstream attempts per call_service invocation',
+                 lambda: [((), RETRY_BUDGET.stats()['amplification'] or 1)])
+METRICS.callback('gateway_idempotency_replays_total', 'Responses replayed from the idempotency store',
+                 lambda: [((), IDEMPOTENCY.replays)], metric_type='counter')
+
 def log_request(client_ip, endpoint, method, request_data, response_data, status):
-    conn = sqlite3.connect('logs.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO logs (timestamp, client_ip, endpoint, method, request_data, response_data, status)
-                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
-              (datetime.now().isoformat(), client_ip, endpoint, method, str(request_data), str(response_data), status))
-    conn.commit()
-    conn.close()
+    LOG_WRITER.write((datetime.now().isoformat(), client_ip, endpoint, method,
+                      str(request_data), str(response_data), status))
+
+def mount_services():
+    """Monolith mode: load the service apps into this process so call_service skips HTTP"""
+    if not MONOLITH_MODE:
+        return
+    for name, config in MONOLITH_SERVICES.items():
+        if name not in MOUNTED_SERVICES:
+            MOUNTED_SERVICES[name] = MountedService.load(name, config['path'], config['init'])
 
-@circuit(failure_threshold=5, expected_exception=Exception)
-def call_service(service_name, endpoint, method='POST', data=None, retries=3):
-    for attempt in range(retries):
+def call_service(service_name, endpoint, method='POST', data=None, retries=None, deadline=None):
+    breaker = BREAKERS[service_name]
+    balancer = BALANCERS[service_name]
+    mounted = MOUNTED_SERVICES.get(service_name)
+    replica = None
+    max_attempts = retries if retries is not None else RETRY_POLICY.max_attempts
+    deadline = deadline or Deadline(CALL_DEADLINE_SECONDS)
+    RETRY_BUDGET.record_request()
+    DOWNSTREAM_CALLS.inc(service_name, endpoint)
+    attempt = 0
+    while True:
         try:
-            url = f"{SERVICES[service_name]['url']}/{endpoint}"
-            headers = get_service_headers(service_name)
-            
-            logging.info(f"Calling {url} with method {method}")
-            
-            # Increased timeout from 5 to 15 seconds to handle slow responses
-            timeout = 15
+            # El timeout del intento se achica con lo que queda del deadline
+            timeout = RETRY_POLICY.timeout_for(deadline)
+            # Falla en el acto si el circuito de este servicio está abierto, antes de esperar
+            # una conexión del pool: un rechazo no debe quedarse esperando un PoolTimeout
+            breaker.before_call()
+            session = None
+            if mounted is None:
+                try:
+                    # Reutiliza una conexión abierta del pool en lugar de un handshake nuevo.
+                    # Esperar una libre (PoolTimeout) no es un fallo del servicio
+                    session = SESSION_POOLS[service_name].checkout()
+                except PoolTimeout:
+                    breaker.on_abandoned()
+                    raise
+            # Solo un error de transporte deja la conexión en estado dudoso
+            transport_error = False
+            try:
+                headers = get_service_headers(service_name)
+                if mounted is None:
+                    # Un reintento evita la réplica que acaba de fallar
+                    replica = balancer.acquire(exclude=replica)
+                    url = f"{replica.url}/{endpoint}"
+                    logging.info(f"Calling {url} with method {method}")
+                
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    if mounted is not None:
+                        # Modo monolito: el handler corre en este hilo, sin socket ni réplica
+                        status_code, body = mounted.request(method, endpoint, data, headers)
+                    else:
+                        response = session.request(method, url, json=data, headers=headers, timeout=timeout)
+                        status_code, body = response.status_code, response.text
+                    outcome = str(status_code)
+                except Exception:
+                    transport_error = True
+                    breaker.on_failure()
+                    raise
+                finally:
+                    if mounted is None:
+                        balancer.release(replica, outcome != 'error' and int(outcome) < 500)
+                    DOWNSTREAM_LATENCY.observe(time.perf_counter() - started, service_name, endpoint)
+                    DOWNSTREAM_REQUESTS.inc(service_name, endpoint, outcome)
+            finally:
+                if session is not None:
+                    SESSION_POOLS[service_name].checkin(session, discard=transport_error)
             
-            if method == 'GET':
-                response = requests.get(url, json=data, headers=headers, timeout=timeout)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=timeout)
+            logging.info(f"Response from {service_name}: {status_code}")
             
-            logging.info(f"Response from {service_name}: {response.status_code}")
+            # Un 4xx es una respuesta de negocio: el servicio está sano
+            if status_code >= 500:
+                breaker.on_failure()
+            else:
+                breaker.on_success()
             
-            if response.status_code == 200:
-                return response.json()
+            if status_code == 200:
+                return json.loads(body)
             else:
-                raise Exception(f"Service {service_name} returned {response.status_code}: {response.text}")
+                raise ServiceResponseError(service_name, status_code, body)
                 
+        except CircuitOpenError:
+            raise
+        except DeadlineExceeded:
+            DEADLINE_EXCEEDED.inc(service_name, endpoint)
+            raise
         except Exception as e:
             logging.warning(f"Attempt {attempt + 1} failed for {service_name}: {str(e)}")
-            if attempt == retries - 1:
+            attempt += 1
+            if attempt >= max_attempts or not is_retryable(e):
                 raise e
-            # Exponential backoff: 1s, 2s, 3s
-            wait_time = (attempt + 1) * 1
-            logging.info(f"Retrying in {wait_time} seconds...")
+            wait_time = RETRY_POLICY.backoff(attempt - 1)
+            if wait_time + RETRY_POLICY.min_attempt_timeout >= deadline.remaining():
+                DEADLINE_EXCEEDED.inc(service_name, endpoint)
+                raise e
+            if not RETRY_BUDGET.try_acquire_retry():
+                RETRY_BUDGET_EXHAUSTED.inc(service_name, endpoint)
+                logging.warning(f"Retry budget exhausted, not retrying {service_name}")
+                raise e
+            DOWNSTREAM_RETRIES.inc(service_name, endpoint)
+            logging.info(f"Retrying in {wait_time:.3f} seconds...")
             time.sleep(wait_time)
 
+def release_hold(hold_id):
+    """Give a stock hold back after a later step of the order failed"""
+    try:
+        # Liberar un hold es idempotente: se puede reintentar sin devolver stock de más
+        call_service('inventory', 'release_hold', 'POST', {'hold_id': hold_id})
+    except Exception as e:
+        # Si no se pudo, el hold vence solo y el reaper de inventory devuelve el stock
+        logging.error(f"Failed to release stock hold {hold_id}: {e}")
+
+def confirm_hold(hold_id):
+    """Keep the held stock once the order is paid"""
+    try:
+        call_service('inventory', 'confirm_hold', 'POST', {'hold_id': hold_id})
+    except Exception as e:
+        # La orden ya está cobrada: se mantiene, pero el stock vuelve al vencer el hold
+        logging.error(f"Failed to confirm stock hold {hold_id} of a paid order: {e}")
+
 @app.route('/process_order', methods=['POST'])
 def process_order():
     client_ip = request.remote_addr
     order_data = request.json
+    idempotency_key = request.headers.get('Idempotency-Key')
+    
+    if not idempotency_key:
+        result, status_code = execute_order(client_ip, order_data)
+        return jsonify(result), status_code
+    
+    outcome, stored = IDEMPOTENCY.begin(idempotency_key, idempotency.request_fingerprint(order_data))
+    if outcome == idempotency.REPLAY:
+        status_code, body = stored
+        log_request(client_ip, '/process_order', 'POST', order_data, body, 'REPLAYED')
+        return Response(body, status=status_code, mimetype='application/json',
+                        headers={'Idempotent-Replayed': 'true'})
+    if outcome == idempotency.CONFLICT:
+        return jsonify({'status': 'error', 'message': 'Idempotency-Key already used with a different request'}), 422
+    if outcome == idempotency.IN_PROGRESS:
+        return jsonify({'status': 'error', 'message': 'A request with this Idempotency-Key is still in progress'}), 409
+    
+    try:
+        result, status_code = execute_order(client_ip, order_data)
+    except Exception:
+        IDEMPOTENCY.complete(idempotency_key, store=False)
+        raise
+    # Solo se guardan los éxitos: un fallo se puede reintentar con la misma clave
+    IDEMPOTENCY.complete(idempotency_key, status_code, json.dumps(result), store=status_code == 200)
+    return jsonify(result), status_code
+
+def execute_order(client_ip, order_data):
+    """Run the hold -> order -> payment -> confirm chain; returns (body, status_code)"""
+    reservation = None
+    deadline = Deadline(ORDER_DEADLINE_SECONDS)
     
     try:
         # Log initial request
         log_request(client_ip, '/process_order', 'POST', order_data, None, 'STARTED')
         
-        # Call inventory service
-        inventory_result = call_service('inventory', 'check_inventory', 'POST', order_data)
-        if inventory_result.get('status') != 'ok':
-            raise Exception(f"Inventory error: {inventory_result.get('message')}")
+        # Apartar stock con TTL (reemplaza check_inventory + update_inventory)
+        hold_data = dict(order_data, ttl_seconds=ORDER_HOLD_TTL_SECONDS)
+        reservation = call_service('inventory', 'hold_inventory', 'POST', hold_data, deadline=deadline)
+        if reservation.get('status') != 'ok':
+            raise Exception(f"Inventory error: {reservation.get('message')}")
         
-        # Call order service
-        order_result = call_service('order', 'create_order', 'POST', order_data)
+        # Call order service (price falls back to the catalog price from the reservation)
+        order_payload = dict(order_data)
+        order_payload.setdefault('price', reservation.get('price'))
+        order_result = call_service('order', 'create_order', 'POST', order_payload, deadline=deadline)
         if order_result.get('status') != 'ok':
             raise Exception(f"Order error: {order_result.get('message')}")
         
@@ -126,14 +434,11 @@ def process_order():
         }
         
         # Call payment service
-        payment_result = call_service('payment', 'process_payment', 'POST', payment_data)
+        payment_result = call_service('payment', 'process_payment', 'POST', payment_data, deadline=deadline)
         if payment_result.get('status') != 'ok':
             raise Exception(f"Payment error: {payment_result.get('message')}")
         
-        # If all services succeeded, update inventory
-        update_result = call_service('inventory', 'update_inventory', 'POST', order_data)
-        if update_result.get('status') != 'ok':
-            raise Exception(f"Inventory update error: {update_result.get('message')}")
+        confirm_hold(reservation['hold_id'])
         
         response = {
             'status': 'success',
@@ -143,31 +448,279 @@ def process_order():
         }
         
         log_request(client_ip, '/process_order', 'POST', order_data, response, 'COMPLETED')
-        return jsonify(response), 200
+        return response, 200
         
     except Exception as e:
+        if reservation is not None and reservation.get('status') == 'ok':
+            release_hold(reservation['hold_id'])
         error_response = {
             'status': 'error',
             'message': str(e)
         }
         log_request(client_ip, '/process_order', 'POST', order_data, error_response, 'FAILED')
-        return jsonify(error_response), 400
+        return error_response, 400
+
+MAX_BATCH_ORDERS = 500
+
+@app.route('/process_orders', methods=['POST'])
+def process_orders():
+    """Process a batch of orders with one bulk call per downstream service.
+
+    Body: {"orders": [<same fields as /process_order>, ...]}. Every order gets
+    its own entry in "results", in the same position as in the request.
+    """
+    client_ip = request.remote_addr
+    batch_data = request.json or {}
+    orders = batch_data.get('orders') if isinstance(batch_data, dict) else batch_data
+
+    if not isinstance(orders, list) or not orders:
+        return jsonify({'status': 'error', 'message': 'Missing orders'}), 400
+    if len(orders) > MAX_BATCH_ORDERS:
+        return jsonify({'status': 'error', 'message': f'Too many orders (max {MAX_BATCH_ORDERS})'}), 400
+
+    log_request(client_ip, '/process_orders', 'POST', {'orders': len(orders)}, None, 'STARTED')
+    deadline = Deadline(BATCH_DEADLINE_SECONDS)
+    results = [None] * len(orders)
+
+    def fail(index, message):
+        results[index] = {'status': 'error', 'message': message}
+
+    # Agrupar por producto: una sola reserva por product_id
+    by_product = {}
+    for index, order in enumerate(orders):
+        if not isinstance(order, dict) or not order.get('product_id') or not order.get('quantity'):
+            fail(index, 'Missing product_id or quantity')
+            continue
+        product_id, quantity = order['product_id'], order['quantity']
+        # product_id es clave del dict y quantity se suma al devolver stock: tipos malos fallan solo esa orden
+        if (not isinstance(product_id, int) or isinstance(product_id, bool)
+                or not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0):
+            fail(index, 'product_id must be an integer and quantity a positive integer')
+            continue
+        by_product.setdefault(order['product_id'], []).append(index)
+
+    reserved = []  # índices con stock reservado
+    prices = {}
+    if by_product:
+        items = [{'product_id': product_id, 'quantities': [orders[i]['quantity'] for i in indexes]}
+                 for product_id, indexes in by_product.items()]
+        try:
+            reservation = call_service('inventory', 'reserve_inventory_bulk', 'POST', {'items': items}, deadline=deadline)
+            for item, product_result in zip(items, reservation['results']):
+                indexes = by_product[item['product_id']]
+                prices[item['product_id']] = product_result.get('price')
+                for index, accepted in zip(indexes, product_result['accepted']):
+                    if accepted:
+                        reserved.append(index)
+                    else:
+                        fail(index, f"Inventory error: {product_result.get('message', 'Insufficient inventory')}")
+        except Exception as e:
+            for indexes in by_product.values():
+                for index in indexes:
+                    fail(index, f"Inventory error: {e}")
+
+    # Crear todas las órdenes reservadas en una sola llamada
+    created = []
+    if reserved:
+        order_payloads = []
+        for index in reserved:
+            payload = dict(orders[index])
+            payload.setdefault('price', prices.get(payload['product_id']))
+            order_payloads.append(payload)
+        try:
+            order_results = call_service('order', 'create_orders', 'POST', {'orders': order_payloads},
+                                         deadline=deadline)['results']
+            for index, order_result in zip(reserved, order_results):
+                if order_result.get('status') == 'ok':
+                    created.append((index, order_result))
+                else:
+                    fail(index, f"Order error: {order_result.get('message')}")
+        except Exception as e:
+            for index in reserved:
+                fail(index, f"Order error: {e}")
+
+    # Cobrar todas las órdenes creadas en una sola llamada
+    if created:
+        payment_payloads = [{
+            'order_id': order_result.get('order_id'),
+            'total_price': order_result.get('total_price'),
+            'payment_method': orders[index].get('payment_method', 'credit_card')
+        } for index, order_result in created]
+        try:
+            payment_results = call_service('payment', 'process_payments', 'POST', {'payments': payment_payloads},
+                                           deadline=deadline)['results']
+            for (index, order_result), payment_result in zip(created, payment_results):
+                if payment_result.get('status') == 'ok':
+                    results[index] = {
+                        'status': 'success',
+                        'message': 'Order processed successfully',
+                        'order_id': order_result.get('order_id'),
+                        'payment_id': payment_result.get('payment_id')
+                    }
+                else:
+                    fail(index, f"Payment error: {payment_result.get('message')}")
+        except Exception as e:
+            for index, _ in created:
+                fail(index, f"Payment error: {e}")
+
+    # Devolver el stock de las órdenes reservadas que fallaron después
+    to_release = {}
+    for index in reserved:
+        if results[index]['status'] != 'success':
+            product_id = orders[index]['product_id']
+            to_release[product_id] = to_release.get(product_id, 0) + orders[index]['quantity']
+    if to_release:
+        release_data = {'items': [{'product_id': product_id, 'quantity': quantity}
+                                  for product_id, quantity in to_release.items()]}
+        try:
+            call_service('inventory', 'release_inventory', 'POST', release_data, retries=1)
+        except Exception as e:
+            logging.error(f"Failed to release reserved stock {release_data}: {e}")
+
+    succeeded = sum(1 for result in results if result['status'] == 'success')
+    response = {
+        'status': 'success' if succeeded == len(orders) else 'partial' if succeeded else 'error',
+        'processed': len(orders),
+        'succeeded': succeeded,
+        'failed': len(orders) - succeeded,
+        'results': results
+    }
+    log_request(client_ip, '/process_orders', 'POST', {'orders': len(orders)},
+                {key: response[key] for key in ('status', 'succeeded', 'failed')}, 'COMPLETED')
+    return jsonify(response), 200
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, endpoint)
+    REQUEST_COUNT.inc(endpoint, str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint without authentication"""
-    return jsonify({'status': 'ok', 'message': 'Gateway is running'}), 200
+    return jsonify(health_status()), 200
+
+def health_status():
+    breakers = {name: breaker.stats() for name, breaker in BREAKERS.items()}
+    return {
+        'status': 'ok',
+        'message': 'Gateway is running',
+        'mode': 'monolith' if MOUNTED_SERVICES else 'distributed',
+        'services': {name: stats['state'] != 'open' for name, stats in breakers.items()},
+        'circuit_breakers': breakers
+    }
+
+@app.route('/admin/pools', methods=['GET'])
+def get_pool_stats():
+    """Connection pool hit/miss and checkout-wait counters per service"""
+    return jsonify({name: pool.stats() for name, pool in SESSION_POOLS.items()})
+
+@app.route('/admin/balancers', methods=['GET'])
+def get_balancer_stats():
+    """Outstanding calls, effective weight and ejection state per replica"""
+    return jsonify({name: balancer.stats() for name, balancer in BALANCERS.items()})
+
+@app.route('/admin/log_writer', methods=['GET'])
+def get_log_writer_stats():
+    """Request-log queue depth and write/drop counters"""
+    return jsonify(LOG_WRITER.stats())
+
+@app.route('/admin/retries', methods=['GET'])
+def get_retry_stats():
+    """Retry budget usage and retry amplification"""
+    return jsonify(RETRY_BUDGET.stats())
+
+@app.route('/admin/idempotency', methods=['GET'])
+def get_idempotency_stats():
+    """Idempotency-Key replay/wait/conflict counters"""
+    return jsonify(IDEMPOTENCY.stats())
+
+@app.route('/admin/snapshot', methods=['GET', 'POST'])
+def manage_snapshots():
+    """POST copies logs.db (and the mounted services' databases) into SNAPSHOT_DIR without stopping writers"""
+    mode = 'monolith' if MOUNTED_SERVICES else 'distributed'
+    if request.method == 'GET':
+        return jsonify({**SNAPSHOTS.stats(), 'mode': mode, 'snapshots': SNAPSHOTS.list(snapshot_databases())})
+    try:
+        snapshots = SNAPSHOTS.take(snapshot_databases())
+    except SnapshotInProgress as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    except (sqlite3.Error, OSError) as e:
+        return jsonify({'status': 'error', 'message': f'Snapshot failed: {e}'}), 500
+    return jsonify({'status': 'ok', 'mode': mode, 'snapshots': snapshots})
+
+LOGS_PAGE_SIZE = 100
+LOGS_MAX_PAGE_SIZE = 1000
+
+def encode_logs_cursor(timestamp, log_id):
+    return base64.urlsafe_b64encode(f'{timestamp}|{log_id}'.encode()).decode()
+
+def decode_logs_cursor(cursor):
+    timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+    return timestamp, int(log_id)
 
 @app.route('/admin/logs', methods=['GET'])
 def get_logs():
-    """Get request logs - public endpoint for monitoring"""
+    """Get request logs, newest first - public endpoint for monitoring
+
+    Query params: status, endpoint, client_ip, since, until (ISO timestamps),
+    limit and cursor. The cursor for the next page is returned in the
+    X-Next-Cursor header; it is absent on the last page.
+    """
+    try:
+        logs, next_cursor = query_logs(request.args)
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({'status': 'error', 'message': 'Invalid limit or cursor'}), 400
+    
+    response = jsonify(logs)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def query_logs(args):
+    """Run the /admin/logs query for a mapping of query params; returns (rows, next_cursor)"""
+    filters = []
+    params = []
+    for column in ('status', 'endpoint', 'client_ip'):
+        value = args.get(column)
+        if value:
+            filters.append(f'{column} = ?')
+            params.append(value)
+    if args.get('since'):
+        filters.append('timestamp >= ?')
+        params.append(args['since'])
+    if args.get('until'):
+        filters.append('timestamp < ?')
+        params.append(args['until'])
+    
+    limit = min(max(int(args.get('limit', LOGS_PAGE_SIZE)), 1), LOGS_MAX_PAGE_SIZE)
+    if args.get('cursor'):
+        # Keyset: seguir justo después de la última fila de la página anterior
+        filters.append('(timestamp, id) < (?, ?)')
+        params.extend(decode_logs_cursor(args['cursor']))
+    
+    where = f"WHERE {' AND '.join(filters)}" if filters else ''
     conn = sqlite3.connect('logs.db')
     c = conn.cursor()
-    c.execute('SELECT * FROM logs ORDER BY timestamp DESC LIMIT 100')
+    c.execute(f'SELECT * FROM logs {where} ORDER BY timestamp DESC, id DESC LIMIT ?', params + [limit + 1])
     logs = c.fetchall()
     conn.close()
     
-    return jsonify([{
+    next_cursor = None
+    if len(logs) > limit:
+        last = logs[limit - 1]
+        next_cursor = encode_logs_cursor(last[1], last[0])
+    return [{
         'id': log[0],
         'timestamp': log[1],
         'client_ip': log[2],
@@ -176,8 +729,17 @@ def get_logs():
         'request_data': log[5],
         'response_data': log[6],
         'status': log[7]
-    } for log in logs])
+    } for log in logs[:limit]], next_cursor
+
+def start_background_tasks():
+    """Threads each gateway process needs: idempotency purge, token rotation and the log writer"""
+    IDEMPOTENCY.start()
+    CREDENTIALS.start()
+    LOG_WRITER.start()
 
 if __name__ == '__main__':
     init_logs_db()
+    IDEMPOTENCY.init_db()
+    start_background_tasks()
+    mount_services()
     app.run(port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,371 @@
+"""
+Gateway asyncio: mismo contrato que gateway.py (/process_order, /health, /admin/logs, /admin/snapshot)
+pero con E/S no bloqueante, así un solo proceso mantiene miles de órdenes en espera.
+
+Uso: python gateway_service/gateway_async.py [puerto]
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+import gateway
+import idempotency
+from breakers import CircuitOpenError
+from http_pool import PoolTimeout
+from retry import Deadline, DeadlineExceeded, ServiceResponseError, is_retryable
+
+# Sin hilos por request, el límite de conexiones puede ser mucho más alto que HTTP_POOL_SIZE
+ASYNC_CONNECTIONS_PER_SERVICE = 1000
+
+SESSIONS = {}
+# Un cupo por conexión del connector: se toma después del breaker y antes de la réplica, como el pool de gateway.py
+SLOTS = {}
+
+# Duplicados de una Idempotency-Key en este proceso esperan en el event loop, sin ocupar hilos
+IDEMPOTENCY_INFLIGHT = {}  # key -> (fingerprint, asyncio.Future del request dueño)
+# begin() solo bloquea si la clave la tiene otro proceso: hilos propios, acotados, fuera del executor por defecto
+IDEMPOTENCY_BEGIN_THREADS = 4
+IDEMPOTENCY_EXECUTOR = ThreadPoolExecutor(max_workers=IDEMPOTENCY_BEGIN_THREADS, thread_name_prefix='idempotency')
+# complete() va en su propio hilo: nunca espera detrás de un begin() bloqueado. Un hilo basta, SQLite serializa las escrituras
+IDEMPOTENCY_COMPLETE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='idempotency-complete')
+
+
+async def start_sessions(app):
+    for name in gateway.SERVICES:
+        # El límite es por servicio y se reparte entre todas sus réplicas
+        connector = aiohttp.TCPConnector(limit=ASYNC_CONNECTIONS_PER_SERVICE,
+                                         keepalive_timeout=gateway.HTTP_POOL_IDLE_TIMEOUT)
+        SESSIONS[name] = aiohttp.ClientSession(connector=connector)
+        SLOTS[name] = asyncio.Semaphore(ASYNC_CONNECTIONS_PER_SERVICE)
+
+
+async def close_sessions(app):
+    for session in SESSIONS.values():
+        await session.close()
+    SESSIONS.clear()
+    SLOTS.clear()
+
+
+@contextlib.asynccontextmanager
+async def connection_slot(service_name):
+    """Wait for a free connection to the service; PoolTimeout after HTTP_POOL_CHECKOUT_TIMEOUT"""
+    slots = SLOTS[service_name]
+    try:
+        await asyncio.wait_for(slots.acquire(), gateway.HTTP_POOL_CHECKOUT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"No free connection to {service_name} after {gateway.HTTP_POOL_CHECKOUT_TIMEOUT}s") from None
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+async def call_service(service_name, endpoint, method='POST', data=None, retries=None, deadline=None):
+    """Async twin of gateway.call_service: same breakers, retry policy, budget and metrics"""
+    breaker = gateway.BREAKERS[service_name]
+    balancer = gateway.BALANCERS[service_name]
+    mounted = gateway.MOUNTED_SERVICES.get(service_name)
+    replica = None
+    max_attempts = retries if retries is not None else gateway.RETRY_POLICY.max_attempts
+    deadline = deadline or Deadline(gateway.CALL_DEADLINE_SECONDS)
+    gateway.RETRY_BUDGET.record_request()
+    gateway.DOWNSTREAM_CALLS.inc(service_name, endpoint)
+    attempt = 0
+    while True:
+        try:
+            timeout = gateway.RETRY_POLICY.timeout_for(deadline)
+            # Un circuito abierto rechaza en el acto, sin esperar un cupo de conexión
+            breaker.before_call()
+            try:
+                # Esperar una conexión libre (PoolTimeout) no es un fallo del servicio ni de la réplica
+                async with connection_slot(service_name) if mounted is None else contextlib.nullcontext():
+                    headers = gateway.get_service_headers(service_name)
+                    if mounted is None:
+                        replica = balancer.acquire(exclude=replica)
+                        url = f"{replica.url}/{endpoint}"
+
+                    started = time.perf_counter()
+                    outcome = 'error'
+                    try:
+                        if mounted is not None:
+                            # Modo monolito: los handlers de Flask bloquean (SQLite), van al pool de hilos
+                            status_code, body = await asyncio.get_running_loop().run_in_executor(
+                                None, mounted.request, method, endpoint, data, headers)
+                        else:
+                            async with SESSIONS[service_name].request(method, url, json=data, headers=headers,
+                                                                      timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                                status_code = response.status
+                                body = await response.text()
+                        outcome = str(status_code)
+                    except Exception:
+                        breaker.on_failure()
+                        raise
+                    finally:
+                        if mounted is None:
+                            balancer.release(replica, outcome != 'error' and int(outcome) < 500)
+                        gateway.DOWNSTREAM_LATENCY.observe(time.perf_counter() - started, service_name, endpoint)
+                        gateway.DOWNSTREAM_REQUESTS.inc(service_name, endpoint, outcome)
+            except PoolTimeout:
+                breaker.on_abandoned()
+                raise
+
+            if status_code >= 500:
+                breaker.on_failure()
+            else:
+                breaker.on_success()
+
+            if status_code == 200:
+                return json.loads(body)
+            raise ServiceResponseError(service_name, status_code, body)
+
+        except CircuitOpenError:
+            raise
+        except DeadlineExceeded:
+            gateway.DEADLINE_EXCEEDED.inc(service_name, endpoint)
+            raise
+        except Exception as e:
+            logging.warning(f"Attempt {attempt + 1} failed for {service_name}: {e!r}")
+            attempt += 1
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            wait_time = gateway.RETRY_POLICY.backoff(attempt - 1)
+            if wait_time + gateway.RETRY_POLICY.min_attempt_timeout >= deadline.remaining():
+                gateway.DEADLINE_EXCEEDED.inc(service_name, endpoint)
+                raise
+            if not gateway.RETRY_BUDGET.try_acquire_retry():
+                gateway.RETRY_BUDGET_EXHAUSTED.inc(service_name, endpoint)
+                raise
+            gateway.DOWNSTREAM_RETRIES.inc(service_name, endpoint)
+            await asyncio.sleep(wait_time)
+
+
+async def log_request(*args):
+    """gateway.log_request off the event loop: with the 'block' policy a full queue waits"""
+    await asyncio.get_running_loop().run_in_executor(None, gateway.log_request, *args)
+
+
+async def release_hold(hold_id):
+    try:
+        await call_service('inventory', 'release_hold', 'POST', {'hold_id': hold_id})
+    except Exception as e:
+        logging.error(f"Failed to release stock hold {hold_id}: {e}")
+
+
+async def confirm_hold(hold_id):
+    try:
+        await call_service('inventory', 'confirm_hold', 'POST', {'hold_id': hold_id})
+    except Exception as e:
+        logging.error(f"Failed to confirm stock hold {hold_id} of a paid order: {e}")
+
+
+async def execute_order(client_ip, order_data):
+    """Same hold -> order -> payment -> confirm chain as gateway.execute_order"""
+    reservation = None
+    deadline = Deadline(gateway.ORDER_DEADLINE_SECONDS)
+
+    try:
+        await log_request(client_ip, '/process_order', 'POST', order_data, None, 'STARTED')
+
+        hold_data = dict(order_data, ttl_seconds=gateway.ORDER_HOLD_TTL_SECONDS)
+        reservation = await call_service('inventory', 'hold_inventory', 'POST', hold_data, deadline=deadline)
+        if reservation.get('status') != 'ok':
+            raise Exception(f"Inventory error: {reservation.get('message')}")
+
+        order_payload = dict(order_data)
+        order_payload.setdefault('price', reservation.get('price'))
+        order_result = await call_service('order', 'create_order', 'POST', order_payload, deadline=deadline)
+        if order_result.get('status') != 'ok':
+            raise Exception(f"Order error: {order_result.get('message')}")
+
+        payment_data = {
+            'order_id': order_result.get('order_id'),
+            'total_price': order_result.get('total_price'),
+            'payment_method': order_data.get('payment_method', 'credit_card')
+        }
+        payment_result = await call_service('payment', 'process_payment', 'POST', payment_data, deadline=deadline)
+        if payment_result.get('status') != 'ok':
+            raise Exception(f"Payment error: {payment_result.get('message')}")
+
+        await confirm_hold(reservation['hold_id'])
+
+        response = {
+            'status': 'success',
+            'message': 'Order processed successfully',
+            'order_id': order_result.get('order_id'),
+            'payment_id': payment_result.get('payment_id')
+        }
+        await log_request(client_ip, '/process_order', 'POST', order_data, response, 'COMPLETED')
+        return response, 200
+
+    except Exception as e:
+        if reservation is not None and reservation.get('status') == 'ok':
+            await release_hold(reservation['hold_id'])
+        error_response = {'status': 'error', 'message': str(e)}
+        await log_request(client_ip, '/process_order', 'POST', order_data, error_response, 'FAILED')
+        return error_response, 400
+
+
+async def begin_idempotent(key, fingerprint):
+    """IDEMPOTENCY.begin for the event loop: one caller per key at a time, the rest await it here"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + gateway.IDEMPOTENCY.wait_timeout
+    while key in IDEMPOTENCY_INFLIGHT:
+        owner_fingerprint, done = IDEMPOTENCY_INFLIGHT[key]
+        if owner_fingerprint != fingerprint:
+            return idempotency.CONFLICT, None
+        try:
+            await asyncio.wait_for(asyncio.shield(done), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            return idempotency.IN_PROGRESS, None
+        # El dueño terminó: volver a mirar (si no guardó nada, este request toma la clave)
+
+    IDEMPOTENCY_INFLIGHT[key] = (fingerprint, loop.create_future())
+    try:
+        outcome, stored = await loop.run_in_executor(IDEMPOTENCY_EXECUTOR, gateway.IDEMPOTENCY.begin, key, fingerprint)
+    except BaseException:
+        release_idempotent(key)
+        raise
+    if outcome != idempotency.EXECUTE:
+        release_idempotent(key)
+    return outcome, stored
+
+
+async def complete_idempotent(key, *args, **kwargs):
+    """IDEMPOTENCY.complete (a SQLite write) off the event loop"""
+    await asyncio.get_running_loop().run_in_executor(
+        IDEMPOTENCY_COMPLETE_EXECUTOR, functools.partial(gateway.IDEMPOTENCY.complete, key, *args, **kwargs))
+
+
+def release_idempotent(key):
+    """Wake the local duplicates waiting on ``key``"""
+    inflight = IDEMPOTENCY_INFLIGHT.pop(key, None)
+    if inflight is not None and not inflight[1].done():
+        inflight[1].set_result(None)
+
+
+async def process_order(request):
+    client_ip = request.remote
+    try:
+        order_data = await request.json()
+    except ValueError:  # json.JSONDecodeError es subclase
+        return web.json_response({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+    idempotency_key = request.headers.get('Idempotency-Key')
+
+    if not idempotency_key:
+        result, status_code = await execute_order(client_ip, order_data)
+        return web.json_response(result, status=status_code)
+
+    outcome, stored = await begin_idempotent(idempotency_key, idempotency.request_fingerprint(order_data))
+    if outcome == idempotency.REPLAY:
+        status_code, body = stored
+        await log_request(client_ip, '/process_order', 'POST', order_data, body, 'REPLAYED')
+        return web.Response(text=body, status=status_code, content_type='application/json',
+                            headers={'Idempotent-Replayed': 'true'})
+    if outcome == idempotency.CONFLICT:
+        return web.json_response({'status': 'error', 'message': 'Idempotency-Key already used with a different request'},
+                                 status=422)
+    if outcome == idempotency.IN_PROGRESS:
+        return web.json_response({'status': 'error', 'message': 'A request with this Idempotency-Key is still in progress'},
+                                 status=409)
+
+    try:
+        result, status_code = await execute_order(client_ip, order_data)
+    except BaseException:
+        try:
+            await complete_idempotent(idempotency_key, store=False)
+        finally:
+            release_idempotent(idempotency_key)
+        raise
+    try:
+        await complete_idempotent(idempotency_key, status_code, json.dumps(result), store=status_code == 200)
+    finally:
+        # Los duplicados locales se despiertan recién con la respuesta guardada
+        release_idempotent(idempotency_key)
+    return web.json_response(result, status=status_code)
+
+
+async def health_check(request):
+    return web.json_response(gateway.health_status())
+
+
+async def get_logs(request):
+    try:
+        logs, next_cursor = await asyncio.get_running_loop().run_in_executor(
+            None, gateway.query_logs, request.query)
+    except (ValueError, UnicodeDecodeError):
+        return web.json_response({'status': 'error', 'message': 'Invalid limit or cursor'}, status=400)
+    response = web.json_response(logs)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+async def manage_snapshots(request):
+    mode = 'monolith' if gateway.MOUNTED_SERVICES else 'distributed'
+    if request.method == 'GET':
+        # list() lee el directorio y los .sha256: E/S de disco, fuera del event loop
+        snapshots = await asyncio.get_running_loop().run_in_executor(
+            None, gateway.SNAPSHOTS.list, gateway.snapshot_databases())
+        return web.json_response({**gateway.SNAPSHOTS.stats(), 'mode': mode, 'snapshots': snapshots})
+    try:
+        # El backup por pasos bloquea: va al pool de hilos para no frenar el event loop
+        snapshots = await asyncio.get_running_loop().run_in_executor(
+            None, gateway.SNAPSHOTS.take, gateway.snapshot_databases())
+    except gateway.SnapshotInProgress as e:
+        return web.json_response({'status': 'error', 'message': str(e)}, status=409)
+    except (sqlite3.Error, OSError) as e:
+        return web.json_response({'status': 'error', 'message': f'Snapshot failed: {e}'}, status=500)
+    return web.json_response({'status': 'ok', 'mode': mode, 'snapshots': snapshots})
+
+
+async def metrics(request):
+    return web.Response(text=gateway.METRICS.render(), content_type='text/plain', charset='utf-8')
+
+
+@web.middleware
+async def record_request_metrics(request, handler):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await handler(request)
+        status_code = response.status
+        return response
+    except web.HTTPException as e:
+        status_code = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        endpoint = resource.canonical if resource is not None else 'unmatched'
+        gateway.REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint)
+        gateway.REQUEST_COUNT.inc(endpoint, str(status_code))
+
+
+def create_app():
+    app = web.Application(middlewares=[record_request_metrics])
+    app.router.add_post('/process_order', process_order)
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/admin/logs', get_logs)
+    app.router.add_get('/admin/snapshot', manage_snapshots)
+    app.router.add_post('/admin/snapshot', manage_snapshots)
+    app.router.add_get('/metrics', metrics)
+    app.on_startup.append(start_sessions)
+    app.on_cleanup.append(close_sessions)
+    return app
+
+
+if __name__ == '__main__':
+    gateway.init_logs_db()
+    gateway.IDEMPOTENCY.init_db()
+    gateway.start_background_tasks()
+    gateway.mount_services()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    web.run_app(create_app(), host='127.0.0.1', port=port, access_log=None)
@@ -0,0 +1,152 @@
+"""
+Pool de sesiones HTTP keep-alive para las llamadas del gateway a los servicios
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PoolTimeout(Exception):
+    """No session became available within the checkout timeout."""
+
+
+class ServiceSessionPool:
+    """Bounded pool of keep-alive ``requests.Session`` objects for one downstream.
+
+    Every session owns a single persistent connection. Checking out an idle
+    session reuses its socket (a hit); opening a new session costs a fresh TCP
+    handshake (a miss). Sessions idle for longer than ``idle_timeout`` are
+    closed instead of reused, and when ``pool_size`` sessions are busy callers
+    wait up to ``checkout_timeout`` seconds for one to be returned.
+
+    When the service runs several replicas, ``hosts`` lets each session keep
+    one connection per replica instead of reconnecting whenever the balancer
+    switches host.
+    """
+
+    def __init__(self, name, pool_size=10, idle_timeout=30.0, checkout_timeout=5.0, hosts=1):
+        self.name = name
+        self.pool_size = pool_size
+        self.hosts = hosts
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (session, last_used); la derecha es la más reciente
+        self._open = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.discarded = 0
+        self.waits = 0
+        self.wait_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.hosts, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _close_expired(self, now):
+        # Las sesiones más viejas quedan a la izquierda
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            session, _ = self._idle.popleft()
+            session.close()
+            self._open -= 1
+            self.expired += 1
+
+    def _record_wait(self, started):
+        if started is None:
+            return
+        waited = time.monotonic() - started
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def checkout(self):
+        started = None
+        with self._cond:
+            while True:
+                self._close_expired(time.monotonic())
+                if self._idle:
+                    session, _ = self._idle.pop()
+                    self.hits += 1
+                    self._record_wait(started)
+                    return session
+                if self._open < self.pool_size:
+                    self._open += 1
+                    self.misses += 1
+                    self._record_wait(started)
+                    break
+                if started is None:
+                    started = time.monotonic()
+                    self.waits += 1
+                remaining = self.checkout_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.wait_timeouts += 1
+                    self._record_wait(started)
+                    raise PoolTimeout(f"No idle connection to {self.name} after {self.checkout_timeout}s")
+                self._cond.wait(remaining)
+
+        try:
+            return self._new_session()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, session, discard=False):
+        with self._cond:
+            if discard:
+                session.close()
+                self._open -= 1
+                self.discarded += 1
+            else:
+                self._idle.append((session, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        """Check out a session; it is discarded if the block raises."""
+        session = self.checkout()
+        ok = False
+        try:
+            yield session
+            ok = True
+        finally:
+            self.checkin(session, discard=not ok)
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                session, _ = self._idle.popleft()
+                session.close()
+                self._open -= 1
+
+    def stats(self):
+        with self._cond:
+            checkouts = self.hits + self.misses
+            return {
+                'pool_size': self.pool_size,
+                'idle_timeout': self.idle_timeout,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / checkouts, 4) if checkouts else None,
+                'expired': self.expired,
+                'discarded': self.discarded,
+                'waits': self.waits,
+                'wait_timeouts': self.wait_timeouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+            }
@@ -0,0 +1,244 @@
+"""
+Almacén de claves Idempotency-Key: LRU en memoria respaldado por SQLite
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+REPLAY = 'replay'
+EXECUTE = 'execute'
+CONFLICT = 'conflict'
+IN_PROGRESS = 'in_progress'
+
+PENDING = 0  # status_code de una clave reclamada que todavía no terminó
+
+
+def request_fingerprint(data):
+    """Stable hash of a JSON request body"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class _InFlight:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.event = threading.Event()
+
+
+class IdempotencyStore:
+    """Remembers the response of each Idempotency-Key for ``ttl`` seconds.
+
+    ``begin`` returns one of:
+
+    * ``(REPLAY, (status_code, body))``: the key already completed; send ``body`` as is
+    * ``(EXECUTE, None)``: the caller owns the key and must call ``complete``
+    * ``(CONFLICT, None)``: the key was used with a different request body
+    * ``(IN_PROGRESS, None)``: another request holds the key and did not finish in time
+
+    A duplicate that arrives while the first request is running waits for it
+    instead of executing again. Recent results live in an LRU so replays never
+    touch SQLite; the table keeps them across restarts.
+
+    Before executing, the owner claims the key with a pending row in the
+    table (``INSERT ... ON CONFLICT``), so every process sharing ``db_path``
+    agrees on a single owner. A duplicate in the same process waits on an
+    event; one in another process polls the row every ``poll_interval``
+    seconds. A claim whose owner died without completing lapses after
+    ``claim_ttl`` seconds.
+    """
+
+    def __init__(self, db_path, ttl=24 * 3600, lru_size=10000, wait_timeout=60, purge_interval=300,
+                 claim_ttl=60, poll_interval=0.05):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self.wait_timeout = wait_timeout
+        self.purge_interval = purge_interval
+        self.claim_ttl = claim_ttl
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # key -> (fingerprint, status_code, body, expires_at)
+        self._inflight = {}
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+
+        self.replays = 0
+        self.executions = 0
+        self.waited = 0
+        self.conflicts = 0
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys
+                     (key TEXT PRIMARY KEY,
+                      fingerprint TEXT NOT NULL,
+                      status_code INTEGER NOT NULL,
+                      response TEXT NOT NULL,
+                      expires_at REAL NOT NULL) WITHOUT ROWID''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys (expires_at)')
+        conn.commit()
+        conn.close()
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        return self._conn
+
+    def _remember(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.lru_size:
+            self._cache.popitem(last=False)
+
+    def _cached(self, key, now):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[3] <= now:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _claim(self, key, fingerprint, now):
+        """Insert a pending row for ``key``; returns None if claimed, else the live row already there"""
+        with self._db_lock:
+            conn = self._db()
+            with conn:
+                # Una fila vencida (completada o de un dueño caído) se puede volver a reclamar
+                claimed = conn.execute(
+                    'INSERT INTO idempotency_keys VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, '
+                    'status_code = excluded.status_code, response = excluded.response, expires_at = excluded.expires_at '
+                    'WHERE idempotency_keys.expires_at <= ?',
+                    (key, fingerprint, PENDING, '', now + self.claim_ttl, now)).rowcount
+                if claimed:
+                    return None
+                row = conn.execute('SELECT fingerprint, status_code, response, expires_at FROM idempotency_keys '
+                                   'WHERE key = ?', (key,)).fetchone()
+        return tuple(row)
+
+    def begin(self, key, fingerprint):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            now = time.time()
+            with self._lock:
+                entry = self._cached(key, now)
+                if entry is None:
+                    flight = self._inflight.get(key)
+                    if flight is None:
+                        flight = self._inflight[key] = _InFlight(fingerprint)
+                        owner = True
+                    else:
+                        owner = False
+
+            if entry is None and owner:
+                # Primera vez en memoria: reclamar en la tabla, que comparten todos los workers
+                row = self._claim(key, fingerprint, now)
+                if row is None:
+                    self.executions += 1
+                    return EXECUTE, None
+                with self._lock:
+                    if row[1] != PENDING:
+                        self._remember(key, row)
+                    self._inflight.pop(key, None)
+                flight.event.set()
+                if row[1] != PENDING:
+                    entry = row
+                else:
+                    # La tiene otro proceso: consultar la fila hasta que la complete o la suelte
+                    if row[0] != fingerprint:
+                        self.conflicts += 1
+                        return CONFLICT, None
+                    self.waited += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return IN_PROGRESS, None
+                    time.sleep(min(self.poll_interval, remaining))
+                    continue
+
+            if entry is not None:
+                if entry[0] != fingerprint:
+                    self.conflicts += 1
+                    return CONFLICT, None
+                self.replays += 1
+                return REPLAY, (entry[1], entry[2])
+
+            if flight.fingerprint != fingerprint:
+                self.conflicts += 1
+                return CONFLICT, None
+            self.waited += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not flight.event.wait(remaining):
+                return IN_PROGRESS, None
+            # El dueño terminó: volver a mirar (si no guardó nada, este request toma la clave)
+
+    def complete(self, key, status_code=None, body=None, store=True):
+        """Release ``key``; with ``store`` the response is kept for replays."""
+        entry = None
+        with self._lock:
+            flight = self._inflight.get(key)
+        if store:
+            fingerprint = flight.fingerprint if flight else ''
+            entry = (fingerprint, status_code, body, time.time() + self.ttl)
+        try:
+            with self._db_lock:
+                conn = self._db()
+                with conn:
+                    if entry is not None:
+                        conn.execute('INSERT OR REPLACE INTO idempotency_keys VALUES (?, ?, ?, ?, ?)',
+                                     (key,) + entry)
+                    else:
+                        # Sin respuesta que guardar: soltar el reclamo para que el próximo intento ejecute
+                        conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND status_code = ?', (key, PENDING))
+        except sqlite3.Error as e:
+            logging.error(f"Failed to persist idempotency key {key}: {e}")
+        with self._lock:
+            if entry is not None:
+                self._remember(key, entry)
+            flight = self._inflight.pop(key, None)
+        if flight is not None:
+            flight.event.set()
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self._cache.items() if entry[3] <= now]:
+                del self._cache[key]
+        with self._db_lock:
+            conn = self._db()
+            with conn:
+                deleted = conn.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (now,)).rowcount
+        return deleted
+
+    def _run(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                self.purge_expired()
+            except sqlite3.Error as e:
+                logging.error(f"Idempotency purge failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='idempotency-purge', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'in_flight': len(self._inflight),
+                'replays': self.replays,
+                'executions': self.executions,
+                'waited': self.waited,
+                'conflicts': self.conflicts,
+            }
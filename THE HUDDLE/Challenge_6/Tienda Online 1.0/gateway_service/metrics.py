@@ -0,0 +1,145 @@
+"""
+Métricas del gateway en formato de texto de Prometheus
+"""
+import bisect
+import math
+import threading
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    labels = list(labels)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def log_linear_bounds(lowest, highest, sub_buckets):
+    """Bucket upper bounds with ``sub_buckets`` evenly spaced steps per power of two.
+
+    Like an HDR histogram, the relative error stays constant over the whole
+    range: with 4 sub-buckets every bound is ~19% above the previous one.
+    """
+    bounds = []
+    octave = lowest
+    while octave < highest:
+        for step in range(sub_buckets):
+            bounds.append(round(octave * (1 + step / sub_buckets), 9))
+        octave *= 2
+    bounds.append(round(octave, 9))
+    return bounds
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f'{self.name}{_format_labels(zip(self.labelnames, labelvalues))} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Latency histogram with log-linear buckets, cheap enough for every request"""
+
+    def __init__(self, name, documentation, labelnames=(), lowest=0.0005, highest=60.0, sub_buckets=4):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = log_linear_bounds(lowest, highest, sub_buckets)
+        self._series = {}  # labelvalues -> [counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labelvalues, (list(s[0]), s[1], s[2])) for labelvalues, s in self._series.items())
+        for labelvalues, (counts, total_sum, total_count) in items:
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.bounds + [math.inf], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", _format_value(float(bound)))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total_sum)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {total_count}')
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples are read from ``collect()`` at scrape time.
+
+    ``collect`` returns a list of ``(labelvalues, value)`` tuples.
+    """
+
+    def __init__(self, name, documentation, collect, labelnames=(), metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for labelvalues, value in self.collect():
+            lines.append(f'{self.name}{_format_labels(zip(self.labelnames, labelvalues))} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def callback(self, name, documentation, collect, labelnames=(), metric_type='gauge'):
+        return self.register(CallbackMetric(name, documentation, collect, labelnames, metric_type))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,175 @@
+"""
+Escritor asíncrono de la tabla logs: agrupa filas y las confirma en lote
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+INSERT_LOG_SQL = '''INSERT INTO logs (timestamp, client_ip, endpoint, method, request_data, response_data, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+_STOP = object()
+
+
+class RequestLogWriter:
+    """Background writer fed by a bounded queue.
+
+    Rows are committed with ``executemany`` once ``batch_size`` rows are pending
+    or the oldest pending row is ``flush_interval`` seconds old, whichever comes
+    first. ``full_policy`` decides what ``write`` does when the queue is full:
+
+    * ``block``: wait for space (up to ``block_timeout`` seconds, then count it as dropped)
+    * ``drop``: discard the oldest queued row to make room for the new one
+    * ``count``: discard the new row, only incrementing the ``dropped`` counter
+
+    ``stop`` drains everything still queued before returning; rows written
+    after that are inserted synchronously so nothing is lost on shutdown.
+    """
+
+    POLICIES = ('block', 'drop', 'count')
+
+    def __init__(self, db_path, max_queue=10000, batch_size=200, flush_interval=0.5,
+                 full_policy='block', block_timeout=None):
+        if full_policy not in self.POLICIES:
+            raise ValueError(f"full_policy must be one of {self.POLICIES}")
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def write(self, row):
+        """Queue one row for ``INSERT_LOG_SQL``; returns False if it was dropped."""
+        if self._stopped:
+            self._write_sync(row)
+            return True
+        try:
+            if self.full_policy == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            elif self.full_policy == 'drop':
+                while True:
+                    try:
+                        self._queue.put_nowait(row)
+                        break
+                    except queue.Full:
+                        try:
+                            self._queue.get_nowait()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _flush(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(INSERT_LOG_SQL, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.failed += len(batch)
+            logging.error(f"Failed to write {len(batch)} request logs: {e}")
+
+    def _run(self):
+        conn = self._connect()
+        batch = []
+        flush_at = None
+        try:
+            while True:
+                timeout = self.flush_interval if flush_at is None else max(0.0, flush_at - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    # Vaciar lo que quede en la cola antes de salir
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not _STOP:
+                            batch.append(item)
+                    if batch:
+                        self._flush(conn, batch)
+                    return
+
+                if item is not None:
+                    batch.append(item)
+                    if flush_at is None:
+                        flush_at = time.monotonic() + self.flush_interval
+
+                if batch and (len(batch) >= self.batch_size or time.monotonic() >= flush_at):
+                    self._flush(conn, batch)
+                    batch = []
+                    flush_at = None
+        finally:
+            conn.close()
+
+    def _write_sync(self, row):
+        conn = self._connect()
+        try:
+            self._flush(conn, [row])
+        finally:
+            conn.close()
+
+    def stop(self, timeout=10):
+        """Drain the queue and stop the writer thread."""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'full_policy': self.full_policy,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+        }
@@ -0,0 +1,121 @@
+"""
+Política de reintentos: backoff exponencial con jitter, deadline por request y presupuesto global
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before the next attempt could start."""
+
+
+class ServiceResponseError(Exception):
+    """A downstream service answered with a non-200 status."""
+
+    def __init__(self, service_name, status_code, text):
+        super().__init__(f"Service {service_name} returned {status_code}: {text}")
+        self.status_code = status_code
+
+
+def is_retryable(exc):
+    """Only transport errors and 5xx responses are worth another attempt."""
+    if isinstance(exc, ServiceResponseError):
+        return exc.status_code >= 500
+    return not isinstance(exc, DeadlineExceeded)
+
+
+class Deadline:
+    """Absolute time budget shared by every hop of one gateway request"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class RetryPolicy:
+    """Computes the retry schedule; the caller does the waiting.
+
+    Keeping the policy free of sleeps lets the threaded gateway wait with
+    ``time.sleep`` and an asyncio gateway with ``asyncio.sleep``.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=2.0, attempt_timeout=5.0,
+                 min_attempt_timeout=0.05):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.min_attempt_timeout = min_attempt_timeout
+
+    def timeout_for(self, deadline):
+        """Per-attempt timeout, shrunk to what is left of the deadline"""
+        remaining = deadline.remaining()
+        if remaining < self.min_attempt_timeout:
+            raise DeadlineExceeded(f"Deadline exceeded ({remaining:.3f}s left)")
+        return min(self.attempt_timeout, remaining)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff before attempt ``attempt + 1``"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RetryBudget:
+    """Caps retries at ``ratio`` of the requests seen over the last ``window_seconds``.
+
+    ``min_retries_per_second`` keeps retries possible at low traffic. When a
+    downstream degrades, the budget runs out instead of multiplying the load on it.
+    """
+
+    def __init__(self, ratio=0.2, min_retries_per_second=1, window_seconds=10):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._buckets = deque()  # [second, requests, retries]
+
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def _bucket(self, now):
+        second = int(now)
+        horizon = second - self.window_seconds
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self):
+        with self._lock:
+            self._bucket(time.monotonic())[1] += 1
+            self.requests += 1
+
+    def try_acquire_retry(self):
+        with self._lock:
+            bucket = self._bucket(time.monotonic())
+            requests = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+            allowed = self.ratio * requests + self.min_retries_per_second * self.window_seconds
+            if retries + 1 > allowed:
+                self.exhausted += 1
+                return False
+            bucket[2] += 1
+            self.retries += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'budget_exhausted': self.exhausted,
+                'amplification': round((self.requests + self.retries) / self.requests, 4) if self.requests else None,
+            }
@@ -0,0 +1,177 @@
+"""
+Change feed del catálogo: log monotónico de cambios de productos para que los consumidores apliquen deltas
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+CHANGE_FIELDS = ['seq', 'id', 'op', 'name', 'quantity', 'price', 'changed_at']
+
+# Segundos Unix con fracción (unixepoch('subsec') recién existe en SQLite 3.42)
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+class ChangeFeed:
+    """``product_changes`` log, the triggers that fill it and the thread that wakes its readers.
+
+    Triggers on ``products`` append one entry per insert, update or delete
+    in the same transaction as the change. The log therefore never misses a
+    committed write and never shows a rolled-back one, whatever code path
+    or process made it. ``seq`` is AUTOINCREMENT, so it only grows, even
+    after pruning, and has no gaps other than pruned entries. Each entry
+    carries the product's state after the change, so replaying one twice is
+    harmless and a consumer only needs the newest entry per id.
+
+    Sharded products keep their stock in the slot files, which no trigger
+    sees. Their writers call ``mark`` instead, and the background thread
+    appends one entry per marked product with the slots' total at that
+    moment. A burst of takes costs one row, and the slots never wait on
+    inventory.db's write lock.
+
+    The same thread reads the newest seq every ``poll_interval`` seconds
+    and wakes long-poll and SSE readers. Every ``prune_interval`` seconds it
+    keeps only the newest ``retention`` entries; a reader that falls behind
+    them has to reload the catalog.
+    """
+
+    def __init__(self, retention=100000, poll_interval=0.1, prune_interval=60):
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.prune_interval = prune_interval
+
+        self._cond = threading.Condition()
+        self._marked = set()
+        self._last_seq = 0
+        self._next_prune = 0.0
+        self._thread = None
+
+        self.flushed = 0
+        self.pruned = 0
+        self.waits = 0
+
+    def create_table(self, c):
+        """Create the log and its triggers; needs ``products`` and ``sharded_products``"""
+        c.execute('''CREATE TABLE IF NOT EXISTS product_changes
+                     (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                      product_id INTEGER NOT NULL,
+                      op TEXT NOT NULL,
+                      name TEXT,
+                      quantity INTEGER,
+                      price REAL,
+                      changed_at REAL NOT NULL)''')
+        # Los productos repartidos tienen quantity = 0 en products: sus cambios llegan por mark()
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS product_changes_insert AFTER INSERT ON products
+                      WHEN NEW.id NOT IN (SELECT product_id FROM sharded_products)
+                      BEGIN
+                          INSERT INTO product_changes (product_id, op, name, quantity, price, changed_at)
+                          VALUES (NEW.id, '{INSERT}', NEW.name, NEW.quantity, NEW.price, {_NOW});
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS product_changes_update AFTER UPDATE ON products
+                      WHEN NEW.id NOT IN (SELECT product_id FROM sharded_products)
+                           AND (NEW.name IS NOT OLD.name OR NEW.quantity IS NOT OLD.quantity
+                                OR NEW.price IS NOT OLD.price OR NEW.id IS NOT OLD.id)
+                      BEGIN
+                          INSERT INTO product_changes (product_id, op, name, quantity, price, changed_at)
+                          VALUES (NEW.id, '{UPDATE}', NEW.name, NEW.quantity, NEW.price, {_NOW});
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS product_changes_delete AFTER DELETE ON products
+                      BEGIN
+                          INSERT INTO product_changes (product_id, op, changed_at)
+                          VALUES (OLD.id, '{DELETE}', {_NOW});
+                      END''')
+
+    def last_seq(self, c):
+        """Newest seq ever assigned (0 before the first change), pruned or not"""
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'product_changes'")
+        row = c.fetchone()
+        return row[0] if row else 0
+
+    def read(self, c, since, limit):
+        """Changes after ``since``, oldest first, at most ``limit``.
+
+        Run it inside a read transaction. Returns None when the log no
+        longer reaches ``since``: the entries right after it were pruned, or
+        ``since`` is ahead of the log (a different or restored database).
+        """
+        c.execute("SELECT seq, product_id, op, name, quantity, price, changed_at FROM product_changes "
+                  "WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit))
+        rows = c.fetchall()
+        if rows:
+            # Sin rollbacks que dejen huecos en AUTOINCREMENT, un salto solo puede ser poda
+            return [dict(zip(CHANGE_FIELDS, row)) for row in rows] if rows[0][0] == since + 1 else None
+        return [] if since == self.last_seq(c) else None
+
+    def append(self, c, product_id, op, name, quantity, price):
+        """Log a change no trigger sees (sharded stock) inside the caller's transaction"""
+        c.execute(f"INSERT INTO product_changes (product_id, op, name, quantity, price, changed_at) "
+                  f"VALUES (?, ?, ?, ?, ?, {_NOW})", (product_id, op, name, quantity, price))
+        with self._cond:
+            self.flushed += 1
+
+    def mark(self, *product_ids):
+        """Sharded stock changed: the thread logs these products' totals on its next pass"""
+        with self._cond:
+            self._marked.update(product_ids)
+
+    def take_marked(self):
+        with self._cond:
+            marked, self._marked = self._marked, set()
+        return marked
+
+    def prune(self, c):
+        """Drop entries older than the newest ``retention`` once per ``prune_interval``"""
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.prune_interval
+        c.execute("DELETE FROM product_changes WHERE seq <= ?", (self.last_seq(c) - self.retention,))
+        with self._cond:
+            self.pruned += c.rowcount
+
+    def wait(self, since, timeout):
+        """Block until a change after ``since`` is logged; False on timeout.
+
+        Without the thread running nobody tracks the newest seq, so it only
+        sleeps one ``poll_interval`` and lets the caller read again.
+        """
+        with self._cond:
+            self.waits += 1
+            if self._thread is None:
+                self._cond.wait(min(timeout, self.poll_interval))
+                return True
+            return self._cond.wait_for(lambda: self._last_seq > since, timeout)
+
+    def _run(self, step):
+        while True:
+            try:
+                last_seq = step()
+                with self._cond:
+                    if last_seq != self._last_seq:
+                        self._last_seq = last_seq
+                        self._cond.notify_all()
+            except sqlite3.Error as e:
+                logging.error(f"Change feed pass failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def start(self, step):
+        """Run ``step`` (flush marks, prune, return the newest seq) every ``poll_interval`` seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(step,), name='change-feed', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'retention': self.retention,
+                'poll_interval': self.poll_interval,
+                'last_seq': self._last_seq,
+                'marked': len(self._marked),
+                'flushed': self.flushed,
+                'pruned': self.pruned,
+                'waits': self.waits,
+            }
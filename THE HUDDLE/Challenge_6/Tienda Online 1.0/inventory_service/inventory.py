@@ -1,7 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import sqlite3
-import jwt
 import datetime
+import csv
+import io
+import json
+import math
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.token_cache import ServiceTokenVerifier
+from common.sqlite_pool import SQLiteConnectionPool, register_pool_routes
+from common.snapshot import register_snapshot_routes
+from product_cache import ProductCache
+from stock_shards import ShardedStock
+from stock_holds import StockHolds, CONFIRMED, RELEASED
+from change_feed import ChangeFeed, UPDATE
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'inventory-secret-key'
@@ -9,6 +23,171 @@ app.config['SECRET_KEY'] = 'inventory-secret-key'
 # Lista de servicios autorizados
 AUTHORIZED_SERVICES = ['gateway', 'admin']
 
+# Tokens ya verificados: evita decodificar la firma en cada request
+TOKENS = ServiceTokenVerifier(app.config['SECRET_KEY'], AUTHORIZED_SERVICES, cache_size=1024)
+authenticate = TOKENS.authenticate
+
+# Conexiones SQLite persistentes: WAL, synchronous=NORMAL, mmap y caché de sentencias preparadas
+DB_POOL = SQLiteConnectionPool('inventory.db')
+
+# /check_inventory lee de memoria; las escrituras de este proceso actualizan la caché al confirmar.
+# Cambios hechos por otros procesos (réplicas, workers, ediciones directas) los trae un hilo que recarga
+# la tabla cada PRODUCT_CACHE_MAX_STALENESS; los requests nunca esperan esa recarga
+PRODUCT_CACHE_MAX_STALENESS = 1.0  # segundos; None = nunca recargar (solo con un único proceso)
+
+def load_products(product_ids=None):
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        if product_ids is None:
+            c.execute("SELECT id, name, quantity, price FROM products")
+        else:
+            product_ids = list(product_ids)
+            placeholders = ','.join('?' * len(product_ids))
+            c.execute(f"SELECT id, name, quantity, price FROM products WHERE id IN ({placeholders})", product_ids)
+        products = c.fetchall()
+    return with_sharded_totals(products)
+
+PRODUCT_CACHE = ProductCache(load_products, max_staleness=PRODUCT_CACHE_MAX_STALENESS)
+
+# Stock repartido en slots (un archivo SQLite por slot) para productos muy disputados.
+# Con STOCK_SHARDING activo, POST /products/shard mueve el stock de un producto a los slots
+STOCK_SHARDING = False
+STOCK_SHARD_SLOTS = 8
+
+STOCK = ShardedStock('inventory_stock_{slot}.db', slots=STOCK_SHARD_SLOTS, busy_timeout=DB_POOL.busy_timeout)
+
+def sharded_product_ids():
+    if not STOCK_SHARDING:
+        return set()
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT product_id FROM sharded_products")
+        product_ids = {row[0] for row in c.fetchall()}
+    return product_ids
+
+def is_sharded(product_id):
+    if not STOCK_SHARDING:
+        return False
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM sharded_products WHERE product_id = ?", (product_id,))
+        sharded = c.fetchone() is not None
+    return sharded
+
+def is_positive_int(value):
+    # bool es subclase de int: True no es una cantidad
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def with_sharded_totals(products):
+    """Replace products.quantity (0 for sharded products) with the sum of their slots"""
+    sharded = sharded_product_ids()
+    if not sharded:
+        return products
+    totals = STOCK.totals()
+    return [(p[0], p[1], totals.get(p[0], 0), p[3]) if p[0] in sharded else p for p in products]
+
+def take_sharded(product_id, quantity):
+    """Decrement a sharded product without taking inventory.db's write lock.
+
+    Returns (name, remaining, price) or None if the product does not exist; remaining
+    is None when the slots did not hold enough stock.
+    """
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT name, price FROM products WHERE id = ?", (product_id,))
+        row = c.fetchone()
+    if not row:
+        return None
+    product_name, price = row
+    if not STOCK.take(product_id, quantity):
+        return product_name, None, price
+    # Delta y no valor absoluto: los slots se confirman por separado y los totales no se ordenan
+    with PRODUCT_CACHE.write():
+        PRODUCT_CACHE.adjust(product_id, -quantity)
+    CHANGES.mark(product_id)
+    return product_name, STOCK.total(product_id), price
+
+# Change feed: cada cambio de products queda en product_changes y se sirve en GET /products/changes
+CHANGE_FEED_RETENTION = 100000  # cambios que se guardan; quien se atrasa más recarga GET /products
+CHANGE_FEED_POLL_INTERVAL = 0.1  # segundos entre lecturas del último seq (y volcado de productos repartidos)
+CHANGE_FEED_PRUNE_INTERVAL = 60  # segundos
+CHANGE_FEED_PAGE_SIZE = 1000
+CHANGE_FEED_MAX_PAGE_SIZE = 10000
+CHANGE_FEED_MAX_WAIT = 30  # segundos máximos de un long-poll
+CHANGE_FEED_HEARTBEAT = 15  # segundos entre comentarios keep-alive del stream SSE
+
+CHANGES = ChangeFeed(retention=CHANGE_FEED_RETENTION, poll_interval=CHANGE_FEED_POLL_INTERVAL,
+                     prune_interval=CHANGE_FEED_PRUNE_INTERVAL)
+
+def change_feed_step():
+    """One pass of the change feed thread: log marked sharded products, prune; returns the newest seq"""
+    marked = CHANGES.take_marked()
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        try:
+            if marked:
+                totals = STOCK.totals()
+                placeholders = ','.join('?' * len(marked))
+                c.execute(f"SELECT id, name, price FROM products WHERE id IN ({placeholders}) "
+                          f"AND id IN (SELECT product_id FROM sharded_products)", list(marked))
+                # Un producto borrado ya dejó su 'delete' por trigger
+                for product_id, name, price in c.fetchall():
+                    CHANGES.append(c, product_id, UPDATE, name, totals.get(product_id, 0), price)
+            CHANGES.prune(c)
+            conn.commit()
+            return CHANGES.last_seq(c)
+        except sqlite3.Error:
+            conn.rollback()
+            CHANGES.mark(*marked)
+            raise
+
+def start_change_feed():
+    CHANGES.start(change_feed_step)
+
+# Holds: stock apartado mientras la orden se cobra; si nadie confirma antes del TTL el reaper lo devuelve
+HOLD_DEFAULT_TTL = 30  # segundos
+HOLD_MAX_TTL = 600  # segundos
+HOLD_REAP_INTERVAL = 1.0  # segundos entre pasadas del reaper
+HOLD_REAP_BATCH = 200  # holds vencidos por transacción
+HOLD_RETENTION = 3600  # segundos que se guardan holds terminados para contestar reintentos
+
+HOLDS = StockHolds(default_ttl=HOLD_DEFAULT_TTL, max_ttl=HOLD_MAX_TTL, reap_interval=HOLD_REAP_INTERVAL,
+                   reap_batch=HOLD_REAP_BATCH, retention=HOLD_RETENTION)
+
+def give_back(product_id, quantity):
+    """Return stock of a finished hold to the slots and the cache (products.quantity goes in the transaction)"""
+    if is_sharded(product_id):
+        STOCK.give(product_id, quantity)
+        CHANGES.mark(product_id)
+    PRODUCT_CACHE.adjust(product_id, quantity)
+
+def reap_expired_holds():
+    """Give back the stock of one batch of expired holds; returns how many expired"""
+    sharded = sharded_product_ids()
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect(isolation_level=None) as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            expired = HOLDS.expire_batch(c)
+            for product_id, quantity in expired:
+                if product_id not in sharded:
+                    c.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (quantity, product_id))
+            c.execute("COMMIT")
+        for product_id, quantity in expired:
+            if product_id in sharded:
+                STOCK.give(product_id, quantity)
+                CHANGES.mark(product_id)
+            PRODUCT_CACHE.adjust(product_id, quantity)
+    return len(expired)
+
+def start_hold_reaper():
+    HOLDS.start(reap_expired_holds)
+
+# Bases que copia POST /snapshot (backup online por pasos, comprimido con gzip y con su .sha256)
+def snapshot_databases():
+    # Los slots son archivos aparte: se copian uno por uno, no en la misma foto que inventory.db
+    return ['inventory.db'] + ([pool.path for pool in STOCK.pools] if STOCK_SHARDING else [])
+
 def init_inventory_db():
     conn = sqlite3.connect('inventory.db')
     c = conn.cursor()
@@ -30,28 +209,17 @@ def init_inventory_db():
         c.execute("INSERT INTO products (name, quantity, price) VALUES (?, ?, ?)", 
                  ("Monitor", 15, 299.99))
     
+    c.execute('''CREATE TABLE IF NOT EXISTS sharded_products
+                 (product_id INTEGER PRIMARY KEY)''')
+    
+    HOLDS.create_table(c)
+    CHANGES.create_table(c)
+    
     conn.commit()
     conn.close()
-
-def verify_token(token):
-    try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        if payload.get('service') in AUTHORIZED_SERVICES:
-            return payload
-        return None
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
-
-def authenticate():
-    token = request.headers.get('Authorization')
-    if not token:
-        return None
     
-    # Remove 'Bearer ' prefix if present
-    token = token.replace('Bearer ', '')
-    return verify_token(token)
+    if STOCK_SHARDING:
+        STOCK.init_db()
 
 @app.route('/check_inventory', methods=['POST'])
 def check_inventory():
@@ -66,11 +234,7 @@ def check_inventory():
     if not product_id or not quantity:
         return jsonify({'status': 'error', 'message': 'Missing product_id or quantity'}), 400
     
-    conn = sqlite3.connect('inventory.db')
-    c = conn.cursor()
-    c.execute("SELECT name, quantity, price FROM products WHERE id = ?", (product_id,))
-    result = c.fetchone()
-    conn.close()
+    result = PRODUCT_CACHE.get(product_id)
     
     if not result:
         return jsonify({'status': 'error', 'message': 'Product not found'}), 404
@@ -102,21 +266,348 @@ def update_inventory():
     
     if not product_id or not quantity:
         return jsonify({'status': 'error', 'message': 'Missing product_id or quantity'}), 400
+    # Validar antes de escribir: un error después del UPDATE deja el stock descontado y el request falla
+    if not isinstance(product_id, int) or not is_positive_int(quantity):
+        return jsonify({'status': 'error', 'message': 'product_id must be an integer and quantity a positive integer'}), 400
     
-    conn = sqlite3.connect('inventory.db')
-    c = conn.cursor()
-    c.execute("UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?", 
-              (quantity, product_id, quantity))
-    
-    if c.rowcount == 0:
-        conn.close()
-        return jsonify({'status': 'error', 'message': 'Failed to update inventory - insufficient quantity or product not found'}), 400
+    if is_sharded(product_id):
+        result = take_sharded(product_id, quantity)
+        if not result or result[1] is None:
+            return jsonify({'status': 'error', 'message': 'Failed to update inventory - insufficient quantity or product not found'}), 400
+        return jsonify({'status': 'ok', 'message': 'Inventory updated successfully'})
     
-    conn.commit()
-    conn.close()
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?", 
+                      (quantity, product_id, quantity))
+            
+            if c.rowcount == 0:
+                return jsonify({'status': 'error', 'message': 'Failed to update inventory - insufficient quantity or product not found'}), 400
+            
+            conn.commit()
+        PRODUCT_CACHE.adjust(product_id, -quantity)
     
     return jsonify({'status': 'ok', 'message': 'Inventory updated successfully'})
 
+@app.route('/reserve_inventory', methods=['POST'])
+def reserve_inventory():
+    """Check and decrement stock in a single transaction, returning the price"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    data = request.json
+    product_id = data.get('product_id')
+    quantity = data.get('quantity')
+
+    if not product_id or not quantity:
+        return jsonify({'status': 'error', 'message': 'Missing product_id or quantity'}), 400
+    if not is_positive_int(quantity):
+        return jsonify({'status': 'error', 'message': 'quantity must be a positive integer'}), 400
+
+    if is_sharded(product_id):
+        result = take_sharded(product_id, quantity)
+        if not result:
+            return jsonify({'status': 'error', 'message': 'Product not found'}), 404
+        product_name, available_quantity, price = result
+        if available_quantity is None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Insufficient inventory. Available: {STOCK.total(product_id)}, Requested: {quantity}'
+            }), 400
+        return jsonify({
+            'status': 'ok',
+            'message': 'Inventory reserved',
+            'product_name': product_name,
+            'reserved_quantity': quantity,
+            'remaining_quantity': available_quantity,
+            'price': price
+        })
+
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            # El UPDATE toma el lock de escritura, así que el SELECT ve el stock ya reservado
+            c.execute("UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?",
+                      (quantity, product_id, quantity))
+            reserved = c.rowcount == 1
+            c.execute("SELECT name, quantity, price FROM products WHERE id = ?", (product_id,))
+            result = c.fetchone()
+            conn.commit()
+        if result:
+            PRODUCT_CACHE.put(product_id, *result)
+
+    if not result:
+        return jsonify({'status': 'error', 'message': 'Product not found'}), 404
+
+    product_name, available_quantity, price = result
+    if not reserved:
+        return jsonify({
+            'status': 'error',
+            'message': f'Insufficient inventory. Available: {available_quantity}, Requested: {quantity}'
+        }), 400
+
+    return jsonify({
+        'status': 'ok',
+        'message': 'Inventory reserved',
+        'product_name': product_name,
+        'reserved_quantity': quantity,
+        'remaining_quantity': available_quantity,
+        'price': price
+    })
+
+@app.route('/hold_inventory', methods=['POST'])
+def hold_inventory():
+    """Take stock out for ttl_seconds under a hold id; /confirm_hold keeps it, /release_hold returns it"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    data = request.json
+    product_id = data.get('product_id')
+    quantity = data.get('quantity')
+
+    if not product_id or not quantity:
+        return jsonify({'status': 'error', 'message': 'Missing product_id or quantity'}), 400
+    if not is_positive_int(quantity):
+        return jsonify({'status': 'error', 'message': 'quantity must be a positive integer'}), 400
+    try:
+        ttl = HOLDS.ttl(data.get('ttl_seconds'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    hold_id = None
+    if is_sharded(product_id):
+        result = take_sharded(product_id, quantity)
+        if result and result[1] is not None:
+            with DB_POOL.connect() as conn:
+                try:
+                    hold_id, expires_at = HOLDS.add(conn.cursor(), product_id, quantity, ttl)
+                    conn.commit()
+                except sqlite3.Error:
+                    with PRODUCT_CACHE.write():
+                        give_back(product_id, quantity)
+                    raise
+    else:
+        with PRODUCT_CACHE.write():
+            with DB_POOL.connect() as conn:
+                c = conn.cursor()
+                # Descuento y hold en la misma transacción: no hay stock apartado sin su hold ni al revés
+                c.execute("UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?",
+                          (quantity, product_id, quantity))
+                if c.rowcount == 1:
+                    hold_id, expires_at = HOLDS.add(c, product_id, quantity, ttl)
+                c.execute("SELECT name, quantity, price FROM products WHERE id = ?", (product_id,))
+                result = c.fetchone()
+                conn.commit()
+            if result:
+                PRODUCT_CACHE.put(product_id, *result)
+
+    if not result:
+        return jsonify({'status': 'error', 'message': 'Product not found'}), 404
+
+    product_name, available_quantity, price = result
+    if hold_id is None:
+        if available_quantity is None:
+            available_quantity = STOCK.total(product_id)
+        return jsonify({
+            'status': 'error',
+            'message': f'Insufficient inventory. Available: {available_quantity}, Requested: {quantity}'
+        }), 400
+
+    return jsonify({
+        'status': 'ok',
+        'message': 'Inventory held',
+        'hold_id': hold_id,
+        'expires_at': expires_at,
+        'product_name': product_name,
+        'reserved_quantity': quantity,
+        'remaining_quantity': available_quantity,
+        'price': price
+    })
+
+def finish_hold(status):
+    """Shared body of /confirm_hold and /release_hold"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    hold_id = (request.json or {}).get('hold_id')
+    if not hold_id:
+        return jsonify({'status': 'error', 'message': 'Missing hold_id'}), 400
+
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            result = HOLDS.finish(c, hold_id, status)
+            if result and result[0] and status == RELEASED:
+                c.execute("UPDATE products SET quantity = quantity + ? WHERE id = ? AND id NOT IN "
+                          "(SELECT product_id FROM sharded_products)", (result[3], result[2]))
+            conn.commit()
+        if result and result[0] and status == RELEASED:
+            give_back(result[2], result[3])
+
+    if not result:
+        return jsonify({'status': 'error', 'message': 'Hold not found'}), 404
+    changed, current, product_id, quantity = result
+    if current != status:
+        # Un hold vencido ya devolvió (o devolverá) su stock: la orden no puede quedárselo
+        return jsonify({'status': 'error', 'message': f'Hold already {current}', 'hold_status': current}), 409
+    return jsonify({
+        'status': 'ok',
+        'message': f"Hold {status}" if changed else f"Hold already {status}",
+        'hold_id': hold_id,
+        'product_id': product_id,
+        'quantity': quantity
+    })
+
+@app.route('/confirm_hold', methods=['POST'])
+def confirm_hold():
+    """Keep a hold's stock sold; safe to retry"""
+    return finish_hold(CONFIRMED)
+
+@app.route('/release_hold', methods=['POST'])
+def release_hold():
+    """Give a hold's stock back; safe to retry"""
+    return finish_hold(RELEASED)
+
+@app.route('/holds', methods=['GET'])
+def get_hold_stats():
+    """Active holds and units, plus confirm/release/expiry counters"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*), COALESCE(SUM(quantity), 0), MIN(expires_at) FROM stock_holds WHERE status = 'held'")
+        active, units, next_expiry = c.fetchone()
+    return jsonify({**HOLDS.stats(), 'active': active, 'held_units': units, 'next_expiry': next_expiry})
+
+@app.route('/reserve_inventory_bulk', methods=['POST'])
+def reserve_inventory_bulk():
+    """Reserve stock for many orders with one statement per product.
+
+    Body: {"items": [{"product_id": 1, "quantities": [2, 1, 5]}, ...]}
+    Quantities of the same product are accepted in order while stock lasts.
+    """
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    items = (request.json or {}).get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'status': 'error', 'message': 'Missing items'}), 400
+
+    sharded = sharded_product_ids()
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect(isolation_level=None) as conn:
+            c = conn.cursor()
+            results = []
+            try:
+                # Lock de escritura desde el primer SELECT: nadie cambia el stock entre lectura y UPDATE
+                c.execute("BEGIN IMMEDIATE")
+                for item in items:
+                    product_id = item.get('product_id')
+                    quantities = item.get('quantities') or []
+                    c.execute("SELECT name, quantity, price FROM products WHERE id = ?", (product_id,))
+                    row = c.fetchone()
+                    if not row:
+                        results.append({'product_id': product_id, 'accepted': [False] * len(quantities),
+                                        'message': 'Product not found'})
+                        continue
+
+                    product_name, available_quantity, price = row
+                    accepted = []
+                    reserved = 0
+                    if product_id in sharded:
+                        # Los slots tienen sus propias transacciones: se descuenta orden por orden
+                        for quantity in quantities:
+                            ok = is_positive_int(quantity) and STOCK.take(product_id, quantity)
+                            accepted.append(ok)
+                            if ok:
+                                reserved += quantity
+                        available_quantity = STOCK.total(product_id) + reserved
+                    else:
+                        for quantity in quantities:
+                            ok = is_positive_int(quantity) and reserved + quantity <= available_quantity
+                            accepted.append(ok)
+                            if ok:
+                                reserved += quantity
+                        if reserved:
+                            c.execute("UPDATE products SET quantity = quantity - ? WHERE id = ?", (reserved, product_id))
+
+                    results.append({
+                        'product_id': product_id,
+                        'product_name': product_name,
+                        'price': price,
+                        'accepted': accepted,
+                        'reserved_quantity': reserved,
+                        'remaining_quantity': available_quantity - reserved
+                    })
+                c.execute("COMMIT")
+            except sqlite3.Error as e:
+                c.execute("ROLLBACK")
+                return jsonify({'status': 'error', 'message': f'Reservation failed: {e}'}), 500
+        for result in results:
+            if 'product_name' not in result:
+                continue
+            if result['product_id'] in sharded:
+                PRODUCT_CACHE.adjust(result['product_id'], -result['reserved_quantity'])
+                if result['reserved_quantity']:
+                    CHANGES.mark(result['product_id'])
+            else:
+                PRODUCT_CACHE.put(result['product_id'], result['product_name'],
+                                  result['remaining_quantity'], result['price'])
+
+    return jsonify({'status': 'ok', 'results': results})
+
+@app.route('/release_inventory', methods=['POST'])
+def release_inventory():
+    """Give back stock taken by /reserve_inventory (compensation).
+
+    Accepts a single {"product_id", "quantity"} or {"items": [...]} of them.
+    """
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Body must be an object'}), 400
+    items = data.get('items', [data])
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({'status': 'error', 'message': 'items must be a list of objects'}), 400
+
+    # Se valida todo el lote antes de escribir: una devolución es todo o nada
+    for item in items:
+        if not item.get('product_id') or not item.get('quantity'):
+            return jsonify({'status': 'error', 'message': 'Missing product_id or quantity'}), 400
+        if not isinstance(item['product_id'], int) or not is_positive_int(item['quantity']):
+            return jsonify({'status': 'error', 'message': 'product_id must be an integer and quantity a positive integer'}), 400
+
+    sharded = sharded_product_ids()
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            for item in items:
+                if item['product_id'] in sharded:
+                    continue
+                c.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (item['quantity'], item['product_id']))
+
+                if c.rowcount == 0:
+                    conn.rollback()
+                    return jsonify({'status': 'error', 'message': f"Product not found: {item['product_id']}"}), 404
+
+            conn.commit()
+        for item in items:
+            if item['product_id'] in sharded:
+                STOCK.give(item['product_id'], item['quantity'])
+                CHANGES.mark(item['product_id'])
+            PRODUCT_CACHE.adjust(item['product_id'], item['quantity'])
+
+    return jsonify({'status': 'ok', 'message': 'Inventory released'})
+
 @app.route('/products', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def manage_products():
     auth = authenticate()
@@ -124,48 +615,407 @@ def manage_products():
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
     
     if request.method == 'GET':
-        conn = sqlite3.connect('inventory.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM products")
-        products = c.fetchall()
-        conn.close()
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            # El seq se lee antes: la tabla ya incluye todo cambio hasta él, así se sigue el feed desde ahí
+            change_seq = CHANGES.last_seq(c)
+            c.execute("SELECT * FROM products")
+            products = with_sharded_totals(c.fetchall())
         #(1, "Laptop", 10, 999.99)
-        return jsonify([{
+        response = jsonify([{
             'id': p[0],
             'name': p[1],
             'quantity': p[2],
             'price': p[3]
         } for p in products])
+        response.headers['X-Change-Seq'] = str(change_seq)
+        return response
     
     elif request.method == 'POST':
         data = request.json
-        conn = sqlite3.connect('inventory.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO products (name, quantity, price) VALUES (?, ?, ?)",
-                 (data['name'], data['quantity'], data['price']))
-        conn.commit()
-        conn.close()
+        with PRODUCT_CACHE.write():
+            with DB_POOL.connect() as conn:
+                c = conn.cursor()
+                c.execute("INSERT INTO products (name, quantity, price) VALUES (?, ?, ?)",
+                         (data['name'], data['quantity'], data['price']))
+                product_id = c.lastrowid
+                conn.commit()
+            PRODUCT_CACHE.put(product_id, data['name'], data['quantity'], data['price'])
         return jsonify({'status': 'ok', 'message': 'Product created'})
     
     elif request.method == 'PUT':
         data = request.json
-        conn = sqlite3.connect('inventory.db')
-        c = conn.cursor()
-        c.execute("UPDATE products SET name=?, quantity=?, price=? WHERE id=?",
-                 (data['name'], data['quantity'], data['price'], data['id']))
-        conn.commit()
-        conn.close()
+        sharded = is_sharded(data['id'])
+        with PRODUCT_CACHE.write():
+            with DB_POOL.connect() as conn:
+                c = conn.cursor()
+                # Un producto repartido guarda su stock en los slots, no en products.quantity
+                c.execute("UPDATE products SET name=?, quantity=?, price=? WHERE id=?",
+                         (data['name'], 0 if sharded else data['quantity'], data['price'], data['id']))
+                updated = c.rowcount == 1
+                conn.commit()
+            if updated and sharded:
+                STOCK.set(data['id'], data['quantity'])
+                CHANGES.mark(data['id'])
+            if updated:
+                PRODUCT_CACHE.put(data['id'], data['name'], data['quantity'], data['price'])
         return jsonify({'status': 'ok', 'message': 'Product updated'})
     
     elif request.method == 'DELETE':
         product_id = request.args.get('id')
-        conn = sqlite3.connect('inventory.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM products WHERE id=?", (product_id,))
-        conn.commit()
-        conn.close()
+        sharded = is_sharded(product_id)
+        with PRODUCT_CACHE.write():
+            with DB_POOL.connect() as conn:
+                c = conn.cursor()
+                c.execute("DELETE FROM products WHERE id=?", (product_id,))
+                c.execute("DELETE FROM sharded_products WHERE product_id=?", (product_id,))
+                conn.commit()
+            if sharded:
+                STOCK.drain(product_id)
+            PRODUCT_CACHE.remove(product_id)
         return jsonify({'status': 'ok', 'message': 'Product deleted'})
 
+# Carga y descarga masiva del catálogo
+IMPORT_CHUNK_SIZE = 1000  # filas por transacción (un executemany y un commit)
+IMPORT_MAX_ERRORS = 1000  # errores por fila que se devuelven; el resto solo se cuenta
+EXPORT_CHUNK_SIZE = 1000  # filas por lectura de SQLite y por escritura al socket
+PRODUCT_FIELDS = ['id', 'name', 'quantity', 'price']
+
+def parse_int(value, field):
+    if isinstance(value, str):
+        try:
+            value = int(value.strip())
+        except ValueError:
+            raise ValueError(f'{field} must be an integer')
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{field} must be an integer')
+    return value
+
+def parse_product_row(row):
+    """Validate an imported row; returns (id or None, name, quantity, price) or raises ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    product_id = row.get('id')
+    product_id = None if product_id in (None, '') else parse_int(product_id, 'id')
+    name = row.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('name must be a non-empty string')
+    quantity = parse_int(row.get('quantity'), 'quantity')
+    price = row.get('price')
+    try:
+        price = float(price.strip()) if isinstance(price, str) else price
+    except ValueError:
+        price = None
+    if isinstance(price, bool) or not isinstance(price, (int, float)) or not math.isfinite(price):
+        raise ValueError('price must be a number')
+    if quantity < 0 or price < 0:
+        raise ValueError('quantity and price must not be negative')
+    return product_id, name.strip(), quantity, float(price)
+
+def read_import_rows(import_format, lines):
+    """Yield (line_number, row) from an NDJSON or CSV body; row is None for unparseable lines"""
+    if import_format == 'csv':
+        reader = csv.DictReader(lines)
+        missing = {'name', 'quantity', 'price'} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV header is missing: {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+@app.route('/products/import', methods=['POST'])
+def import_products():
+    """Upsert products from a streamed NDJSON or CSV body in chunked transactions.
+
+    Rows are {"name", "quantity", "price"} plus an optional "id" (an existing id is
+    overwritten, as with PUT). ?format=csv or Content-Type text/csv selects CSV with a
+    header row; otherwise one JSON object per line. Bad rows are reported by line and
+    skipped; the rest are imported.
+    """
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    import_format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if import_format not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': 'format must be ndjson or csv'}), 400
+
+    # Se lee el cuerpo línea a línea: nunca está entero en memoria. utf-8-sig quita el BOM de Excel
+    lines = (line.decode('utf-8-sig') for line in request.stream)
+    sharded = sharded_product_ids()
+    imported = 0
+    failed = 0
+    errors = []
+
+    def fail(line, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({'line': line, 'message': message})
+
+    def flush(chunk):
+        nonlocal imported
+        with DB_POOL.connect() as conn:
+            try:
+                conn.executemany('''INSERT INTO products (id, name, quantity, price) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(id) DO UPDATE SET
+                                    name = excluded.name, quantity = excluded.quantity, price = excluded.price''',
+                                 [values for _, values in chunk])
+                conn.commit()
+                imported += len(chunk)
+            except sqlite3.Error as e:
+                conn.rollback()
+                for line, _ in chunk:
+                    fail(line, f'Import failed: {e}')
+
+    chunk = []
+    try:
+        for line, row in read_import_rows(import_format, lines):
+            try:
+                values = parse_product_row(row) if row is not None else None
+            except ValueError as e:
+                fail(line, str(e))
+                continue
+            if values is None:
+                fail(line, 'Invalid JSON')
+            elif values[0] in sharded:
+                fail(line, 'Product stock is sharded; update it with PUT /products')
+            else:
+                chunk.append((line, values))
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    flush(chunk)
+                    chunk = []
+        if chunk:
+            flush(chunk)
+    except (ValueError, csv.Error) as e:
+        # Cabecera CSV inválida o cuerpo que no es UTF-8: lo leído hasta ahí se importa igual
+        if chunk:
+            flush(chunk)
+        if not imported and not failed:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        fail(None, str(e))
+    finally:
+        # Una recarga al final en vez de tocar la caché fila por fila
+        if imported:
+            PRODUCT_CACHE.reload()
+
+    return jsonify({
+        'status': 'ok' if not failed else 'partial' if imported else 'error',
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors)
+    })
+
+@app.route('/products/export', methods=['GET'])
+def export_products():
+    """Stream the catalog as NDJSON (default) or ?format=csv, EXPORT_CHUNK_SIZE rows at a time"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': 'format must be ndjson or csv'}), 400
+
+    sharded = sharded_product_ids()
+    totals = STOCK.totals() if sharded else {}
+
+    def encode(rows):
+        if export_format == 'ndjson':
+            return ''.join(json.dumps(dict(zip(PRODUCT_FIELDS, row))) + '\n' for row in rows)
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue()
+
+    def generate():
+        # El with devuelve la conexión también si el cliente corta la descarga a mitad
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, name, quantity, price FROM products ORDER BY id")
+            if export_format == 'csv':
+                yield ','.join(PRODUCT_FIELDS) + '\n'
+            while True:
+                rows = c.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield encode([(p[0], p[1], totals.get(p[0], 0), p[3]) if p[0] in sharded else p for p in rows])
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=products.{export_format}'})
+
+@app.route('/products/shard', methods=['GET', 'POST', 'DELETE'])
+def manage_stock_shards():
+    """Move a product's stock into the slots (POST) or back into products.quantity (DELETE)"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    if not STOCK_SHARDING:
+        return jsonify({'status': 'error', 'message': 'Stock sharding is disabled (STOCK_SHARDING = False)'}), 400
+    
+    if request.method == 'GET':
+        totals = STOCK.totals()
+        return jsonify({**STOCK.stats(), 'products': {
+            product_id: totals.get(product_id, 0) for product_id in sorted(sharded_product_ids())}})
+    
+    if request.method == 'POST':
+        data = request.json
+        product_id = data.get('product_id') if isinstance(data, dict) else None
+    else:
+        product_id = request.args.get('id', type=int)
+    if not product_id:
+        return jsonify({'status': 'error', 'message': 'Missing product_id'}), 400
+    # Validar antes del BEGIN IMMEDIATE: un error con el lock tomado frena todas las escrituras
+    if not isinstance(product_id, int) or isinstance(product_id, bool):
+        return jsonify({'status': 'error', 'message': 'product_id must be an integer'}), 400
+    
+    with PRODUCT_CACHE.write():
+        with DB_POOL.connect(isolation_level=None) as conn:
+            c = conn.cursor()
+            # BEGIN IMMEDIATE: nadie toca products.quantity mientras el stock cambia de lugar
+            c.execute("BEGIN IMMEDIATE")
+            drained = None
+            try:
+                c.execute("SELECT quantity FROM products WHERE id = ?", (product_id,))
+                row = c.fetchone()
+                c.execute("SELECT 1 FROM sharded_products WHERE product_id = ?", (product_id,))
+                sharded = c.fetchone() is not None
+                if not row or sharded == (request.method == 'POST'):
+                    c.execute("ROLLBACK")
+                    if not row:
+                        return jsonify({'status': 'error', 'message': 'Product not found'}), 404
+                    return jsonify({'status': 'error', 'message': f"Product is {'already' if sharded else 'not'} sharded"}), 400
+            
+                if request.method == 'POST':
+                    STOCK.set(product_id, row[0])
+                    # Primero sharded_products: el trigger del change feed no registra el 0 de products
+                    c.execute("INSERT INTO sharded_products (product_id) VALUES (?)", (product_id,))
+                    c.execute("UPDATE products SET quantity = 0 WHERE id = ?", (product_id,))
+                    message = f'Stock split across {STOCK.slots} slots'
+                else:
+                    c.execute("DELETE FROM sharded_products WHERE product_id = ?", (product_id,))
+                    drained = STOCK.drain(product_id)
+                    c.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (drained, product_id))
+                    message = 'Stock moved back to products'
+                c.execute("COMMIT")
+            except Exception:
+                conn.rollback()
+                # Los slots son otros archivos: si ya se vaciaron, el stock vuelve a ellos
+                if drained is not None:
+                    STOCK.set(product_id, drained)
+                raise
+    # La cantidad total no cambió; se recarga para no mezclar con restas de slots en curso
+    PRODUCT_CACHE.reload()
+    return jsonify({'status': 'ok', 'message': message})
+
+def read_changes(since, limit):
+    """Changes after since in one read transaction; None if the log no longer reaches it"""
+    with DB_POOL.connect(isolation_level=None) as conn:
+        c = conn.cursor()
+        # Lectura consistente: una poda o un cambio entre los dos SELECT no se confunde con un hueco
+        c.execute("BEGIN")
+        changes = CHANGES.read(c, since, limit)
+        c.execute("COMMIT")
+        return changes
+
+def change_event(change):
+    return f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+
+@app.route('/products/changes', methods=['GET'])
+def get_product_changes():
+    """Product changes after ?since=<seq>, as JSON (long-poll with ?wait=seconds) or an SSE stream.
+
+    Each change is the product's state afterwards: {"seq", "id", "op", "name", "quantity",
+    "price", "changed_at"}; op is insert, update or delete. X-Change-Seq is the since for the
+    next call. SSE (Accept: text/event-stream or ?stream=sse) resumes from Last-Event-ID.
+    410 means the log no longer reaches since: reload GET /products, which returns
+    X-Change-Seq, and follow from there.
+    """
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    stream = request.args.get('stream') == 'sse' or request.accept_mimetypes.best == 'text/event-stream'
+    try:
+        since = int(request.headers.get('Last-Event-ID') if stream and request.headers.get('Last-Event-ID')
+                    else request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', CHANGE_FEED_PAGE_SIZE)), CHANGE_FEED_MAX_PAGE_SIZE)
+        wait = min(float(request.args.get('wait', 0)), CHANGE_FEED_MAX_WAIT)
+        if since < 0 or limit <= 0 or not wait >= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid since, limit or wait'}), 400
+
+    changes = read_changes(since, limit)
+    if changes is None:
+        return jsonify({'status': 'error', 'message': 'Change log no longer reaches since; reload products'}), 410
+
+    if stream:
+        def generate():
+            position = since
+            batch = changes
+            while True:
+                if batch is None:
+                    # El consumidor quedó detrás de la poda: tiene que recargar
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                for change in batch:
+                    yield change_event(change)
+                if batch:
+                    position = batch[-1]['seq']
+                if len(batch) < limit and not CHANGES.wait(position, CHANGE_FEED_HEARTBEAT):
+                    yield ': keep-alive\n\n'
+                batch = read_changes(position, limit)
+
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    if not changes and wait:
+        CHANGES.wait(since, wait)
+        changes = read_changes(since, limit)
+        if changes is None:
+            return jsonify({'status': 'error', 'message': 'Change log no longer reaches since; reload products'}), 410
+    response = jsonify(changes)
+    response.headers['X-Change-Seq'] = str(changes[-1]['seq'] if changes else since)
+    return response
+
+@app.route('/change_feed', methods=['GET'])
+def get_change_feed_stats():
+    """Newest seq, pending sharded marks, flushed and pruned entries, waits"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    return jsonify(CHANGES.stats())
+
+SNAPSHOTS = register_snapshot_routes(app, snapshot_databases, authenticate)
+
+register_pool_routes(app, DB_POOL, authenticate)
+
+@app.route('/product_cache', methods=['GET'])
+def get_product_cache_stats():
+    """Cache hit ratio, age and reloads; age stays within max_staleness plus one reload"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    return jsonify(PRODUCT_CACHE.stats())
+
 if __name__ == '__main__':
     init_inventory_db()
-    app.run(port=5001, debug=True)
\ No newline at end of file
+    # Se puede indicar otro puerto para levantar réplicas: python inventory_service/inventory.py 5011
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5001
+    debug = True
+    # Con debug el reloader corre este bloque también en el proceso vigilante; el reaper va solo en el que atiende
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        PRODUCT_CACHE.start()
+        start_hold_reaper()
+        start_change_feed()
+    app.run(port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Caché en memoria de productos con escritura directa (write-through); SQLite sigue siendo la fuente de verdad
+"""
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _key(product_id):
+    # Los ids llegan como int en el JSON y como texto en query strings
+    try:
+        return int(product_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProductCache:
+    """Whole ``products`` table kept in a dict: ``id -> (name, quantity, price)``.
+
+    Writers hold ``write()`` around their SQLite transaction *and* the cache
+    update, so two writers in this process cannot apply their results out of
+    order. Readers never lock: they see the dict either before or after a
+    write. Local writes already serialize on SQLite's single write lock, so
+    the extra lock costs almost nothing.
+
+    Stale-read bounds:
+
+    * Writes made through this process (``update_inventory``, reservations,
+      releases, ``/products``) are visible to the next ``get`` once the
+      handler's ``write()`` block ends.
+    * Writes made elsewhere (other workers or replicas, direct edits of
+      inventory.db) become visible within ``max_staleness`` seconds plus
+      one table read: a background thread started by ``start`` reloads
+      the table every ``max_staleness`` seconds. ``max_staleness=None``
+      never reloads, which is only safe with a single inventory process.
+
+    A reload reads the table without the lock and then swaps the dict in, so
+    neither readers nor writers wait for it. Products written through this
+    process during that read are read again, by id, under the lock just
+    before the swap: no local write is half done then, so the row swapped in
+    is at least as new as the local one and also carries writes made
+    elsewhere. A product written on every reload is refreshed like the rest.
+
+    ``loader(product_ids=None)`` returns ``(id, name, quantity, price)`` rows,
+    for the whole table or only for ``product_ids``.
+
+    The cache only answers ``/check_inventory``. Reservations still run the
+    guarded UPDATE in SQLite, so a stale read can never oversell stock.
+    """
+
+    def __init__(self, loader, max_staleness=1.0):
+        self.loader = loader
+        self.max_staleness = max_staleness
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._products = {}
+        self._loaded_at = None
+        self._touched = None  # ids escritos durante una recarga en curso
+        self._thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.writes = 0
+
+    def reload(self):
+        """Read the whole table and swap it in; products written meanwhile are read again"""
+        with self._reload_lock:
+            started = time.monotonic()
+            with self._lock:
+                self._touched = set()
+            try:
+                products = {row[0]: tuple(row[1:]) for row in self.loader()}
+                with self._lock:
+                    touched = {product_id for product_id in self._touched if product_id is not None}
+                    if touched:
+                        # Lo leído arriba puede ser anterior a esas escrituras: releer solo esos ids
+                        fresh = {row[0]: tuple(row[1:]) for row in self.loader(touched)}
+                        for product_id in touched:
+                            if product_id in fresh:
+                                products[product_id] = fresh[product_id]
+                            else:
+                                products.pop(product_id, None)
+                    self._products = products
+                    self._loaded_at = started
+                    self.reloads += 1
+            finally:
+                with self._lock:
+                    self._touched = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.max_staleness)
+            try:
+                self.reload()
+            except sqlite3.Error as e:
+                logging.error(f"Product cache reload failed: {e}")
+
+    def start(self):
+        """Load the table now and reload it every ``max_staleness`` seconds in the background"""
+        self.reload()
+        if self._thread is None and self.max_staleness is not None:
+            self._thread = threading.Thread(target=self._run, name='product-cache-reload', daemon=True)
+            self._thread.start()
+
+    def age(self):
+        loaded_at = self._loaded_at
+        return None if loaded_at is None else time.monotonic() - loaded_at
+
+    def get(self, product_id):
+        """``(name, quantity, price)`` or None if the product does not exist"""
+        if self._loaded_at is None:
+            # Sin start() (scripts, tests): la primera lectura carga la tabla
+            self.reload()
+        row = self._products.get(_key(product_id))
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    @contextmanager
+    def write(self):
+        """Hold while writing to SQLite and applying the same change to the cache"""
+        with self._lock:
+            yield self
+            self.writes += 1
+
+    def _touch(self, product_id):
+        if self._touched is not None:
+            self._touched.add(product_id)
+
+    def put(self, product_id, name, quantity, price):
+        self._touch(_key(product_id))
+        self._products[_key(product_id)] = (name, quantity, price)
+
+    def adjust(self, product_id, delta):
+        product_id = _key(product_id)
+        self._touch(product_id)
+        row = self._products.get(product_id)
+        if row is not None:
+            name, quantity, price = row
+            self._products[product_id] = (name, quantity + delta, price)
+
+    def remove(self, product_id):
+        self._touch(_key(product_id))
+        self._products.pop(_key(product_id), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        age = self.age()
+        return {
+            'products': len(self._products),
+            'age_seconds': round(age, 3) if age is not None else None,
+            'max_staleness': self.max_staleness,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'reloads': self.reloads,
+            'writes': self.writes,
+        }
@@ -0,0 +1,165 @@
+"""
+Holds de stock con vencimiento: apartan unidades mientras la orden se cobra
+"""
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+HELD = 'held'
+CONFIRMED = 'confirmed'
+RELEASED = 'released'
+EXPIRED = 'expired'
+
+
+class StockHolds:
+    """``stock_holds`` table plus the background reaper that expires it.
+
+    The caller takes the units out of stock in the same transaction that
+    calls ``add``, so held units can never be sold twice. A hold then ends
+    exactly once:
+
+    * confirmed: the order was paid and the units stay sold
+    * released: a later step failed and the caller gives the units back
+    * expired: nobody confirmed within the TTL and the reaper gives them
+      back, so a gateway that dies mid-chain leaks stock for at most a TTL
+
+    Every transition is an UPDATE guarded on ``status = 'held'``, so a
+    confirm racing the reaper cannot both win. Repeating the transition
+    that already happened reports the same status, which makes confirm
+    and release safe to retry. Finished holds are kept ``retention``
+    seconds for those retries, then purged.
+
+    The reaper walks the ``(status, expires_at)`` index oldest first, at
+    most ``reap_batch`` holds per transaction, so a backlog of expired
+    holds never keeps inventory.db's write lock for long.
+    """
+
+    def __init__(self, default_ttl=30, max_ttl=600, reap_interval=1.0, reap_batch=200, retention=3600):
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.reap_interval = reap_interval
+        self.reap_batch = reap_batch
+        self.retention = retention
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.created = 0
+        self.confirmed = 0
+        self.released = 0
+        self.expired = 0
+        self.purged = 0
+        self.reap_runs = 0
+
+    def create_table(self, c):
+        c.execute('''CREATE TABLE IF NOT EXISTS stock_holds
+                     (id TEXT PRIMARY KEY,
+                      product_id INTEGER NOT NULL,
+                      quantity INTEGER NOT NULL,
+                      status TEXT NOT NULL,
+                      created_at REAL NOT NULL,
+                      expires_at REAL NOT NULL) WITHOUT ROWID''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_stock_holds_expiry ON stock_holds (status, expires_at)')
+
+    def ttl(self, requested):
+        """TTL in seconds for a request's ``ttl_seconds``; ValueError if it is not a positive number"""
+        if requested is None:
+            return self.default_ttl
+        if isinstance(requested, bool) or not isinstance(requested, (int, float)) or requested <= 0:
+            raise ValueError('ttl_seconds must be a positive number')
+        return min(requested, self.max_ttl)
+
+    def add(self, c, product_id, quantity, ttl):
+        """Insert a hold inside the caller's transaction; returns (hold_id, expires_at)"""
+        hold_id = uuid.uuid4().hex
+        now = time.time()
+        c.execute("INSERT INTO stock_holds (id, product_id, quantity, status, created_at, expires_at) "
+                  "VALUES (?, ?, ?, ?, ?, ?)", (hold_id, product_id, quantity, HELD, now, now + ttl))
+        with self._lock:
+            self.created += 1
+        return hold_id, now + ttl
+
+    def finish(self, c, hold_id, status):
+        """Move a hold to CONFIRMED or RELEASED inside the caller's transaction.
+
+        Returns None for an unknown hold, else ``(changed, status, product_id,
+        quantity)`` where ``status`` is the hold's status afterwards. Only
+        ``changed=True`` after RELEASED means the caller must give stock back.
+        """
+        now = time.time()
+        # El UPDATE va primero: toma el lock de escritura y el SELECT ya ve el resultado
+        if status == CONFIRMED:
+            c.execute("UPDATE stock_holds SET status = ? WHERE id = ? AND status = ? AND expires_at > ?",
+                      (status, hold_id, HELD, now))
+        else:
+            c.execute("UPDATE stock_holds SET status = ? WHERE id = ? AND status = ?", (status, hold_id, HELD))
+        changed = c.rowcount == 1
+        c.execute("SELECT product_id, quantity, status FROM stock_holds WHERE id = ?", (hold_id,))
+        row = c.fetchone()
+        if row is None:
+            return None
+        product_id, quantity, current = row
+        if current == HELD:
+            # Venció y el reaper todavía no pasó: el stock ya no es de esta orden
+            current = EXPIRED
+        if changed:
+            with self._lock:
+                if status == CONFIRMED:
+                    self.confirmed += 1
+                else:
+                    self.released += 1
+        return changed, current, product_id, quantity
+
+    def expire_batch(self, c):
+        """Mark the oldest expired holds inside the caller's transaction; returns [(product_id, quantity)]"""
+        now = time.time()
+        c.execute("SELECT id, product_id, quantity FROM stock_holds WHERE status = ? AND expires_at <= ? "
+                  "ORDER BY expires_at LIMIT ?", (HELD, now, self.reap_batch))
+        rows = c.fetchall()
+        c.executemany("UPDATE stock_holds SET status = ? WHERE id = ? AND status = ?",
+                      [(EXPIRED, row[0], HELD) for row in rows])
+        if len(rows) < self.reap_batch:
+            # Sin atraso de vencidos: se aprovecha la misma transacción para borrar holds viejos
+            c.execute("DELETE FROM stock_holds WHERE status IN (?, ?, ?) AND expires_at <= ?",
+                      (CONFIRMED, RELEASED, EXPIRED, now - self.retention))
+            purged = c.rowcount
+        else:
+            purged = 0
+        with self._lock:
+            self.expired += len(rows)
+            self.purged += purged
+            self.reap_runs += 1
+        return [(product_id, quantity) for _, product_id, quantity in rows]
+
+    def _run(self, reap):
+        while True:
+            try:
+                # Un lote lleno indica que quedan más vencidos: seguir sin esperar
+                if reap() >= self.reap_batch:
+                    continue
+            except sqlite3.Error as e:
+                logging.error(f"Stock hold reaper failed: {e}")
+            time.sleep(self.reap_interval)
+
+    def start(self, reap):
+        """Run ``reap`` (one batch, returns how many holds expired) every ``reap_interval`` seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(reap,), name='stock-hold-reaper', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'default_ttl': self.default_ttl,
+                'max_ttl': self.max_ttl,
+                'reap_interval': self.reap_interval,
+                'reap_batch': self.reap_batch,
+                'created': self.created,
+                'confirmed': self.confirmed,
+                'released': self.released,
+                'expired': self.expired,
+                'purged': self.purged,
+                'reap_runs': self.reap_runs,
+            }
@@ -0,0 +1,166 @@
+"""
+Stock repartido en slots para productos muy disputados
+"""
+import random
+import threading
+
+from common.sqlite_pool import SQLiteConnectionPool
+
+
+class ShardedStock:
+    """Splits a product's stock across ``slots`` counters, one SQLite file each.
+
+    SQLite locks the whole database on write, so sub-counters in the same
+    file would still serialize on one lock. With one file per slot, two
+    decrements of the same SKU contend only when they land on the same slot.
+    Reads sum all slots.
+
+    ``take`` first tries to take the whole quantity from a single slot with
+    stock, starting at a random slot. If no single slot has enough, it
+    gathers from several slots and gives everything back when the total
+    falls short. Each slot commits on its own, so a failed gather can
+    briefly hide stock from concurrent readers; it never creates or loses
+    units.
+    """
+
+    def __init__(self, path_template='inventory_stock_{slot}.db', slots=8, busy_timeout=5.0):
+        self.slots = slots
+        self.pools = [SQLiteConnectionPool(path_template.format(slot=slot), busy_timeout=busy_timeout)
+                      for slot in range(slots)]
+        self._lock = threading.Lock()
+        self.takes = 0
+        self.single_slot_takes = 0
+        self.gathers = 0
+        self.failed_takes = 0
+
+    def init_db(self):
+        for pool in self.pools:
+            with pool.connect() as conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS stock_slots
+                                (product_id INTEGER PRIMARY KEY,
+                                 quantity INTEGER NOT NULL)''')
+                conn.commit()
+
+    def _slot_quantity(self, slot, product_id):
+        with self.pools[slot].connect() as conn:
+            c = conn.cursor()
+            c.execute("SELECT quantity FROM stock_slots WHERE product_id = ?", (product_id,))
+            row = c.fetchone()
+        return row[0] if row else 0
+
+    def _add(self, slot, product_id, quantity):
+        with self.pools[slot].connect() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE stock_slots SET quantity = quantity + ? WHERE product_id = ?", (quantity, product_id))
+            added = c.rowcount == 1
+            conn.commit()
+        return added
+
+    def _take_upto(self, slot, product_id, quantity):
+        with self.pools[slot].connect(isolation_level=None) as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT quantity FROM stock_slots WHERE product_id = ?", (product_id,))
+            row = c.fetchone()
+            taken = min(row[0], quantity) if row else 0
+            if taken:
+                c.execute("UPDATE stock_slots SET quantity = quantity - ? WHERE product_id = ?", (taken, product_id))
+            c.execute("COMMIT")
+        return taken
+
+    def set(self, product_id, quantity):
+        """Spread ``quantity`` evenly over the slots, replacing what was there"""
+        share, extra = divmod(quantity, self.slots)
+        for slot, pool in enumerate(self.pools):
+            with pool.connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO stock_slots (product_id, quantity) VALUES (?, ?)",
+                             (product_id, share + (1 if slot < extra else 0)))
+                conn.commit()
+
+    def drain(self, product_id):
+        """Remove the product from every slot and return the stock it had"""
+        total = 0
+        for pool in self.pools:
+            with pool.connect(isolation_level=None) as conn:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                c.execute("SELECT quantity FROM stock_slots WHERE product_id = ?", (product_id,))
+                row = c.fetchone()
+                c.execute("DELETE FROM stock_slots WHERE product_id = ?", (product_id,))
+                c.execute("COMMIT")
+            total += row[0] if row else 0
+        return total
+
+    def total(self, product_id):
+        return sum(self._slot_quantity(slot, product_id) for slot in range(self.slots))
+
+    def totals(self):
+        totals = {}
+        for pool in self.pools:
+            with pool.connect() as conn:
+                c = conn.cursor()
+                c.execute("SELECT product_id, quantity FROM stock_slots")
+                for product_id, quantity in c.fetchall():
+                    totals[product_id] = totals.get(product_id, 0) + quantity
+        return totals
+
+    def take(self, product_id, quantity):
+        """Decrement ``quantity`` units; False (and nothing taken) if the slots hold less"""
+        start = random.randrange(self.slots)
+        order = [(start + k) % self.slots for k in range(self.slots)]
+        with self._lock:
+            self.takes += 1
+
+        # Lectura sin lock (WAL) para saltar slots vacíos; el UPDATE vuelve a comprobar
+        available = {}
+        for slot in order:
+            available[slot] = self._slot_quantity(slot, product_id)
+            if available[slot] < quantity:
+                continue
+            with self.pools[slot].connect() as conn:
+                c = conn.cursor()
+                c.execute("UPDATE stock_slots SET quantity = quantity - ? WHERE product_id = ? AND quantity >= ?",
+                          (quantity, product_id, quantity))
+                done = c.rowcount == 1
+                conn.commit()
+            if done:
+                with self._lock:
+                    self.single_slot_takes += 1
+                return True
+
+        if sum(available.values()) < quantity:
+            with self._lock:
+                self.failed_takes += 1
+            return False
+
+        # Ningún slot alcanza solo: se junta de varios y se devuelve todo si no llega
+        with self._lock:
+            self.gathers += 1
+        taken = []
+        remaining = quantity
+        for slot in order:
+            got = self._take_upto(slot, product_id, remaining)
+            if got:
+                taken.append((slot, got))
+                remaining -= got
+            if not remaining:
+                return True
+        for slot, got in taken:
+            self._add(slot, product_id, got)
+        with self._lock:
+            self.failed_takes += 1
+        return False
+
+    def give(self, product_id, quantity):
+        """Return stock to a random slot"""
+        return self._add(random.randrange(self.slots), product_id, quantity)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'takes': self.takes,
+                'single_slot_takes': self.single_slot_takes,
+                'gathers': self.gathers,
+                'failed_takes': self.failed_takes,
+            }
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Lanzador prefork: N procesos worker por servicio compartiendo el mismo socket de escucha.
+
+El proceso maestro abre el socket de cada servicio, inicializa su base de datos una sola vez
+y lanza los workers, que heredan el descriptor (o, con --reuseport, abren cada uno su propio
+socket con SO_REUSEPORT y el kernel reparte las conexiones). La disponibilidad de todos los
+workers se espera en paralelo y los workers que se caen se vuelven a levantar.
+
+Cada worker del gateway tiene sus propios circuit breakers, balanceadores y métricas. La
+idempotencia no: las claves se reclaman en la tabla de logs.db que comparten todos los workers,
+así una Idempotency-Key se ejecuta una sola vez aunque los duplicados caigan en workers distintos
+(solo la LRU de respuestas es de cada worker).
+
+Uso: python launcher.py --workers 4 [gateway=2 inventory=8] [--reuseport] [--host 127.0.0.1]
+Solo POSIX: en Windows usar debugs/run_all.py.
+"""
+import argparse
+import importlib.util
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 'init' corre una vez en el maestro; 'worker_init' en cada worker antes de aceptar conexiones
+SERVICES = [
+    {'name': 'gateway', 'port': 5000, 'path': 'gateway_service/gateway.py',
+     'init': ['init_logs_db', 'IDEMPOTENCY.init_db'], 'worker_init': ['start_background_tasks', 'mount_services']},
+    {'name': 'inventory', 'port': 5001, 'path': 'inventory_service/inventory.py',
+     'init': ['init_inventory_db'], 'worker_init': ['PRODUCT_CACHE.start', 'start_hold_reaper', 'start_change_feed']},
+    {'name': 'order', 'port': 5002, 'path': 'order_service/order.py',
+     'init': ['init_order_db'], 'worker_init': []},
+    {'name': 'payment', 'port': 5003, 'path': 'payment_service/payment.py',
+     'init': ['init_payment_db'], 'worker_init': []},
+]
+
+READY_TIMEOUT = 30  # segundos
+MONITOR_INTERVAL = 0.5  # segundos
+RESTART_BACKOFF_MAX = 30  # segundos entre reinicios de un worker que se cae al arrancar
+STABLE_AFTER = 10  # un worker que vivió más que esto se reinicia sin espera
+SHUTDOWN_TIMEOUT = 10  # segundos
+
+SERVICES_BY_NAME = {service['name']: service for service in SERVICES}
+
+
+def load_service(service):
+    """Import a service script as a module named after the service"""
+    path = os.path.join(ROOT, service['path'])
+    # Los módulos auxiliares del gateway se importan por nombre desde su carpeta
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(service['name'], path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[service['name']] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_hooks(module, hooks):
+    for hook in hooks:
+        target = module
+        for attr in hook.split('.'):
+            target = getattr(target, attr)
+        target()
+
+
+def listen_socket(host, port, reuseport=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    # No bloqueante: cuando varios workers despiertan por la misma conexión,
+    # los que pierden el accept() vuelven al select en vez de quedarse colgados
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(name, host, fd, ready_fd):
+    """Worker entry point: serve one service on an inherited or SO_REUSEPORT socket"""
+    from werkzeug.serving import make_server
+
+    service = SERVICES_BY_NAME[name]
+    module = load_service(service)
+    run_hooks(module, service['worker_init'])
+
+    sock = listen_socket(host, service['port'], reuseport=True) if fd is None else None
+    server = make_server(host, service['port'], module.app, threaded=True,
+                         fd=fd if fd is not None else sock.fileno())
+
+    # SIGTERM sale por sys.exit para que corran los atexit (p. ej. vaciar la cola de logs)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class Worker:
+    def __init__(self, service, index):
+        self.service = service
+        self.index = index
+        self.process = None
+        self.started_at = 0.0
+        self.crashes = 0
+        self.restart_at = None
+
+    @property
+    def label(self):
+        return f"{self.service['name']}[{self.index}]"
+
+
+class Launcher:
+    def __init__(self, workers, host='127.0.0.1', reuseport=False):
+        self.workers_per_service = workers
+        self.host = host
+        self.reuseport = reuseport
+        self.sockets = {}
+        self.workers = []
+        self.restarts = 0
+        self._stopping = threading.Event()
+
+    def spawn(self, worker, ready=False):
+        """Start (or restart) one worker; returns the read end of its ready pipe"""
+        command = [sys.executable, os.path.abspath(__file__), '--worker', worker.service['name'],
+                   '--host', self.host]
+        pass_fds = []
+        if not self.reuseport:
+            fd = self.sockets[worker.service['name']].fileno()
+            command += ['--fd', str(fd)]
+            pass_fds.append(fd)
+        read_fd = None
+        if ready:
+            read_fd, write_fd = os.pipe()
+            command += ['--ready-fd', str(write_fd)]
+            pass_fds.append(write_fd)
+        worker.process = subprocess.Popen(command, cwd=os.getcwd(), pass_fds=pass_fds)
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        if ready:
+            os.close(write_fd)
+        return read_fd
+
+    def start(self):
+        started = time.monotonic()
+        for service in SERVICES:
+            if not self.reuseport:
+                self.sockets[service['name']] = listen_socket(self.host, service['port'])
+            run_hooks(load_service(service), service['init'])
+            for index in range(self.workers_per_service.get(service['name'], 1)):
+                self.workers.append(Worker(service, index))
+
+        # Todos los workers arrancan a la vez; cada uno avisa por su pipe cuando ya acepta conexiones
+        selector = selectors.DefaultSelector()
+        for worker in self.workers:
+            selector.register(self.spawn(worker, ready=True), selectors.EVENT_READ, worker)
+
+        ready_at = {}
+        deadline = started + READY_TIMEOUT
+        while selector.get_map() and time.monotonic() < deadline:
+            for key, _ in selector.select(timeout=deadline - time.monotonic()):
+                if os.read(key.fd, 1):
+                    ready_at[key.data.label] = time.monotonic() - started
+                else:
+                    print(f"❌ {key.data.label} exited before becoming ready")
+                selector.unregister(key.fd)
+                os.close(key.fd)
+        for key in list(selector.get_map().values()):
+            print(f"❌ {key.data.label} not ready after {READY_TIMEOUT}s")
+            os.close(key.fd)
+        selector.close()
+
+        probes = self.probe_services()
+        print(f"\n✅ Startup finished in {time.monotonic() - started:.2f}s "
+              f"({'SO_REUSEPORT' if self.reuseport else 'shared socket'})")
+        for service in SERVICES:
+            name = service['name']
+            workers = [w for w in self.workers if w.service is service]
+            ready = [ready_at[w.label] for w in workers if w.label in ready_at]
+            slowest = f"{max(ready):.2f}s" if ready else '-'
+            status = '✅' if probes.get(name) else '❌'
+            print(f"{status} {name:<10} http://{self.host}:{service['port']}  "
+                  f"{len(ready)}/{len(workers)} workers ready, slowest {slowest}")
+        return len(ready_at) == len(self.workers) and all(probes.values())
+
+    def probe_services(self):
+        """One HTTP request per service, in parallel: any response means the socket is served"""
+        results = {}
+
+        def probe(service):
+            try:
+                requests.get(f"http://{self.host}:{service['port']}/health", timeout=5)
+                results[service['name']] = True
+            except requests.exceptions.RequestException:
+                results[service['name']] = False
+
+        threads = [threading.Thread(target=probe, args=(service,)) for service in SERVICES]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def monitor(self):
+        """Restart crashed workers; ones that keep dying right after start back off exponentially"""
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at is not None:
+                    if now >= worker.restart_at:
+                        self.spawn(worker)
+                        self.restarts += 1
+                        print(f"🔄 Restarted {worker.label} (pid {worker.process.pid})")
+                    continue
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                worker.crashes = 0 if now - worker.started_at > STABLE_AFTER else worker.crashes + 1
+                delay = min(2 ** worker.crashes - 1, RESTART_BACKOFF_MAX)
+                worker.restart_at = now + delay
+                print(f"⚠️ {worker.label} exited with code {code}, restarting in {delay}s")
+
+    def stop(self):
+        self._stopping.set()
+        for worker in self.workers:
+            if worker.process and worker.process.poll() is None:
+                worker.process.terminate()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in self.workers:
+            if worker.process:
+                try:
+                    worker.process.wait(timeout=max(deadline - time.monotonic(), 0))
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+        for sock in self.sockets.values():
+            sock.close()
+
+
+def parse_workers(values):
+    """'4' applies to every service; 'inventory=8' overrides one service"""
+    default = 1
+    overrides = {}
+    for value in values:
+        if '=' in value:
+            name, count = value.split('=', 1)
+            if name not in SERVICES_BY_NAME:
+                raise SystemExit(f"Unknown service: {name}")
+            overrides[name] = int(count)
+        else:
+            default = int(value)
+    return {name: overrides.get(name, default) for name in SERVICES_BY_NAME}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', nargs='+', default=[str(os.cpu_count() or 1)],
+                        help='workers por servicio: N para todos y/o servicio=N')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--reuseport', action='store_true',
+                        help='cada worker abre su socket con SO_REUSEPORT en lugar de heredar el del maestro')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.host, args.fd, args.ready_fd)
+        return
+
+    if os.name != 'posix':
+        print("❌ The prefork launcher needs POSIX; use debugs/run_all.py on Windows")
+        sys.exit(1)
+
+    launcher = Launcher(parse_workers(args.workers), host=args.host, reuseport=args.reuseport)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if not launcher.start():
+            print("⚠️ Some workers are not serving; they will be restarted if they exit")
+        print("\nPress Ctrl+C to stop all services")
+        launcher.monitor()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        print("\n🛑 Stopping all workers...")
+        launcher.stop()
+        print(f"Workers restarted during this run: {launcher.restarts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,15 @@
 from flask import Flask, request, jsonify
 import sqlite3
-import jwt
 import datetime
+import base64
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.token_cache import ServiceTokenVerifier
+from common.sqlite_pool import SQLiteConnectionPool, register_pool_routes
+from common.group_commit import GroupCommitter
+from common.snapshot import register_snapshot_routes
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'order-secret-key'
@@ -9,6 +17,61 @@ app.config['SECRET_KEY'] = 'order-secret-key'
 # Lista de servicios autorizados
 AUTHORIZED_SERVICES = ['gateway', 'admin']
 
+# Tokens ya verificados: evita decodificar la firma en cada request
+TOKENS = ServiceTokenVerifier(app.config['SECRET_KEY'], AUTHORIZED_SERVICES, cache_size=1024)
+authenticate = TOKENS.authenticate
+
+# Conexiones SQLite persistentes: WAL, synchronous=NORMAL, mmap y caché de sentencias preparadas
+DB_POOL = SQLiteConnectionPool('order.db')
+
+# Group commit (opcional): create_order concurrentes se confirman juntos en una sola transacción
+GROUP_COMMIT = False
+GROUP_COMMIT_MAX_BATCH = 128
+GROUP_COMMIT_MAX_DELAY = 0.002  # segundos que se espera a más inserts cuando hay concurrencia
+
+ORDER_WRITES = GroupCommitter(DB_POOL, max_batch=GROUP_COMMIT_MAX_BATCH, max_delay=GROUP_COMMIT_MAX_DELAY,
+                              name='order-group-commit')
+
+# Bases que copia POST /snapshot (backup online por pasos, comprimido con gzip y con su .sha256)
+def snapshot_databases():
+    return ['order.db']
+
+# Rollups de ventas por producto y estado, al día en la misma transacción que cada cambio de orden.
+# El bucket es un prefijo de created_at: 13 caracteres = hora, 10 = día, 0 = todo el histórico
+ROLLUP_GRANULARITIES = {'hour': 13, 'day': 10, 'all': 0}
+ROLLUP_REVENUE_TOLERANCE = 0.005  # sumas de REAL en otro orden difieren en los últimos decimales
+STATS_PAGE_SIZE = 100
+STATS_MAX_PAGE_SIZE = 1000
+
+def expected_rollups_sql():
+    """SELECT that computes every rollup row from scratch out of the orders table"""
+    return ' UNION ALL '.join(
+        f'''SELECT '{granularity}', substr(COALESCE(created_at, ''), 1, {length}), product_id, status,
+                   COUNT(*), SUM(quantity), SUM(total_price)
+            FROM orders GROUP BY 2, 3, 4'''
+        for granularity, length in ROLLUP_GRANULARITIES.items())
+
+def apply_rollups(c, orders, sign=1):
+    """Add (sign=1) or remove (sign=-1) orders from their rollup buckets in the caller's transaction.
+
+    orders are (product_id, quantity, total_price, status, created_at) tuples.
+    """
+    deltas = {}
+    for product_id, quantity, total_price, status, created_at in orders:
+        for granularity, length in ROLLUP_GRANULARITIES.items():
+            key = (granularity, (created_at or '')[:length], product_id, status)
+            count, units, revenue = deltas.get(key, (0, 0, 0.0))
+            deltas[key] = (count + sign, units + sign * quantity, revenue + sign * total_price)
+    c.executemany('''INSERT INTO sales_rollups (granularity, bucket, product_id, status, orders, units, revenue)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (granularity, bucket, product_id, status) DO UPDATE SET
+                     orders = orders + excluded.orders, units = units + excluded.units,
+                     revenue = revenue + excluded.revenue''',
+                  [key + delta for key, delta in deltas.items()])
+    if sign < 0:
+        c.executemany('''DELETE FROM sales_rollups WHERE granularity = ? AND bucket = ? AND product_id = ?
+                         AND status = ? AND orders = 0''', list(deltas))
+
 def init_order_db():
     conn = sqlite3.connect('order.db')
     c = conn.cursor()
@@ -20,27 +83,32 @@ def init_order_db():
                   customer_email TEXT NOT NULL,
                   status TEXT NOT NULL,
                   created_at TEXT)''')
+    # Índices para GET /orders, que ordena por (created_at, id). Cada entrada termina implícitamente
+    # en id (rowid), así cada filtro, con o sin rango de fechas, recorre su índice ya ordenado
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_customer_email ON orders (customer_email, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_product_id ON orders (product_id, created_at)')
+    
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_rollups'")
+    backfill = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_rollups
+                 (granularity TEXT NOT NULL,
+                  bucket TEXT NOT NULL,
+                  product_id INTEGER NOT NULL,
+                  status TEXT NOT NULL,
+                  orders INTEGER NOT NULL,
+                  units INTEGER NOT NULL,
+                  revenue REAL NOT NULL,
+                  PRIMARY KEY (granularity, bucket, product_id, status)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sales_rollups_product ON sales_rollups (granularity, product_id, bucket)')
+    if backfill:
+        # Base con órdenes de antes de los rollups: se cargan una sola vez desde la tabla
+        c.execute(f'''INSERT INTO sales_rollups (granularity, bucket, product_id, status, orders, units, revenue)
+                      {expected_rollups_sql()}''')
     conn.commit()
     conn.close()
 
-def verify_token(token):
-    try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        if payload.get('service') in AUTHORIZED_SERVICES:
-            return payload
-        return None
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
-
-def authenticate():
-    token = request.headers.get('Authorization')
-    if not token:
-        return None
-    token = token.replace('Bearer ', '')
-    return verify_token(token)
-
 @app.route('/create_order', methods=['POST'])
 def create_order():
     auth = authenticate()
@@ -57,15 +125,22 @@ def create_order():
         return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
     
     total_price = quantity * price
+    created_at = datetime.datetime.now().isoformat()
     
-    conn = sqlite3.connect('order.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO orders (product_id, quantity, total_price, customer_email, status, created_at)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (product_id, quantity, total_price, customer_email, 'completed', datetime.datetime.now().isoformat()))
-    order_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    def insert(c):
+        c.execute('''INSERT INTO orders (product_id, quantity, total_price, customer_email, status, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  (product_id, quantity, total_price, customer_email, 'completed', created_at))
+        order_id = c.lastrowid
+        apply_rollups(c, [(product_id, quantity, total_price, 'completed', created_at)])
+        return order_id
+    
+    if GROUP_COMMIT:
+        order_id = ORDER_WRITES.submit(insert)
+    else:
+        with DB_POOL.connect() as conn:
+            order_id = insert(conn.cursor())
+            conn.commit()
     
     return jsonify({
         'status': 'ok', 
@@ -74,47 +149,295 @@ def create_order():
         'total_price': total_price
     })
 
+@app.route('/create_orders', methods=['POST'])
+def create_orders():
+    """Create many orders in one transaction; results keep the input order"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    orders = (request.json or {}).get('orders')
+    if not isinstance(orders, list) or not orders:
+        return jsonify({'status': 'error', 'message': 'Missing orders'}), 400
+    
+    created_at = datetime.datetime.now().isoformat()
+    results = []
+    created = []
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        try:
+            for data in orders:
+                if not isinstance(data, dict):
+                    results.append({'status': 'error', 'message': 'Each order must be an object'})
+                    continue
+                product_id = data.get('product_id')
+                quantity = data.get('quantity')
+                price = data.get('price')
+                customer_email = data.get('customer_email')
+            
+                if not all([product_id, quantity, price, customer_email]):
+                    results.append({'status': 'error', 'message': 'Missing required fields'})
+                    continue
+                if (not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0
+                        or not isinstance(price, (int, float)) or isinstance(price, bool)):
+                    results.append({'status': 'error', 'message': 'quantity must be a positive integer and price a number'})
+                    continue
+            
+                total_price = quantity * price
+                c.execute('''INSERT INTO orders (product_id, quantity, total_price, customer_email, status, created_at)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (product_id, quantity, total_price, customer_email, 'completed', created_at))
+                results.append({'status': 'ok', 'order_id': c.lastrowid, 'total_price': total_price})
+                created.append((product_id, quantity, total_price, 'completed', created_at))
+            if created:
+                apply_rollups(c, created)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    return jsonify({'status': 'ok', 'results': results})
+
+ORDERS_PAGE_SIZE = 100
+ORDERS_MAX_PAGE_SIZE = 1000
+
+def encode_orders_cursor(created_at, order_id):
+    return base64.urlsafe_b64encode(f'{created_at}|{order_id}'.encode()).decode()
+
+def decode_orders_cursor(cursor):
+    created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+    return created_at, int(order_id)
+
+def query_orders(args):
+    """Run the GET /orders query for a mapping of query params; returns (rows, next_cursor)"""
+    filters = []
+    params = []
+    for column in ('customer_email', 'status'):
+        value = args.get(column)
+        if value:
+            filters.append(f'{column} = ?')
+            params.append(value)
+    if args.get('product_id'):
+        filters.append('product_id = ?')
+        params.append(int(args['product_id']))
+    if args.get('since'):
+        filters.append('created_at >= ?')
+        params.append(args['since'])
+    if args.get('until'):
+        filters.append('created_at < ?')
+        params.append(args['until'])
+    
+    limit = min(max(int(args.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_MAX_PAGE_SIZE)
+    if args.get('cursor'):
+        # Keyset: seguir justo después de la última orden de la página anterior
+        filters.append('(created_at, id) < (?, ?)')
+        params.extend(decode_orders_cursor(args['cursor']))
+    
+    where = f"WHERE {' AND '.join(filters)}" if filters else ''
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT id, product_id, quantity, total_price, customer_email, status, created_at
+                      FROM orders {where} ORDER BY created_at DESC, id DESC LIMIT ?''', params + [limit + 1])
+        orders = c.fetchall()
+    
+    next_cursor = None
+    if len(orders) > limit:
+        last = orders[limit - 1]
+        next_cursor = encode_orders_cursor(last[6], last[0])
+    return [{
+        'id': o[0],
+        'product_id': o[1],
+        'quantity': o[2],
+        'total_price': o[3],
+        'customer_email': o[4],
+        'status': o[5],
+        'created_at': o[6]
+    } for o in orders[:limit]], next_cursor
+
 @app.route('/orders', methods=['GET', 'PUT', 'DELETE'])
 def manage_orders():
+    """GET lists orders newest first, one page at a time.
+
+    Query params: customer_email, status, product_id, since, until (ISO
+    timestamps on created_at), limit and cursor. The cursor for the next
+    page is returned in the X-Next-Cursor header; it is absent on the last page.
+    """
     auth = authenticate()
     if not auth:
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
     
     if request.method == 'GET':
-        conn = sqlite3.connect('order.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM orders")
-        orders = c.fetchall()
-        conn.close()
+        try:
+            orders, next_cursor = query_orders(request.args)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'status': 'error', 'message': 'Invalid limit, cursor or product_id'}), 400
         
-        return jsonify([{
-            'id': o[0],
-            'product_id': o[1],
-            'quantity': o[2],
-            'total_price': o[3],
-            'customer_email': o[4],
-            'status': o[5],
-            'created_at': o[6]
-        } for o in orders])
+        response = jsonify(orders)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
     
     elif request.method == 'PUT':
         data = request.json
-        conn = sqlite3.connect('order.db')
-        c = conn.cursor()
-        c.execute("UPDATE orders SET status=? WHERE id=?", (data['status'], data['id']))
-        conn.commit()
-        conn.close()
+        # Validar antes del BEGIN IMMEDIATE: un KeyError con el lock tomado bloquea la base
+        if (not isinstance(data, dict) or not isinstance(data.get('id'), int) or isinstance(data.get('id'), bool)
+                or not isinstance(data.get('status'), str) or not data['status']):
+            return jsonify({'status': 'error', 'message': 'id (integer) and status (string) are required'}), 400
+        order_id, status = data['id'], data['status']
+        with DB_POOL.connect(isolation_level=None) as conn:
+            c = conn.cursor()
+            # BEGIN IMMEDIATE: el estado que se descuenta del rollup es el mismo que el UPDATE reemplaza
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("SELECT product_id, quantity, total_price, status, created_at FROM orders WHERE id=?", (order_id,))
+                old = c.fetchone()
+                c.execute("UPDATE orders SET status=? WHERE id=?", (status, order_id))
+                if old and old[3] != status:
+                    apply_rollups(c, [old], sign=-1)
+                    apply_rollups(c, [old[:3] + (status, old[4])])
+                c.execute("COMMIT")
+            except Exception:
+                conn.rollback()
+                raise
         return jsonify({'status': 'ok', 'message': 'Order updated'})
     
     elif request.method == 'DELETE':
-        order_id = request.args.get('id')
-        conn = sqlite3.connect('order.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM orders WHERE id=?", (order_id,))
-        conn.commit()
-        conn.close()
+        order_id = request.args.get('id', type=int)
+        if order_id is None:
+            return jsonify({'status': 'error', 'message': 'id (integer) is required'}), 400
+        with DB_POOL.connect(isolation_level=None) as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("SELECT product_id, quantity, total_price, status, created_at FROM orders WHERE id=?", (order_id,))
+                old = c.fetchone()
+                c.execute("DELETE FROM orders WHERE id=?", (order_id,))
+                if old:
+                    apply_rollups(c, [old], sign=-1)
+                c.execute("COMMIT")
+            except Exception:
+                conn.rollback()
+                raise
         return jsonify({'status': 'ok', 'message': 'Order deleted'})
 
+@app.route('/orders/stats', methods=['GET'])
+def get_order_stats():
+    """Orders, units and revenue per bucket, product and status, read from the rollups.
+
+    Query params: granularity (hour, day or all; default day), product_id,
+    status, since, until (compared with the bucket, e.g. 2026-05-01 or
+    2026-05-01T13) and limit. Newest buckets first.
+    """
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ROLLUP_GRANULARITIES:
+        return jsonify({'status': 'error', 'message': 'granularity must be hour, day or all'}), 400
+    filters = ['granularity = ?']
+    params = [granularity]
+    try:
+        if request.args.get('product_id'):
+            filters.append('product_id = ?')
+            params.append(int(request.args['product_id']))
+        limit = min(max(int(request.args.get('limit', STATS_PAGE_SIZE)), 1), STATS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid limit or product_id'}), 400
+    if request.args.get('status'):
+        filters.append('status = ?')
+        params.append(request.args['status'])
+    if request.args.get('since'):
+        filters.append('bucket >= ?')
+        params.append(request.args['since'])
+    if request.args.get('until'):
+        filters.append('bucket < ?')
+        params.append(request.args['until'])
+    
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT bucket, product_id, status, orders, units, revenue FROM sales_rollups
+                      WHERE {' AND '.join(filters)} ORDER BY bucket DESC, product_id, status LIMIT ?''', params + [limit])
+        rows = c.fetchall()
+    
+    return jsonify({
+        'granularity': granularity,
+        'buckets': [{
+            'bucket': r[0],
+            'product_id': r[1],
+            'status': r[2],
+            'orders': r[3],
+            'units': r[4],
+            'revenue': round(r[5], 2)
+        } for r in rows]
+    })
+
+def rollup_differences(c):
+    """Rollup rows that differ from a fresh GROUP BY over orders, as (key, stored, expected)"""
+    c.execute(expected_rollups_sql())
+    expected = {row[:4]: row[4:] for row in c.fetchall()}
+    c.execute("SELECT granularity, bucket, product_id, status, orders, units, revenue FROM sales_rollups")
+    stored = {row[:4]: row[4:] for row in c.fetchall()}
+    differences = []
+    for key in sorted(expected.keys() | stored.keys(), key=str):
+        want = expected.get(key, (0, 0, 0.0))
+        have = stored.get(key, (0, 0, 0.0))
+        if want[:2] != have[:2] or abs(want[2] - have[2]) > ROLLUP_REVENUE_TOLERANCE:
+            differences.append((key, have, want))
+    return differences
+
+def rebuild_rollups(verify_only=False):
+    """Compare the rollups with the orders table and, unless verify_only, recompute them.
+
+    Runs in one BEGIN IMMEDIATE transaction, so no order changes in between.
+    Returns (differences before, differences after).
+    """
+    with DB_POOL.connect(isolation_level=None) as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            before = rollup_differences(c)
+            after = before
+            if not verify_only:
+                c.execute("DELETE FROM sales_rollups")
+                c.execute(f'''INSERT INTO sales_rollups (granularity, bucket, product_id, status, orders, units, revenue)
+                              {expected_rollups_sql()}''')
+                after = rollup_differences(c)
+            c.execute("COMMIT")
+        except Exception:
+            conn.rollback()
+            raise
+    return before, after
+
+def rollups_command(verify_only):
+    """python order_service/order.py --verify-rollups | --rebuild-rollups"""
+    before, after = rebuild_rollups(verify_only)
+    for key, have, want in before[:20]:
+        print(f"❌ {key}: stored {have}, expected {want}")
+    if len(before) > 20:
+        print(f"... and {len(before) - 20} more")
+    print(f"{len(before)} rollup rows differed from the orders table")
+    if not verify_only:
+        print(f"{'✅' if not after else '❌'} rebuilt, {len(after)} differences after rebuild")
+    return 1 if after else 0
+
+@app.route('/group_commit', methods=['GET'])
+def get_group_commit_stats():
+    """Batches and average batch size of the create_order writer (all zero when GROUP_COMMIT is off)"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    return jsonify({'enabled': GROUP_COMMIT, **ORDER_WRITES.stats()})
+
+SNAPSHOTS = register_snapshot_routes(app, snapshot_databases, authenticate)
+
+register_pool_routes(app, DB_POOL, authenticate)
+
 if __name__ == '__main__':
     init_order_db()
-    app.run(port=5002, debug=True)
\ No newline at end of file
+    # Mantenimiento: --verify-rollups compara los rollups con la tabla, --rebuild-rollups además los recalcula
+    if len(sys.argv) > 1 and sys.argv[1] in ('--verify-rollups', '--rebuild-rollups'):
+        sys.exit(rollups_command(verify_only=sys.argv[1] == '--verify-rollups'))
+    # Se puede indicar otro puerto para levantar réplicas: python order_service/order.py 5012
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5002
+    app.run(port=port, debug=True)
\ No newline at end of file
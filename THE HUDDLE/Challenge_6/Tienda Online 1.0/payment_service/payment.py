@@ -1,7 +1,15 @@
 from flask import Flask, request, jsonify
 import sqlite3
-import jwt
 import datetime
+import base64
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.token_cache import ServiceTokenVerifier
+from common.sqlite_pool import SQLiteConnectionPool, register_pool_routes
+from common.group_commit import GroupCommitter
+from common.snapshot import register_snapshot_routes
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'payment-secret-key'
@@ -9,6 +17,25 @@ app.config['SECRET_KEY'] = 'payment-secret-key'
 # Lista de servicios autorizados
 AUTHORIZED_SERVICES = ['gateway', 'admin']
 
+# Tokens ya verificados: evita decodificar la firma en cada request
+TOKENS = ServiceTokenVerifier(app.config['SECRET_KEY'], AUTHORIZED_SERVICES, cache_size=1024)
+authenticate = TOKENS.authenticate
+
+# Conexiones SQLite persistentes: WAL, synchronous=NORMAL, mmap y caché de sentencias preparadas
+DB_POOL = SQLiteConnectionPool('payment.db')
+
+# Group commit (opcional): process_payment concurrentes se confirman juntos en una sola transacción
+GROUP_COMMIT = False
+GROUP_COMMIT_MAX_BATCH = 128
+GROUP_COMMIT_MAX_DELAY = 0.002  # segundos que se espera a más inserts cuando hay concurrencia
+
+PAYMENT_WRITES = GroupCommitter(DB_POOL, max_batch=GROUP_COMMIT_MAX_BATCH, max_delay=GROUP_COMMIT_MAX_DELAY,
+                                name='payment-group-commit')
+
+# Bases que copia POST /snapshot (backup online por pasos, comprimido con gzip y con su .sha256)
+def snapshot_databases():
+    return ['payment.db']
+
 def init_payment_db():
     conn = sqlite3.connect('payment.db')
     c = conn.cursor()
@@ -19,27 +46,12 @@ def init_payment_db():
                   payment_method TEXT NOT NULL,
                   status TEXT NOT NULL,
                   processed_at TEXT)''')
+    # GET /payments ordena por (processed_at, id); cada entrada termina implícitamente en id (rowid)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_payments_processed_at ON payments (processed_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_payments_order_id ON payments (order_id, processed_at)')
     conn.commit()
     conn.close()
 
-def verify_token(token):
-    try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        if payload.get('service') in AUTHORIZED_SERVICES:
-            return payload
-        return None
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
-
-def authenticate():
-    token = request.headers.get('Authorization')
-    if not token:
-        return None
-    token = token.replace('Bearer ', '')
-    return verify_token(token)
-
 @app.route('/process_payment', methods=['POST'])
 def process_payment():
     auth = authenticate()
@@ -56,14 +68,20 @@ def process_payment():
     
     # Simulate payment processing
     if amount > 0:
-        conn = sqlite3.connect('payment.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO payments (order_id, amount, payment_method, status, processed_at)
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (order_id, amount, payment_method, 'completed', datetime.datetime.now().isoformat()))
-        payment_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        processed_at = datetime.datetime.now().isoformat()
+        
+        def insert(c):
+            c.execute('''INSERT INTO payments (order_id, amount, payment_method, status, processed_at)
+                         VALUES (?, ?, ?, ?, ?)''',
+                      (order_id, amount, payment_method, 'completed', processed_at))
+            return c.lastrowid
+        
+        if GROUP_COMMIT:
+            payment_id = PAYMENT_WRITES.submit(insert)
+        else:
+            with DB_POOL.connect() as conn:
+                payment_id = insert(conn.cursor())
+                conn.commit()
         
         return jsonify({
             'status': 'ok', 
@@ -73,37 +91,179 @@ def process_payment():
     else:
         return jsonify({'status': 'error', 'message': 'Invalid payment amount'}), 400
 
+@app.route('/process_payments', methods=['POST'])
+def process_payments():
+    """Process many payments in one transaction; results keep the input order"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    payments = (request.json or {}).get('payments')
+    if not isinstance(payments, list) or not payments:
+        return jsonify({'status': 'error', 'message': 'Missing payments'}), 400
+    
+    processed_at = datetime.datetime.now().isoformat()
+    results = []
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        for data in payments:
+            order_id = data.get('order_id')
+            amount = data.get('total_price')
+            payment_method = data.get('payment_method', 'credit_card')
+        
+            if not order_id or not amount:
+                results.append({'status': 'error', 'message': 'Missing order_id or amount'})
+            elif amount <= 0:
+                results.append({'status': 'error', 'message': 'Invalid payment amount'})
+            else:
+                c.execute('''INSERT INTO payments (order_id, amount, payment_method, status, processed_at)
+                             VALUES (?, ?, ?, ?, ?)''',
+                          (order_id, amount, payment_method, 'completed', processed_at))
+                results.append({'status': 'ok', 'payment_id': c.lastrowid})
+        conn.commit()
+    
+    return jsonify({'status': 'ok', 'results': results})
+
+PAYMENTS_PAGE_SIZE = 100
+PAYMENTS_MAX_PAGE_SIZE = 1000
+PAYMENT_LOOKUP_MAX_IDS = 10000
+
+def payment_dict(p):
+    return {
+        'id': p[0],
+        'order_id': p[1],
+        'amount': p[2],
+        'payment_method': p[3],
+        'status': p[4],
+        'processed_at': p[5]
+    }
+
+def encode_payments_cursor(processed_at, payment_id):
+    return base64.urlsafe_b64encode(f'{processed_at}|{payment_id}'.encode()).decode()
+
+def decode_payments_cursor(cursor):
+    processed_at, payment_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+    return processed_at, int(payment_id)
+
+def query_payments(args):
+    """Run the GET /payments query for a mapping of query params; returns (rows, next_cursor)"""
+    filters = []
+    params = []
+    if args.get('order_id'):
+        filters.append('order_id = ?')
+        params.append(int(args['order_id']))
+    if args.get('since'):
+        filters.append('processed_at >= ?')
+        params.append(args['since'])
+    if args.get('until'):
+        filters.append('processed_at < ?')
+        params.append(args['until'])
+    
+    limit = min(max(int(args.get('limit', PAYMENTS_PAGE_SIZE)), 1), PAYMENTS_MAX_PAGE_SIZE)
+    if args.get('cursor'):
+        # Keyset: seguir justo después del último pago de la página anterior
+        filters.append('(processed_at, id) < (?, ?)')
+        params.extend(decode_payments_cursor(args['cursor']))
+    
+    where = f"WHERE {' AND '.join(filters)}" if filters else ''
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT id, order_id, amount, payment_method, status, processed_at
+                      FROM payments {where} ORDER BY processed_at DESC, id DESC LIMIT ?''', params + [limit + 1])
+        payments = c.fetchall()
+    
+    next_cursor = None
+    if len(payments) > limit:
+        last = payments[limit - 1]
+        next_cursor = encode_payments_cursor(last[5], last[0])
+    return [payment_dict(p) for p in payments[:limit]], next_cursor
+
 @app.route('/payments', methods=['GET', 'DELETE'])
 def manage_payments():
+    """GET lists payments newest first, one page at a time.
+
+    Query params: order_id, since, until (ISO timestamps on processed_at),
+    limit and cursor. The cursor for the next page is returned in the
+    X-Next-Cursor header; it is absent on the last page.
+    """
     auth = authenticate()
     if not auth:
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
     
     if request.method == 'GET':
-        conn = sqlite3.connect('payment.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM payments")
-        payments = c.fetchall()
-        conn.close()
+        try:
+            payments, next_cursor = query_payments(request.args)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'status': 'error', 'message': 'Invalid limit, cursor or order_id'}), 400
         
-        return jsonify([{
-            'id': p[0],
-            'order_id': p[1],
-            'amount': p[2],
-            'payment_method': p[3],
-            'status': p[4],
-            'processed_at': p[5]
-        } for p in payments])
+        response = jsonify(payments)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
     
     elif request.method == 'DELETE':
         payment_id = request.args.get('id')
-        conn = sqlite3.connect('payment.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM payments WHERE id=?", (payment_id,))
-        conn.commit()
-        conn.close()
+        with DB_POOL.connect() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM payments WHERE id=?", (payment_id,))
+            conn.commit()
         return jsonify({'status': 'ok', 'message': 'Payment record deleted'})
 
+@app.route('/payments/lookup', methods=['POST'])
+def lookup_payments():
+    """Payments of many orders in one query.
+
+    Body: {"order_ids": [1, 2, ...]}. Results keep the input order (without
+    repeats); an order without payments gets an empty list.
+    """
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    order_ids = (request.json or {}).get('order_ids')
+    if (not isinstance(order_ids, list) or not order_ids
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in order_ids)):
+        return jsonify({'status': 'error', 'message': 'order_ids must be a non-empty list of integers'}), 400
+    if len(order_ids) > PAYMENT_LOOKUP_MAX_IDS:
+        return jsonify({'status': 'error', 'message': f'Too many order_ids (max {PAYMENT_LOOKUP_MAX_IDS})'}), 400
+    
+    order_ids = list(dict.fromkeys(order_ids))
+    with DB_POOL.connect() as conn:
+        c = conn.cursor()
+        # Tabla temporal de la conexión: un solo JOIN por el índice de order_id, sin armar un IN
+        # con miles de parámetros. Escribir en temp no toma el lock de escritura de payment.db
+        c.execute('CREATE TEMP TABLE IF NOT EXISTS lookup_order_ids (order_id INTEGER PRIMARY KEY)')
+        c.executemany('INSERT OR IGNORE INTO lookup_order_ids (order_id) VALUES (?)', [(i,) for i in order_ids])
+        c.execute('''SELECT p.id, p.order_id, p.amount, p.payment_method, p.status, p.processed_at
+                     FROM lookup_order_ids l JOIN payments p ON p.order_id = l.order_id
+                     ORDER BY p.order_id, p.processed_at, p.id''')
+        rows = c.fetchall()
+        # El ROLLBACK vacía la tabla temporal para el próximo request que use esta conexión
+        conn.rollback()
+    
+    by_order = {order_id: [] for order_id in order_ids}
+    for p in rows:
+        by_order[p[1]].append(payment_dict(p))
+    return jsonify({
+        'status': 'ok',
+        'results': [{'order_id': order_id, 'payments': payments} for order_id, payments in by_order.items()],
+        'missing': [order_id for order_id, payments in by_order.items() if not payments]
+    })
+
+@app.route('/group_commit', methods=['GET'])
+def get_group_commit_stats():
+    """Batches and average batch size of the process_payment writer (all zero when GROUP_COMMIT is off)"""
+    auth = authenticate()
+    if not auth:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    return jsonify({'enabled': GROUP_COMMIT, **PAYMENT_WRITES.stats()})
+
+SNAPSHOTS = register_snapshot_routes(app, snapshot_databases, authenticate)
+
+register_pool_routes(app, DB_POOL, authenticate)
+
 if __name__ == '__main__':
     init_payment_db()
-    app.run(port=5003, debug=True)
\ No newline at end of file
+    # Se puede indicar otro puerto para levantar réplicas: python payment_service/payment.py 5013
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5003
+    app.run(port=port, debug=True)
\ No newline at end of file